@@ -0,0 +1,61 @@
+"""Time and size of .schem files at every gzip level, for each installed backend.
+
+Schematics are encoded from a kept BlockVolume, so only writing the NBT and compressing
+it is timed. Every output is decompressed and checked against the zlib level 9 NBT.
+
+Run from the repository root: python -m benchmarks.bench_compression
+"""
+import gzip
+import sys
+import time
+
+from hotloading.hotload_manager import generators_dict, initialize_generators
+from schematicGenerator import compression
+from schematicGenerator.encoders import BlockVolume, encode_sponge_v2
+from schematicGenerator.serialization import DEFAULT_VERSION
+
+CASES = (
+    ("CircleGenerator", {"radius": 128, "filled": True}),
+    ("SphereGenerator", {"radius": 64, "filled": False, "block": "minecraft:oak_stairs[half=top]"}),
+    ("SphereGenerator", {"radius": 128, "filled": True}),
+)
+LEVELS = (0, 1, 3, 6, 9)
+REPEAT = 3
+
+
+def installed_backends():
+    backends = {}
+    for name in ("zlib", "zlib-ng", "isal"):
+        loaded, module = compression._load_backend(name)
+        if loaded == name:
+            backends[name] = module
+    return backends
+
+
+def main():
+    initialize_generators(notify=False)
+    backends = installed_backends()
+    print(f"backends: {', '.join(backends)}")
+    for generator_name, args in CASES:
+        generator_class = generators_dict[generator_name]
+        volume = BlockVolume.from_schematic(generator_class.generate(**generator_class.validate_inputs(**args)))
+        expected = None
+        print(f"{generator_name} {args}: {volume.blocks.size} blocks")
+        for backend, module in backends.items():
+            compression.backend, compression._gzip = backend, module
+            for level in LEVELS:
+                best = float("inf")
+                for _ in range(REPEAT):
+                    start = time.perf_counter()
+                    data = encode_sponge_v2(volume, DEFAULT_VERSION, generator_name, level)
+                    best = min(best, time.perf_counter() - start)
+                nbt = gzip.decompress(data)
+                if expected is None:
+                    expected = gzip.decompress(encode_sponge_v2(volume, DEFAULT_VERSION, generator_name, 9))
+                if nbt != expected:
+                    sys.exit(f"{backend} level {level} doesn't decompress to the same NBT")
+                print(f"  {backend:<8} level {level}  {best * 1e3:8.1f} ms {len(data):>10} bytes")
+
+
+if __name__ == "__main__":
+    main()
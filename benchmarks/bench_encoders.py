@@ -0,0 +1,143 @@
+"""Round trip check and timings of the schematic encoders.
+
+Every format is decoded back and compared block for block with the volume it was
+encoded from. Timings compare encoding a kept volume with generating and serializing
+the .schem again, what any other format cost before.
+
+Run from the repository root: python -m benchmarks.bench_encoders
+"""
+import gzip
+import io
+import sys
+import time
+
+import numpy as np
+from nbtlib import File
+
+from hotloading.hotload_manager import generators_dict, initialize_generators
+from schematicGenerator.encoders import ENCODERS, LEGACY_IDS, BlockVolume
+from schematicGenerator.serialization import DEFAULT_VERSION, serialize_schematic
+
+CASES = (
+    ("CircleGenerator", {"radius": 128, "filled": True, "block": "minecraft:red_wool"}),
+    ("PolygonGenerator", {"sides": 7, "radius": 96, "filled": False}),
+    ("SphereGenerator", {"radius": 64, "filled": False, "block": "minecraft:oak_stairs[half=top]"}),
+    ("SphereGenerator", {"radius": 96, "filled": True}),
+)
+REPEAT = 3
+
+
+def best_of(func):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def load_nbt(data):
+    return File.parse(io.BytesIO(gzip.decompress(data)))
+
+
+def decode_varints(data, count):
+    data = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    values = (data[starts] & 0x7F).astype(np.uint32)
+    for extra in (1, 2):
+        longer = ends - starts >= extra
+        values[longer] |= (data[starts[longer] + extra] & 0x7F).astype(np.uint32) << (7 * extra)
+    assert len(values) == count
+    return values
+
+
+def sponge_blocks(tag, palette_tag, data_tag):
+    width, height, length = (int(tag[name]) & 0xFFFF for name in ("Width", "Height", "Length"))
+    palette = {int(index): block for block, index in palette_tag.items()}
+    indices = decode_varints(np.asarray(data_tag, dtype=np.uint8).tobytes(), width * height * length)
+    return np.array([palette[i] for i in range(len(palette))], dtype=object)[indices].reshape(height, length, width)
+
+
+def decode_schem(data):
+    tag = load_nbt(data)
+    return sponge_blocks(tag, tag["Palette"], tag["BlockData"])
+
+
+def decode_schem_v3(data):
+    tag = load_nbt(data)["Schematic"]
+    return sponge_blocks(tag, tag["Blocks"]["Palette"], tag["Blocks"]["Data"])
+
+
+def decode_litematic(data):
+    region = next(iter(load_nbt(data)["Regions"].values()))
+    width, height, length = (int(region["Size"][axis]) for axis in "xyz")
+    palette = []
+    for entry in region["BlockStatePalette"]:
+        properties = ",".join(f"{key}={value}" for key, value in entry.get("Properties", {}).items())
+        palette.append(f"{entry['Name']}[{properties}]" if properties else str(entry["Name"]))
+    bits = max(2, (len(palette) - 1).bit_length())
+    count = width * height * length
+    stream = np.unpackbits(np.asarray(region["BlockStates"], dtype="<i8").view(np.uint8), bitorder="little")
+    indices = stream[:count * bits].reshape(count, bits).astype(np.int64) @ (1 << np.arange(bits))
+    return np.array(palette, dtype=object)[indices].reshape(height, length, width)
+
+
+def decode_legacy(data):
+    tag = load_nbt(data)
+    width, height, length = (int(tag[name]) for name in ("Width", "Height", "Length"))
+    names = np.empty(256 * 16, dtype=object)
+    for name, (block_id, data_value) in LEGACY_IDS.items():
+        names[block_id * 16 + data_value] = name
+    ids = np.asarray(tag["Blocks"], dtype=np.uint8).astype(np.int64)
+    data_values = np.asarray(tag["Data"], dtype=np.uint8)
+    return names[ids * 16 + data_values].reshape(height, length, width)
+
+
+def decode_rle(data):
+    volume = BlockVolume.from_rle(data)
+    return np.array(volume.palette, dtype=object)[volume.blocks]
+
+
+DECODERS = {
+    "schem": decode_schem,
+    "schem-v3": decode_schem_v3,
+    "litematic": decode_litematic,
+    "schematic": decode_legacy,
+    "rle": decode_rle,
+}
+
+
+def main():
+    initialize_generators(notify=False)
+    for generator_name, args in CASES:
+        generator_class = generators_dict[generator_name]
+        args = generator_class.validate_inputs(**args)
+        regenerate_time, _ = best_of(lambda: serialize_schematic(generator_class.generate(**args)))
+        volume = BlockVolume.from_schematic(generator_class.generate(**args))
+        expected = np.array(volume.palette, dtype=object)[volume.blocks]
+        rle = volume.to_rle()
+        decode_time, _ = best_of(lambda: BlockVolume.from_rle(rle))
+        print(
+            f"{generator_name} {args}: {volume.block_count()} blocks, regenerate + schem "
+            f"{regenerate_time * 1e3:.1f} ms, rle volume {len(rle)} bytes decoded in {decode_time * 1e3:.1f} ms"
+        )
+        for name, encoder in ENCODERS.items():
+            if name == "schematic" and any(block.partition("[")[0] not in LEGACY_IDS for block in volume.palette):
+                print(f"  {name:<10} skipped, no legacy id")
+                continue
+            encode_time, data = best_of(lambda: encoder.encode(volume, DEFAULT_VERSION, generator_name))
+            decoded = DECODERS[name](data)
+            if name == "schematic":
+                # legacy ids drop the properties
+                names = np.array([block.partition("[")[0] for block in volume.palette], dtype=object)
+                matches = np.array_equal(decoded, names[volume.blocks])
+            else:
+                matches = np.array_equal(decoded, expected)
+            if not matches:
+                sys.exit(f"{name} of {generator_name} {args} doesn't decode to its volume")
+            print(f"  {name:<10} {encode_time * 1e3:8.1f} ms {len(data):>10} bytes, decodes to the same blocks")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""Throughput, memory and output size of every generator, plus an in-process HTTP load test.
+
+Generators are discovered with the hot-load loader, like the server does, and run over
+inputs swept from their IntInput ranges. For every input set the benchmark records the
+generate and serialize times, the peak traced memory, the output size and block count,
+and the cost of validating the inputs. The Sanic app is then driven in-process through
+its ASGI interface to measure request latency and throughput.
+
+Results are written as JSON with --output. With --baseline they are compared to an
+earlier run, every metric worse than the baseline by more than --tolerance is reported
+as a regression and the exit status is 1. Timings are compared on their fastest run,
+which is the least noisy.
+
+Run from the repository root:
+    python -m benchmarks.bench_generators --output results.json
+    python -m benchmarks.bench_generators --baseline baseline.json
+    python -m benchmarks.bench_generators --baseline baseline.json --update-baseline
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+
+from schematicGenerator.inputs import IntInput, BoolInput, BlockInput, StringInput
+from schematicGenerator.serialization import serialize_schematic, block_count
+from hotloading.hotload_manager import generators_dict, initialize_generators
+from server import settings
+
+# a case is timed until it ran for MIN_TIME seconds, within [MIN_REPEATS, MAX_REPEATS] runs
+MIN_TIME = 0.2
+MIN_REPEATS = 3
+MAX_REPEATS = 20
+VALIDATION_CALLS = 20_000
+# absolute differences below these are noise, whatever the tolerance says
+NOISE_FLOORS = {"_s": 0.001, "_us": 1.0, "_ms": 1.0, "_bytes": 1024, "_rps": 0}
+
+
+def int_points(input_obj, quick):
+    low = input_obj.min_value if input_obj.min_value is not None else 1
+    high = input_obj.max_value if input_obj.max_value is not None else low + 63
+    points = [low, high] if quick else [low, (low + high) // 2, high]
+    return sorted(set(points))
+
+
+def sample_value(input_obj):
+    """Return a representative value of a non integer input, or None if there is none."""
+    if input_obj.default is not None:
+        return input_obj.default
+    if isinstance(input_obj, BoolInput):
+        return True
+    if isinstance(input_obj, BlockInput):
+        return "minecraft:stone"
+    if isinstance(input_obj, StringInput):
+        if input_obj.allowed_values:
+            return input_obj.allowed_values[0]
+        return "a" * (input_obj.min_length or 1)
+    return None
+
+
+def sweep_inputs(generator_class, quick=False):
+    """Return the argument sets of a generator: every combination of its IntInput points."""
+    fixed = {}
+    swept = {}
+    for name, input_obj, _, _ in generator_class.generate.input_plan:
+        if isinstance(input_obj, IntInput):
+            swept[name] = int_points(input_obj, quick)
+        elif input_obj is not None:
+            value = sample_value(input_obj)
+            if value is None:
+                return []
+            fixed[name] = value
+    return [
+        {**fixed, **dict(zip(swept, values))}
+        for values in itertools.product(*swept.values())
+    ]
+
+
+def summarize(durations):
+    return {"min": min(durations), "median": statistics.median(durations), "runs": len(durations)}
+
+
+def bench_case(generator_class, args):
+    generate_times = []
+    serialize_times = []
+    started = time.perf_counter()
+    while len(generate_times) < MAX_REPEATS and (
+        len(generate_times) < MIN_REPEATS or time.perf_counter() - started < MIN_TIME
+    ):
+        start = time.perf_counter()
+        schem = generator_class.generate(**args)
+        generated = time.perf_counter()
+        serialize_schematic(schem)
+        generate_times.append(generated - start)
+        serialize_times.append(time.perf_counter() - generated)
+
+    # numpy reports its allocations to tracemalloc
+    tracemalloc.start()
+    schem = generator_class.generate(**args)
+    data = serialize_schematic(schem)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    validate_time = timeit.timeit(lambda: generator_class.validate_inputs(**args), number=VALIDATION_CALLS)
+    return {
+        "args": args,
+        "generate_s": summarize(generate_times),
+        "serialize_s": summarize(serialize_times),
+        "peak_bytes": peak,
+        "size_bytes": len(data),
+        "blocks": block_count(schem),
+        "validate_us": validate_time / VALIDATION_CALLS * 1e6,
+    }
+
+
+def bench_generators(names, quick):
+    results = {}
+    for name in names:
+        generator_class = generators_dict[name]
+        cases = sweep_inputs(generator_class, quick)
+        if not cases:
+            print(f"{name}: no representative inputs, skipped")
+            continue
+        results[name] = []
+        for args in cases:
+            # generators print while they run
+            with contextlib.redirect_stdout(io.StringIO()):
+                case = bench_case(generator_class, args)
+            results[name].append(case)
+            print(
+                f"{name} {json.dumps(args)}: generate {case['generate_s']['min'] * 1e3:.2f} ms, "
+                f"serialize {case['serialize_s']['min'] * 1e3:.2f} ms, "
+                f"peak {case['peak_bytes'] / 2**20:.1f} MiB, {case['size_bytes']} bytes, "
+                f"{case['blocks']} blocks, validate {case['validate_us']:.2f} us"
+            )
+    return results
+
+
+async def asgi_lifespan(app, event):
+    """Send a lifespan event to an ASGI app and wait until it is handled."""
+    received = asyncio.Queue()
+    sent = asyncio.Queue()
+    await received.put({"type": f"lifespan.{event}"})
+
+    async def send(message):
+        await sent.put(message)
+
+    task = asyncio.ensure_future(app({"type": "lifespan", "asgi": {"version": "3.0"}}, received.get, send))
+    message = await sent.get()
+    if message["type"] != f"lifespan.{event}.complete":
+        raise RuntimeError(f"Lifespan {event} failed: {message}")
+    task.cancel()
+
+
+async def asgi_request(app, method, path, body=b""):
+    """Run one request through an ASGI app, return its status and response size."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench"), (b"content-type", b"application/json")],
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+    }
+    body_messages = [{"type": "http.request", "body": body, "more_body": False}]
+    finished = asyncio.Event()
+    result = {"status": None, "size": 0}
+
+    async def receive():
+        if body_messages:
+            return body_messages.pop()
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result["status"] = message["status"]
+        elif message["type"] == "http.response.body":
+            result["size"] += len(message.get("body", b""))
+            if not message.get("more_body"):
+                finished.set()
+
+    await app(scope, receive, send)
+    return result
+
+
+async def load_test(app, requests, concurrency):
+    """Run (method, path, body) requests with a fixed concurrency, return latency and throughput."""
+    latencies = []
+    statuses = {}
+    requests = iter(requests)
+
+    async def client():
+        for method, path, body in requests:
+            start = time.perf_counter()
+            result = await asgi_request(app, method, path, body)
+            latencies.append(time.perf_counter() - start)
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "statuses": {str(status): count for status, count in statuses.items()},
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_ms": latencies[len(latencies) // 2] * 1e3,
+        "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1e3,
+    }
+
+
+def route_name(generator_name):
+    """CircleGenerator -> circle-generator, the inverse of routes.generator_class_name."""
+    return re.sub(r"(?<!^)(?=[A-Z])", "-", generator_name).lower()
+
+
+async def bench_http(generator_name, requests, concurrency):
+    # imported here, main attaches the routes and listeners to the app
+    from main import app
+
+    # the repository's listeners still take the loop argument Sanic deprecated
+    app.config.DEPRECATION_FILTER = "ignore"
+    logging.getLogger("sanic.root").setLevel(logging.WARNING)
+
+    generator_class = generators_dict[generator_name]
+    path = "/generate/" + route_name(generator_name)
+    # the uncached scenario walks the whole range of the first IntInput, each value once
+    base = sweep_inputs(generator_class, quick=True)[0]
+    name, input_obj = next(
+        (name, input_obj) for name, input_obj, _, _ in generator_class.generate.input_plan
+        if isinstance(input_obj, IntInput)
+    )
+    low, high = int_points(input_obj, quick=True)
+    distinct = [json.dumps({**base, name: value}).encode() for value in range(low, high + 1)]
+
+    scenarios = {
+        "catalog": [("GET", "/generators", b"")] * requests,
+        "generate_cached": [("POST", path, distinct[0])] * requests,
+        "generate_uncached": [("POST", path, body) for body in distinct[1:requests + 1]],
+    }
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asgi_lifespan(app, "startup")
+    try:
+        # fills the result cache for generate_cached and spawns the pool workers
+        await asgi_request(app, "POST", path, distinct[0])
+        for name, scenario in scenarios.items():
+            with contextlib.redirect_stdout(io.StringIO()):
+                results[name] = await load_test(app, scenario, concurrency)
+            print(
+                f"http {name}: {results[name]['throughput_rps']:.0f} req/s, "
+                f"p50 {results[name]['p50_ms']:.2f} ms, p99 {results[name]['p99_ms']:.2f} ms, "
+                f"statuses {results[name]['statuses']}"
+            )
+    finally:
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asgi_lifespan(app, "shutdown")
+    return results
+
+
+def flatten(results):
+    """Return {metric path: (value, higher is better)} of the comparable metrics of a run."""
+    metrics = {}
+    for name, cases in results.get("generators", {}).items():
+        for case in cases:
+            prefix = f"generators/{name}/{json.dumps(case['args'], sort_keys=True)}"
+            metrics[f"{prefix}/generate_s"] = (case["generate_s"]["min"], False)
+            metrics[f"{prefix}/serialize_s"] = (case["serialize_s"]["min"], False)
+            metrics[f"{prefix}/peak_bytes"] = (case["peak_bytes"], False)
+            metrics[f"{prefix}/size_bytes"] = (case["size_bytes"], False)
+            metrics[f"{prefix}/validate_us"] = (case["validate_us"], False)
+    for name, scenario in results.get("http", {}).items():
+        metrics[f"http/{name}/p50_ms"] = (scenario["p50_ms"], False)
+        metrics[f"http/{name}/p99_ms"] = (scenario["p99_ms"], False)
+        metrics[f"http/{name}/throughput_rps"] = (scenario["throughput_rps"], True)
+    return metrics
+
+
+def compare(results, baseline, tolerance):
+    """Return the (metric, baseline value, new value) of every regression."""
+    regressions = []
+    previous = flatten(baseline)
+    for metric, (value, higher_is_better) in flatten(results).items():
+        if metric not in previous:
+            continue
+        base = previous[metric][0]
+        floor = next(floor for suffix, floor in NOISE_FLOORS.items() if metric.endswith(suffix))
+        worse = base - value if higher_is_better else value - base
+        if worse > max(abs(base) * tolerance, floor):
+            regressions.append((metric, base, value))
+    return regressions
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "created": time.time(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--generators", nargs="*", help="generator class names, all by default")
+    parser.add_argument("--quick", action="store_true", help="only sweep the IntInput bounds")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results to this JSON file")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the baseline with the results")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown, 0.2 by default")
+    parser.add_argument("--no-http", action="store_true", help="skip the HTTP load test")
+    parser.add_argument("--http-generator", default="CircleGenerator", help="generator used by the HTTP load test")
+    parser.add_argument("--requests", type=int, default=100, help="requests per HTTP scenario")
+    parser.add_argument(
+        "--concurrency", type=int, default=settings.GENERATE_QUEUE_SIZE,
+        help="concurrent HTTP clients, GENERATE_QUEUE_SIZE by default so generations aren't rejected",
+    )
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        initialize_generators(notify=False)
+    names = args.generators or sorted(generators_dict)
+
+    results = {"environment": environment(), "generators": bench_generators(names, args.quick)}
+    if not args.no_http:
+        results["http"] = asyncio.run(bench_http(args.http_generator, args.requests, args.concurrency))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    status = 0
+    if args.baseline and os.path.exists(args.baseline) and not args.update_baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for metric, base, value in regressions:
+            print(f"REGRESSION {metric}: {base:.6g} -> {value:.6g}")
+        print(f"{len(regressions)} regressions against {args.baseline}")
+        status = 1 if regressions else 0
+    elif args.baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+    sys.exit(status)
+
+
+if __name__ == "__main__":
+    main()
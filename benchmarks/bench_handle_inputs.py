@@ -0,0 +1,53 @@
+"""Per-call overhead of generate's input validation.
+
+Compares the precompiled validation plan with the previous implementation, which
+introspected generate's signature on every call.
+
+Run from the repository root: python -m benchmarks.bench_handle_inputs
+"""
+import timeit
+from inspect import signature
+
+from schematicGenerator.base_generator import validate_arguments
+from schematicGenerator.inputs import BaseInput
+from hotloading.hotload_manager import generators_dict, initialize_generators
+
+CALLS = 100_000
+
+
+def legacy_validate_arguments(func, kwargs):
+    """handle_inputs as it was before the validation plan."""
+    kwargs = dict(kwargs)
+    for name, param in signature(func).parameters.items():
+        if name == "cls":
+            continue
+        if name in kwargs and kwargs[name] is not None:
+            input_obj = param.default
+            if not isinstance(input_obj, BaseInput):
+                raise TypeError(f"Invalid input type for {name}")
+            kwargs[name] = input_obj.validate(kwargs[name])
+        elif param.default is not None and isinstance(param.default, BaseInput):
+            if param.default.default is not None:
+                kwargs[name] = param.default.default
+            else:
+                raise TypeError(f"Missing required argument: {name}")
+        else:
+            raise TypeError(f"Missing required argument: {name}")
+    return kwargs
+
+
+def main():
+    initialize_generators(notify=False)
+    generator_class = generators_dict["PolygonGenerator"]
+    func = generator_class.generate.__wrapped__.__func__
+    plan = generator_class.generate.input_plan
+    args = {"sides": 6, "radius": 64}
+
+    legacy = timeit.timeit(lambda: legacy_validate_arguments(func, args), number=CALLS)
+    planned = timeit.timeit(lambda: validate_arguments(plan, args), number=CALLS)
+    print(f"signature per call: {legacy / CALLS * 1e6:.2f} us/call")
+    print(f"validation plan:    {planned / CALLS * 1e6:.2f} us/call ({legacy / planned:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Block for block check and timings of the shape generators against their NumPy versions.
+
+The generators draw their shapes with schematicGenerator.raster, row by row, the
+previous versions evaluated the distance of every cell of the (2r+1)² square. Every input of Circle, Square, Polygon and
+Sphere is compared, the script exits with an error on the first difference.
+
+Run from the repository root: python -m benchmarks.bench_raster [--quick]
+"""
+import argparse
+import math
+import sys
+import time
+
+import numpy as np
+
+from schematicGenerator.volume import volume_to_schematic
+from hotloading.hotload_manager import generators_dict, initialize_generators
+
+
+def centered_grid(radius):
+    """Return the x and z coordinate grids of the square [-radius, radius]², indexed [x, z]."""
+    coords = np.arange(-radius, radius + 1)
+    return np.meshgrid(coords, coords, indexing="ij")
+
+
+def legacy_circle(radius, filled):
+    x, z = centered_grid(radius)
+    distance = np.sqrt(x**2 + z**2)
+    if filled:
+        return distance <= radius
+    return (radius - 1 <= distance) & (distance <= radius + 1)
+
+
+def legacy_square(side_length, filled):
+    x, z = centered_grid(side_length)
+    if filled:
+        return np.ones(x.shape, dtype=bool)
+    return (
+        (side_length - 1 <= x) & (x <= side_length + 1)
+        & (side_length - 1 <= z) & (z <= side_length + 1)
+    )
+
+
+def legacy_polygon(sides, radius, filled):
+    exact_distance_to_edge = sys.modules[generators_dict["PolygonGenerator"].__module__].exact_distance_to_edge
+    angle_step = 2 * math.pi / sides
+    x, z = centered_grid(radius)
+    distance = np.sqrt(x**2 + z**2)
+    angle = np.arctan2(z, x)
+    nearest_vertex = np.round(angle / angle_step)
+    distance_to_edge = distance * np.cos(angle - nearest_vertex * angle_step)
+    near_edge = np.zeros(x.shape, dtype=bool)
+    for edge in (radius - 1, radius, radius + 1):
+        near_edge |= np.abs(distance_to_edge - edge) < 1e-9
+    for i, j in zip(*np.nonzero(near_edge)):
+        distance_to_edge[i, j] = exact_distance_to_edge(int(x[i, j]), int(z[i, j]), angle_step)
+    if filled:
+        return distance_to_edge <= radius
+    return (radius - 1 <= distance_to_edge) & (distance_to_edge <= radius + 1)
+
+
+def legacy_sphere_layers(radius, filled):
+    x, z = centered_grid(radius)
+    horizontal = x**2 + z**2
+    for y in range(-radius, radius + 1):
+        distance = np.sqrt(horizontal + y**2)
+        if filled:
+            yield distance <= radius
+        else:
+            yield (radius - 1 <= distance) & (distance <= radius + 1)
+
+
+def mask_of(schem):
+    """Boolean [x, z] mask of a one layer ArraySchematic."""
+    return (schem.blocks[0] != 0).T
+
+
+def cases(quick):
+    radii = range(1, 129, 9 if quick else 1)
+    for filled in (True, False):
+        for radius in radii:
+            yield "CircleGenerator", {"radius": radius, "filled": filled}, lambda r=radius, f=filled: legacy_circle(r, f)
+            yield "SquareGenerator", {"side_length": radius, "filled": filled}, lambda r=radius, f=filled: legacy_square(r, f)
+            for sides in range(3, 13):
+                yield (
+                    "PolygonGenerator", {"sides": sides, "radius": radius, "filled": filled},
+                    lambda s=sides, r=radius, f=filled: legacy_polygon(s, r, f),
+                )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="check every 9th radius only")
+    options = parser.parse_args()
+    initialize_generators(notify=False)
+
+    timings = {}
+    checked = 0
+    for name, args, legacy in cases(options.quick):
+        generator_class = generators_dict[name]
+        start = time.perf_counter()
+        expected = legacy()
+        # the previous generators turned their mask into a schematic too
+        volume_to_schematic(expected[:, np.newaxis, :], ["minecraft:white_concrete"])
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        schem = generator_class.generate(**args)
+        new_time = time.perf_counter() - start
+        if not np.array_equal(mask_of(schem), expected):
+            sys.exit(f"{name} {args} differs from the NumPy version")
+        total = timings.setdefault(name, [0.0, 0.0])
+        total[0] += legacy_time
+        total[1] += new_time
+        checked += 1
+
+    sphere = generators_dict["SphereGenerator"]
+    total = timings.setdefault("SphereGenerator", [0.0, 0.0])
+    for filled in (True, False):
+        for radius in range(1, 129, 9 if options.quick else 3):
+            start = time.perf_counter()
+            expected = list(legacy_sphere_layers(radius, filled))
+            total[0] += time.perf_counter() - start
+            start = time.perf_counter()
+            layers = [layer[:, 0, :] for layer in sphere.layers(radius, filled)]
+            total[1] += time.perf_counter() - start
+            if not all(np.array_equal(a, b) for a, b in zip(layers, expected)) or len(layers) != len(expected):
+                sys.exit(f"SphereGenerator radius={radius} filled={filled} differs from the NumPy version")
+            checked += 1
+
+    print(f"{checked} inputs identical block for block")
+    for name, (legacy_time, new_time) in timings.items():
+        print(f"{name:<18} numpy {legacy_time * 1e3:9.1f} ms  raster {new_time * 1e3:9.1f} ms  ({legacy_time / new_time:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""Cold start of the server with and without the generator index.
+
+The repository is copied to a temporary directory with EXTRA copies of every generator
+added, a library the size of a community one. Each run imports main in a fresh
+interpreter, the time it takes is the time before the server can start listening. Lazy
+runs list the generators from the index and import none, their catalog is checked
+against the one of the eager runs.
+
+Run from the repository root: python -m benchmarks.bench_startup
+"""
+import glob
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+EXTRA = 50
+REPEAT = 5
+PROBE = """
+import json, resource, time
+start = time.perf_counter()
+import main
+seconds = time.perf_counter() - start
+from hotloading.hotload_manager import generators_dict
+from server.catalog import catalog
+print(json.dumps({
+    "seconds": seconds,
+    "rss": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    "imported": len(generators_dict),
+    "catalog": catalog.snapshot.body.decode(),
+}))
+"""
+
+
+def make_tree(root):
+    shutil.copytree(
+        ".", root, dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns(".git", "__pycache__", "benchmarks", "old", "generator_index.json"),
+    )
+    generators_dir = os.path.join(root, "schematicGenerator", "generators")
+    for path in sorted(glob.glob(os.path.join(generators_dir, "*.py"))):
+        name = os.path.basename(path)[:-3]
+        with open(path, encoding="utf-8") as f:
+            source = f.read()
+        for i in range(EXTRA):
+            copy_name = f"{name}{i:03d}"
+            with open(os.path.join(generators_dir, copy_name + ".py"), "w", encoding="utf-8") as f:
+                f.write(re.sub(rf"\b{name}\b", copy_name, source))
+    return len(glob.glob(os.path.join(generators_dir, "*.py")))
+
+
+def probe(root, lazy):
+    env = dict(os.environ, GENERATORS_LAZY="1" if lazy else "0")
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=root, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    with tempfile.TemporaryDirectory() as root:
+        modules = make_tree(root)
+        print(f"{modules} generator modules")
+        # the first eager run writes the index the lazy runs read
+        expected = probe(root, lazy=False)["catalog"]
+        for lazy in (False, True):
+            runs = [probe(root, lazy) for _ in range(REPEAT)]
+            if any(run["catalog"] != expected for run in runs):
+                sys.exit("the catalog listed from the index differs from the imported generators'")
+            seconds = statistics.median(run["seconds"] for run in runs)
+            rss = statistics.median(run["rss"] for run in runs)
+            print(
+                f"  {'lazy' if lazy else 'eager':<5} import main {seconds * 1e3:8.1f} ms, "
+                f"max rss {rss / 1024:6.1f} MB, {runs[0]['imported']} generators imported"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Validation of large nested payloads, compiled validators against the previous methods.
+
+The previous implementation recursed through validate methods for every element and
+looked allowed values up in lists.
+
+Run from the repository root: python -m benchmarks.bench_validators
+"""
+import time
+
+from schematicGenerator.inputs import ArrayInput, DictInput, IntInput, StringInput, BlockInput
+
+ELEMENTS = 100_000
+REPEAT = 5
+
+
+def legacy_validate(input_obj, value):
+    """The validate methods as they were before compiled validators."""
+    if isinstance(input_obj, IntInput):
+        if not isinstance(value, int):
+            raise ValueError(f"Expected an integer, got {type(value)}")
+        if input_obj.min_value is not None and value < input_obj.min_value:
+            raise ValueError(f"Value should be >= {input_obj.min_value}")
+        if input_obj.max_value is not None and value > input_obj.max_value:
+            raise ValueError(f"Value should be <= {input_obj.max_value}")
+        return value
+    if isinstance(input_obj, BlockInput):
+        if not isinstance(value, str):
+            raise ValueError(f"Expected a block string, got {type(value).__name__}")
+        return value
+    if isinstance(input_obj, StringInput):
+        if not isinstance(value, str):
+            raise ValueError(f"Expected a string, got {type(value).__name__}")
+        if input_obj.allowed_values is not None and value not in input_obj.allowed_values:
+            raise ValueError(f"Value '{value}' is not allowed")
+        return value
+    if isinstance(input_obj, DictInput):
+        if not isinstance(value, dict):
+            raise ValueError(f"Expected a dictionary, got {type(value).__name__}")
+        validated = {}
+        for key, input_type in input_obj.input_dict.items():
+            if key not in value:
+                if input_type.default is not None:
+                    validated[key] = input_type.default
+                else:
+                    raise ValueError(f"Missing required key: {key}")
+            else:
+                validated[key] = legacy_validate(input_type, value[key])
+        return validated
+    if isinstance(input_obj, ArrayInput):
+        if not isinstance(value, list):
+            raise ValueError(f"Expected a list, got {type(value).__name__}")
+        return [legacy_validate(input_obj.element_type, element) for element in value]
+    raise TypeError(type(input_obj).__name__)
+
+
+def best_of(func, payload):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        func(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def cases():
+    coordinate = IntInput(min_value=-30_000_000, max_value=30_000_000)
+    blocks = [f"minecraft:block_{i}" for i in range(1000)]
+    yield (
+        "points {x, y, z}",
+        ArrayInput(DictInput({"x": coordinate, "y": IntInput(min_value=-64, max_value=320), "z": coordinate})),
+        [{"x": i, "y": i % 320, "z": -i} for i in range(ELEMENTS)],
+    )
+    yield (
+        "ints",
+        ArrayInput(IntInput(min_value=0)),
+        list(range(ELEMENTS)),
+    )
+    yield (
+        "blocks, 1000 allowed",
+        ArrayInput(StringInput(allowed_values=blocks)),
+        [blocks[i % len(blocks)] for i in range(ELEMENTS)],
+    )
+    yield (
+        "nested rows",
+        ArrayInput(ArrayInput(IntInput(min_value=0, max_value=255))),
+        [list(range(100)) for _ in range(ELEMENTS // 100)],
+    )
+
+
+def main():
+    print(f"{ELEMENTS} elements, best of {REPEAT}")
+    for name, input_obj, payload in cases():
+        assert input_obj.validate(payload) == legacy_validate(input_obj, payload)
+        legacy = best_of(lambda value: legacy_validate(input_obj, value), payload)
+        compiled = best_of(input_obj.validate, payload)
+        print(f"{name:<22} legacy {legacy * 1e3:8.1f} ms  compiled {compiled * 1e3:8.1f} ms  ({legacy / compiled:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,22 @@
-from importlib import import_module, reload
+from importlib.util import spec_from_file_location, module_from_spec
+from multiprocessing import Value
+import asyncio
 import sys
+import threading
 import inspect
 import os
 import json
 import glob
+import hashlib
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 
+from schematicGenerator import base_generator, inputs
 from schematicGenerator.base_generator import BaseGenerator
-from server.websocket_routes import queue
+from server import settings, websocket_routes
+from server.websocket_routes import broadcast, hub
 
 
-MAIN_PID = os.getpid()
-
 known_generator_files = set()
 generators_dict = {}
 processed_files = set()
@@ -20,134 +24,383 @@ LOAD = "load"
 UNLOAD = "unload"
 RELOAD = "reload"
 DELETE = "delete"
-MAIN_PID = os.getpid()
+# seconds without file events before a burst of events is processed
+RELOAD_DEBOUNCE = 0.3
 
 generators_dict = {} 
+# generator class name -> name of the module it was loaded from
+generator_modules = {}
+# module name -> sha256 of the source the module was last loaded from
+module_hashes = {}
+# module name -> source the module was last loaded from, sent to the pool processes with its tasks
+module_sources = {}
+# callables notified with (action_type, generator_names) whenever generators change
+change_listeners = []
+# number of reloads published by the watcher, identical in every process serving requests
+generation = 0
+# generation counter shared by Sanic's main process with its workers
+shared_generation = None
+# module name -> {"hash": source hash, "generators": {class name: to_dict()}}, persisted in GENERATOR_INDEX
+generator_index = {}
+# whether generator_index changed since it was last written
+index_dirty = False
+# bumped when the layout of the index file changes
+INDEX_VERSION = 1
+# serializes the imports of generators only known from the index
+import_lock = threading.Lock()
+
+
+class GeneratorLoadError(Exception):
+    """Raised when the module of a generator registered from the index fails to import."""
+
 
 def get_module_name(file_path):
     """Return the module name based on the file path."""
     return "schematicGenerator.generators." + os.path.basename(file_path)[:-3]
 
+def get_module_path(module_name):
+    """Return the file path of a generator module based on its name."""
+    return "./schematicGenerator/generators/" + module_name.rsplit(".", 1)[-1] + ".py"
+
+def file_hash(file_path):
+    """Return the sha256 hex digest of a file's content."""
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
 def is_valid_generator(obj):
     """Check if the object is a valid generator."""
     return inspect.isclass(obj) and issubclass(obj, BaseGenerator) and obj != BaseGenerator
 
-def load_module_members(module, loaded_generators=None):
-    """Load module members into the generators dictionary."""
-    if loaded_generators is None:
-        loaded_generators = []
+def module_generators(module_name):
+    """Return the names of the generators loaded from a module."""
+    return [name for name, module in generator_modules.items() if module == module_name]
+
+def add_change_listener(listener):
+    """Register a callable notified with (action_type, generator_names) when generators change."""
+    change_listeners.append(listener)
+
+def notify_change_listeners(action_type, generator_names):
+    """Notify every change listener, a failing listener doesn't stop the others."""
+    for listener in change_listeners:
+        try:
+            listener(action_type, generator_names)
+        except Exception as e:
+            print(f"Error in change listener {listener}: {e}")
 
-    for name, obj in inspect.getmembers(module):
-        if is_valid_generator(obj):
-            generators_dict[obj.__name__] = obj
-            loaded_generators.append(obj.__name__)
+def generators_version():
+    """Return the generation and a digest of the generator sources served by this process."""
+    sources = "".join(f"{module}:{source_hash};" for module, source_hash in sorted(module_hashes.items()))
+    return f"{generation}-{hashlib.sha256(sources.encode()).hexdigest()[:16]}"
 
-    return loaded_generators
+def framework_hash():
+    """Return a digest of the sources producing the catalog entries, an index written by others is stale."""
+    digest = hashlib.sha256()
+    for module in (base_generator, inputs):
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
 
-def unload_module_members(module):
-    """Unload module members from the generators dictionary."""
-    for name, obj in inspect.getmembers(module):
-        if is_valid_generator(obj) and obj.__name__ in generators_dict:
-            del generators_dict[obj.__name__]
+def read_index():
+    """Return the modules of the generator index, empty when it is missing, unreadable or stale."""
+    try:
+        with open(settings.GENERATOR_INDEX, encoding="utf-8") as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(index, dict) or index.get("version") != INDEX_VERSION or index.get("framework") != framework_hash():
+        return {}
+    return index.get("modules") or {}
+
+def save_index():
+    """Write the generator index if it changed, atomically since every process may write it."""
+    global index_dirty
+    if not index_dirty:
+        return
+    index = {"version": INDEX_VERSION, "framework": framework_hash(), "modules": generator_index}
+    temp_path = f"{settings.GENERATOR_INDEX}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(temp_path, settings.GENERATOR_INDEX)
+        index_dirty = False
+    except OSError as e:
+        print(f"Couldn't write the generator index {settings.GENERATOR_INDEX}: {e}")
+
+def update_index(module_name, entry):
+    """Set the index entry of a module, None removes it."""
+    global index_dirty
+    if generator_index.get(module_name) != entry:
+        if entry is None:
+            generator_index.pop(module_name, None)
+        else:
+            generator_index[module_name] = entry
+        index_dirty = True
+
+def generator_catalog():
+    """Return the to_dict() of every generator, read from the index for those not imported yet."""
+    catalog = {}
+    for name, module_name in list(generator_modules.items()):
+        generator_class = generators_dict.get(name)
+        if generator_class is not None:
+            catalog[name] = generator_class.to_dict()
+        else:
+            catalog[name] = generator_index[module_name]["generators"][name]
+    return catalog
+
+def get_generator(name):
+    """Return a generator class, importing its module first if it was only registered from the index.
+
+    Returns None for unknown generators, raises GeneratorLoadError when the import fails.
+    """
+    generator_class = generators_dict.get(name)
+    if generator_class is not None or name not in generator_modules:
+        return generator_class
+    with import_lock:
+        module_name = generator_modules.get(name)
+        if name not in generators_dict and module_name is not None:
+            try:
+                load_generator(get_module_path(module_name), notify=False)
+            except Exception as e:
+                raise GeneratorLoadError(f"Generator {name} failed to load: {e}") from e
+    return generators_dict.get(name)
+
+async def resolve_generator(name):
+    """get_generator for the event loop, a module still to import is imported in a thread."""
+    generator_class = generators_dict.get(name)
+    if generator_class is not None or name not in generator_modules:
+        return generator_class
+    return await asyncio.to_thread(get_generator, name)
+
+def import_generators():
+    """Import every generator registered from the index."""
+    for name in list(generator_modules):
+        try:
+            get_generator(name)
+        except GeneratorLoadError:
+            # already logged by load_generator, the next request tries again
+            continue
+
+async def warm_generators(app, loop):
+    """Import the generators registered from the index in the background, see GENERATORS_WARM."""
+    if settings.GENERATORS_WARM and len(generators_dict) < len(generator_modules):
+        loop.run_in_executor(None, import_generators)
+
+def websocket_payload(action_type):
+    """Return the websocket payload announcing a change of generators."""
+    return json.dumps({
+        "type": action_type,
+        "generators": list(generator_modules),
+        "version": generators_version(),
+    })
 
 def send_websocket_payload(action_type):
     """Send payload via websocket."""
-    websocket_payload = {
-        "type": action_type,
-        "generators": list(generators_dict.keys())
+    broadcast(websocket_payload(action_type))
+
+def publish_generation(action_type, module_name):
+    """Publish a new generation of a generator module to every worker."""
+    global generation
+    generation += 1
+    if shared_generation is not None:
+        shared_generation.value = generation
+    if websocket_routes.channel is None:
+        # this process serves the requests itself
+        send_websocket_payload(action_type)
+        return
+    websocket_routes.channel.publish(("generation", {
+        "generation": generation,
+        "action": action_type,
+        "module": module_name,
+        "hash": module_hashes.get(module_name),
+    }))
+
+def apply_generation(event, compiled=None):
+    """Bring this worker to a generation published by the watcher, runs on the worker's event loop."""
+    global generation
+    module_name = event["module"]
+    file_path = get_module_path(module_name)
+    if event["action"] == DELETE:
+        unload_generator(file_path, notify=False)
+        known_generator_files.discard(file_path)
+    elif compiled is not None:
+        install_generator(*compiled, notify=False)
+        known_generator_files.add(file_path)
+        if module_hashes.get(module_name) != event["hash"]:
+            print(f"{module_name} changed again while applying generation {event['generation']}")
+    generation = event["generation"]
+    hub.publish(websocket_payload(event["action"]))
+
+def receive_generation(event):
+    """Compile a published generation off the event loop, then apply it on the loop."""
+    compiled = None
+    if event["action"] != DELETE and module_hashes.get(event["module"]) != event["hash"]:
+        try:
+            compiled = compile_generator(get_module_path(event["module"]))
+        except Exception as e:
+            print(f"Error loading {event['module']}, keeping the previous version: {e}")
+    hub.loop.call_soon_threadsafe(apply_generation, event, compiled)
+
+websocket_routes.channel_handlers["generation"] = receive_generation
+
+def compile_generator(file_path, source=None):
+    """Import the current source of a generator module, or the given source, into a fresh module object.
+
+    Nothing is swapped in, the module, the hash of the source it was compiled from and the
+    source are returned for install_generator. A failing import leaves the loaded version untouched.
+    """
+    module_name = get_module_name(file_path)
+    if source is None:
+        with open(file_path, "rb") as f:
+            source = f.read()
+    code = compile(source, file_path, "exec")
+    module = module_from_spec(spec_from_file_location(module_name, file_path))
+    previous_module = sys.modules.get(module_name)
+    # like a regular import, the module is reachable through sys.modules while it executes
+    sys.modules[module_name] = module
+    try:
+        exec(code, module.__dict__)
+    finally:
+        if previous_module is None:
+            del sys.modules[module_name]
+        else:
+            sys.modules[module_name] = previous_module
+    return module, hashlib.sha256(source).hexdigest(), source
+
+def install_generator(module, source_hash, source, notify=True):
+    """Swap a compiled generator module in place of the loaded version.
+
+    Importing a module registered from the index with the source it was indexed from
+    changes nothing that is served, the change listeners aren't notified.
+    """
+    module_name = module.__name__
+    action_type = RELOAD if module_name in module_hashes else LOAD
+    previous_generators = set(module_generators(module_name))
+    loaded_generators = {
+        obj.__name__: obj for _, obj in inspect.getmembers(module) if is_valid_generator(obj)
     }
-    queue.put(json.dumps(websocket_payload))
+    unchanged = module_hashes.get(module_name) == source_hash and previous_generators == loaded_generators.keys()
+
+    sys.modules[module_name] = module
+    for name in previous_generators - loaded_generators.keys():
+        generators_dict.pop(name, None)
+        generator_modules.pop(name, None)
+    generators_dict.update(loaded_generators)
+    generator_modules.update(dict.fromkeys(loaded_generators, module_name))
+    module_hashes[module_name] = source_hash
+    module_sources[module_name] = source
+    # round tripped through json to compare with the entries read back from the file
+    update_index(module_name, json.loads(json.dumps({
+        "hash": source_hash,
+        "generators": {name: obj.to_dict() for name, obj in loaded_generators.items()},
+    })))
+    if unchanged:
+        return list(loaded_generators)
+
+    notify_change_listeners(action_type, previous_generators | loaded_generators.keys())
+    if notify:
+        publish_generation(action_type, module_name)
+    return list(loaded_generators)
 
-def load_generator(file_path):
+def load_generator(file_path, notify=True):
     """Load or reload a generator module."""
     module_name = get_module_name(file_path)
     current_pid = os.getpid()
-    loaded_generators = []
-
+    action = "Reloading" if module_name in sys.modules else "Loading"
+    print(f"[PID: {current_pid}] {action} {module_name}")
     try:
-        if module_name in sys.modules:
-            print(f"[PID: {current_pid}] Reloading {module_name}")
-            module = reload(sys.modules[module_name])
-            action_type = RELOAD
-        else:
-            print(f"[PID: {current_pid}] Loading {module_name}")
-            module = import_module(module_name)
-            action_type = LOAD
-
-        loaded_generators = load_module_members(module, loaded_generators=loaded_generators)
-        if current_pid == MAIN_PID:
-            send_websocket_payload(action_type)
+        compiled = compile_generator(file_path)
     except Exception as e:
         print(f"Error loading {module_name}: {e}")
         raise e
-    
-
-    return loaded_generators
+    return install_generator(*compiled, notify=notify)
 
-def unload_generator(file_path):
+def unload_generator(file_path, notify=True):
     """Unload a generator module."""
     module_name = get_module_name(file_path)
     current_pid = os.getpid()
     print(f"[PID: {current_pid}] Unloading {module_name}")
+    removed_generators = module_generators(module_name)
 
-    if module_name in sys.modules:
-        module = sys.modules[module_name]
-        unload_module_members(module)
-        del sys.modules[module_name]
+    for name in removed_generators:
+        generators_dict.pop(name, None)
+        generator_modules.pop(name, None)
+    sys.modules.pop(module_name, None)
+    module_hashes.pop(module_name, None)
+    module_sources.pop(module_name, None)
+    update_index(module_name, None)
+    notify_change_listeners(DELETE, set(removed_generators))
 
-    if current_pid == MAIN_PID:
-        send_websocket_payload(DELETE)
+    if notify:
+        publish_generation(DELETE, module_name)
 
 class FileChangeHandler(FileSystemEventHandler):
-    
-    @staticmethod
-    def remove_files(files_to_remove):
-        """Remove files from the known_generator_files and unload them."""
-        for file in files_to_remove:
-            print(f"Deleted file: {file} among {known_generator_files}")
-            unload_generator(file)
-            known_generator_files.remove(file)
+    """Coalesces bursts of file events and reloads each changed generator once."""
+
+    def __init__(self, debounce=RELOAD_DEBOUNCE):
+        super().__init__()
+        self.debounce = debounce
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def on_any_event(self, event):
+        # opened/closed events are skipped, reading a generator would trigger another sync
+        if event.event_type in ("created", "modified", "deleted", "moved"):
+            self.schedule_sync()
 
-    def on_modified(self, event):
-        print("Modified")
-        global known_generator_files
+    def schedule_sync(self):
+        """(Re)start the debounce window, the sync runs once no event came for self.debounce seconds."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.debounce, self.sync)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def sync(self):
+        """Bring the loaded generators in line with the generators directory, off the event loop."""
         current_files = set(glob.glob("./schematicGenerator/generators/*.py"))
-        
-        if event.is_directory and event.src_path.endswith("/generators"):
-            
-            files_to_remove = [known_file for known_file in known_generator_files if known_file not in current_files]
-            self.remove_files(files_to_remove)
-            
-            for file in current_files:
-                if file not in known_generator_files:
-                    print(f"New file: {file} among {known_generator_files}")
-                    load_generator(file)
-                    known_generator_files.add(file)
-                    
-        elif not event.is_directory and event.src_path.endswith(".py"):
-            file_path = "./" + os.path.relpath(event.src_path)
-            if file_path not in current_files:
-                print(f"Deleted file: {file_path} among {known_generator_files}")
-                self.remove_files([file_path])
-                return
-            print(f"Modified file: {file_path} among {known_generator_files}")
-            load_generator(file_path)
-            known_generator_files.add(file_path)
-
-    def on_deleted(self, event):
-        files_to_remove = [known_file for known_file in known_generator_files if not os.path.exists(known_file)]
-        self.remove_files(files_to_remove)
-
-            
+
+        for file in known_generator_files - current_files:
+            print(f"Deleted file: {file}")
+            unload_generator(file)
+            known_generator_files.discard(file)
+
+        for file in sorted(current_files):
+            try:
+                if module_hashes.get(get_module_name(file)) == file_hash(file):
+                    continue
+                load_generator(file)
+                known_generator_files.add(file)
+            except Exception as e:
+                print(f"Keeping the previous version of {file}: {e}")
+        save_index()
+
+
 observer = None
 
-async def init_observer(app, loop):
+def start_observer():
     global observer
     observer = Observer()
     observer.schedule(FileChangeHandler(), path="./schematicGenerator/generators/", recursive=False)
     observer.start()
     print("Observer started")
 
+async def init_observer(app, loop):
+    """Start the single generators watcher, in Sanic's main process."""
+    global shared_generation
+    shared_generation = Value("i", generation)
+    app.shared_ctx.generators_generation = shared_generation
+    start_observer()
+
+async def init_worker_generators(app, loop):
+    """Sync a worker with the watcher's generation, or watch from the worker when there is no main process."""
+    global generation
+    shared = getattr(app.shared_ctx, "generators_generation", None)
+    if shared is not None:
+        generation = shared.value
+    if websocket_routes.channel is None:
+        start_observer()
+
 async def stop_observer(app, loop):
     global observer
     if observer:
@@ -155,8 +408,45 @@ async def stop_observer(app, loop):
         observer.join()
         print("Observer stopped")
         
-def initialize_generators():
+def register_indexed(module_name, entry, notify=True):
+    """Register the generators of a module from its index entry, without importing it.
+
+    The change listeners aren't notified, initialize_generators notifies them once for
+    every indexed module rather than rebuilding the catalog for each.
+    """
+    names = list(entry["generators"])
+    generator_modules.update(dict.fromkeys(names, module_name))
+    module_hashes[module_name] = entry["hash"]
+    generator_index[module_name] = entry
+    if notify:
+        publish_generation(LOAD, module_name)
+    return names
+
+def initialize_generators(notify=True, lazy=False):
+    """Load every generator of the generators directory.
+
+    With lazy, the modules whose source didn't change since they were indexed are
+    registered from the generator index, they are imported on first use by get_generator.
+    """
+    global index_dirty
+    index = read_index() if lazy else {}
+    indexed = set()
     for file in glob.glob("./schematicGenerator/generators/*.py"):
         known_generator_files.add(file)
+        module_name = get_module_name(file)
+        entry = index.get(module_name)
+        if entry is not None and entry.get("hash") == file_hash(file):
+            indexed.update(register_indexed(module_name, entry, notify=notify))
+            continue
         print("PID: ", os.getpid())
-        load_generator(file)
\ No newline at end of file
+        try:
+            load_generator(file, notify=notify)
+        except Exception:
+            # a broken generator must not keep the others from being served
+            continue
+    if indexed:
+        notify_change_listeners(LOAD, indexed)
+    if lazy and index.keys() != generator_index.keys():
+        # entries of removed or broken modules
+        index_dirty = True
+    save_index()
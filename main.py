@@ -1,19 +1,70 @@
 from sanic import Sanic
+from server import settings
 from server.routes import list_generators, generate
-from server.websocket_routes import feed
-from hotloading.hotload_manager import init_observer, stop_observer, initialize_generators
+from server.batch_routes import generate_batch
+from server.preview_routes import preview
+from server.jobs import (
+    submit_job,
+    job_status,
+    job_result,
+    cancel_job,
+    create_job_store,
+    start_jobs,
+    stop_jobs,
+)
+from server.websocket_routes import feed, create_channel, close_channel, start_hub, stop_hub
+from server.worker_pool import share_server_workers, start_pool, stop_pool
+from server.profiling import list_profiles, get_profile, get_profile_stacks, get_profile_stats
+from server.metrics import metrics, create_metrics_store, start_metrics, stop_metrics
+from server.rate_limit import create_rate_limit_store, start_rate_limit
+from hotloading.hotload_manager import (
+    init_observer,
+    init_worker_generators,
+    stop_observer,
+    initialize_generators,
+    warm_generators,
+)
 
 app = Sanic(name="GeneratorsAPI")
 
 # Attach routes
 app.add_route(list_generators, "/generators")
+app.add_route(metrics, "/metrics")
+app.add_route(list_profiles, "/profiles")
+app.add_route(get_profile, "/profiles/<profile_id>")
+app.add_route(get_profile_stacks, "/profiles/<profile_id>/collapsed")
+app.add_route(get_profile_stats, "/profiles/<profile_id>/pstats")
+app.add_route(generate_batch, "/generate/batch", methods=["POST"])
 app.add_route(generate, "/generate/<generator_name>", methods=["POST"])
+app.add_route(preview, "/preview/<generator_name>", methods=["GET"])
+app.add_route(submit_job, "/jobs/<generator_name>", methods=["POST"])
+app.add_route(job_status, "/jobs/<job_id>", methods=["GET"])
+app.add_route(cancel_job, "/jobs/<job_id>", methods=["DELETE"])
+app.add_route(job_result, "/jobs/<job_id>/result", methods=["GET"])
 app.add_websocket_route(feed, "/ws")
 
-app.listener('before_server_start')(init_observer)
+app.listener('main_process_start')(create_channel)
+app.listener('main_process_start')(create_job_store)
+app.listener('main_process_start')(create_metrics_store)
+app.listener('main_process_start')(create_rate_limit_store)
+app.listener('main_process_start')(init_observer)
+app.listener('main_process_start')(share_server_workers)
+app.listener('main_process_stop')(stop_observer)
+app.listener('main_process_stop')(close_channel)
+app.listener('before_server_start')(start_hub)
+app.listener('before_server_start')(init_worker_generators)
+app.listener('before_server_start')(start_pool)
+app.listener('before_server_start')(start_jobs)
+app.listener('before_server_start')(start_metrics)
+app.listener('before_server_start')(start_rate_limit)
+app.listener('after_server_start')(warm_generators)
 app.listener('after_server_stop')(stop_observer)
+app.listener('after_server_stop')(stop_jobs)
+app.listener('after_server_stop')(stop_metrics)
+app.listener('after_server_stop')(stop_pool)
+app.listener('after_server_stop')(stop_hub)
 
-initialize_generators()
+initialize_generators(notify=False, lazy=settings.GENERATORS_LAZY)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=8000)
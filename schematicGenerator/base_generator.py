@@ -1,41 +1,67 @@
 from abc import ABC, ABCMeta, abstractmethod
-from inspect import signature
-from schematicGenerator.inputs import BaseInput
+from inspect import signature, Parameter
+from schematicGenerator.inputs import BaseInput, InputError
 from functools import wraps
 
+# set by the process running a generation, called with (fraction, message)
+progress_callback = None
+
+
+def build_input_plan(func):
+    """Return the validation plan of a generate function.
+
+    The plan is an ordered tuple of (name, input, default, required) entries, input is
+    None when the parameter's default isn't a BaseInput.
+    """
+    plan = []
+    for name, param in signature(func).parameters.items():
+        if name == "cls" or param.kind in (Parameter.VAR_POSITIONAL, Parameter.VAR_KEYWORD):
+            continue
+        input_obj = param.default if isinstance(param.default, BaseInput) else None
+        default = input_obj.default if input_obj is not None else None
+        plan.append((name, input_obj, default, default is None))
+    return tuple(plan)
+
+
+def validate_arguments(plan, kwargs):
+    """Validate kwargs against a validation plan and return the validated arguments.
+
+    Names that aren't in the plan are rejected, they would reach the cache key and generate.
+    """
+    validated = {}
+    for name, input_obj, default, required in plan:
+        value = kwargs.get(name)
+        if value is not None:
+            if input_obj is None:
+                raise TypeError(f"Invalid input type for {name}")
+            try:
+                validated[name] = input_obj.validate(value)
+            except ValueError as e:
+                raise InputError.wrap(e).at(name) from None
+        elif required:
+            raise TypeError(f"Missing required argument: {name}")
+        else:
+            validated[name] = default
+    for name in kwargs:
+        if name not in validated:
+            raise InputError("Unknown input").at(name)
+    return validated
+
 
 def handle_inputs(func):
+    raw_func = getattr(func, "__func__", func)
+    plan = build_input_plan(raw_func)
+
     @wraps(func)
     def wrapper(cls, **kwargs):
-        sig = signature(func.__func__)
-        params = sig.parameters
-        for name, param in params.items():
-            if name == "cls":
-                continue
-            if name in kwargs and kwargs[name] is not None:
-                input_obj = param.default
-                if not isinstance(input_obj, BaseInput):
-                    raise TypeError(f"Invalid input type for {name}")
-                value = kwargs[name]
-                validated_value = input_obj.validate(value)
-                kwargs[name] = validated_value
-            elif param.default is not None and isinstance(param.default, BaseInput):
-                if param.default.default is not None:
-                    kwargs[
-                        name
-                    ] = (
-                        param.default.default
-                    ) 
-                else:
-                    raise TypeError(f"Missing required argument: {name}")
-            else:
-                raise TypeError(f"Missing required argument: {name}")
-        return func.__func__(cls, **kwargs)
+        return raw_func(cls, **validate_arguments(plan, kwargs))
 
+    wrapper.input_plan = plan
     return wrapper
 
 
 class MetaGenerator(ABCMeta):
+    # generate's validation plan is built here, so reloading a generator module rebuilds it
     def __new__(cls, name, bases, class_dict):
         if "generate" in class_dict:
             class_dict["generate"] = classmethod(handle_inputs(class_dict["generate"]))
@@ -64,23 +90,42 @@ class GeneratorMetaData:
 
 class BaseGenerator(ABC, metaclass=MetaGenerator):
     meta_data = GeneratorMetaData()
+    # maximum number of seconds a generation may take, None uses the server default
+    timeout = None
+    # generate returns a SlabStream, its output is spooled to disk and sent in chunks
+    streamed = False
+    # gzip level of its schematics from 0 (stored) to 9, None uses the server default
+    compression_level = None
     
     @abstractmethod
     def generate(cls, **kwargs):
         pass
 
+    @classmethod
+    def validate_inputs(cls, **kwargs):
+        """Validate arguments the same way generate does, without generating anything."""
+        return validate_arguments(cls.generate.input_plan, kwargs)
+
+    @classmethod
+    def estimate_cost(cls, **kwargs):
+        """Return the blocks of the bounding volume a generation of validated arguments fills.
+
+        Generations are charged it by the rate limiter, None uses the server's default cost.
+        """
+        return None
+
+    @classmethod
+    def report_progress(cls, fraction, message=None):
+        """Report how much of the current generation is done, fraction goes from 0 to 1."""
+        if progress_callback is not None:
+            progress_callback(fraction, message)
+
     @classmethod
     def serialize_inputs(cls):
-        func = cls.generate
-        sig = signature(func)
         serialized_inputs = {}
-        for name, param in sig.parameters.items():
-            if name == "cls":
-                continue
-            
-            if not isinstance(param.default, BaseInput):
-                continue
-            serialized_inputs[name] = param.default.to_dict()
+        for name, input_obj, _, _ in cls.generate.input_plan:
+            if input_obj is not None:
+                serialized_inputs[name] = input_obj.to_dict()
         return serialized_inputs
     
     @classmethod
@@ -0,0 +1,235 @@
+"""Registry of the known blocks and their states, shared by everything in a process.
+
+Block states are canonicalized, namespace added, properties sorted and missing ones
+set to their default, e.g. "oak_stairs[half=top]" becomes
+"minecraft:oak_stairs[facing=north,half=top,shape=straight,waterlogged=false]".
+Canonical strings are interned and each state has a small integer id. Blocks that
+aren't in the list, from a newer version or a mod, are passed through as they were
+given when their id and properties are well formed, they have no state id. So are
+states with block entity data. States aren't enumerated: a block's states take
+consecutive ids from its base id, so an id is computed from the property values and
+decoded back to its state, and loading only sums up the state counts of the blocks.
+
+The block list is read from data/blocks.json, or from the BLOCKS_FILE environment
+variable, the first time the registry is used. It maps block names to
+{"properties": {name: [values...]}, "default": {name: value}}. Convert a vanilla data
+generator report (java -DbundlerMainClass=net.minecraft.data.Main -jar server.jar --reports) with:
+
+    python -m schematicGenerator.blocks generated/reports/blocks.json
+"""
+import json
+import os
+import re
+import sys
+from bisect import bisect_right
+from math import prod
+
+NAMESPACE = "minecraft:"
+# read by pool workers too, which don't load the server settings
+BLOCKS_FILE = os.environ.get("BLOCKS_FILE") or os.path.join(os.path.dirname(__file__), "data", "blocks.json")
+# raw strings remembered with their canonical state, beyond that they are parsed every time
+PARSE_CACHE_SIZE = 65536
+# namespaced ids and property names and values, as the game allows them
+BLOCK_NAME = re.compile(r"(?:[a-z0-9_.-]+:)?[a-z0-9_./-]+")
+PROPERTY_TOKEN = re.compile(r"[a-z0-9_]+")
+
+_registry = None
+
+
+class InvalidBlock(ValueError):
+    """Raised for malformed block states and for invalid properties of known blocks."""
+
+
+class BlockType:
+    """A block with its properties, its states have the ids base_id to base_id + state_count - 1."""
+
+    __slots__ = ("name", "properties", "default", "base_id", "state_count", "_value_indices", "_strides")
+
+    def __init__(self, name, properties, default, base_id):
+        self.name = name
+        # property name -> allowed values, sorted by property name
+        self.properties = {key: tuple(properties[key]) for key in sorted(properties)}
+        self.default = {key: default[key] for key in self.properties}
+        self.base_id = base_id
+        self._value_indices = {
+            key: {value: index for index, value in enumerate(values)}
+            for key, values in self.properties.items()
+        }
+        # the last property varies fastest
+        self._strides = {}
+        stride = 1
+        for key in reversed(self.properties):
+            self._strides[key] = stride
+            stride *= len(self.properties[key])
+        self.state_count = stride
+
+    def state_id(self, values):
+        """Return the id of the state with the given value for every property."""
+        return self.base_id + sum(
+            self._value_indices[key][value] * self._strides[key] for key, value in values.items()
+        )
+
+    def state(self, state_id):
+        """Return the canonical string of one of this block's state ids."""
+        if not self.properties:
+            return self.name
+        offset = state_id - self.base_id
+        values = []
+        for key, values_of_key in self.properties.items():
+            index, offset = divmod(offset, self._strides[key])
+            values.append(f"{key}={values_of_key[index]}")
+        return f"{self.name}[{','.join(values)}]"
+
+
+class BlockRegistry:
+    def __init__(self, blocks):
+        """blocks maps block names to (properties, default) pairs."""
+        self._entries = blocks
+        self._names = list(blocks)
+        # only the base ids are computed up front, BlockTypes are built when first used
+        self._base_ids = []
+        self._block_types = {}
+        state_count = 0
+        for properties, _ in blocks.values():
+            self._base_ids.append(state_count)
+            state_count += prod(len(values) for values in properties.values())
+        self._name_indices = {name: index for index, name in enumerate(self._names)}
+        self.state_count = state_count
+        self._states = {}  # state id -> interned canonical string
+        self._parsed = {}  # raw string -> (canonical string, state id)
+
+    @classmethod
+    def load(cls, path=BLOCKS_FILE):
+        with open(path) as f:
+            data = json.load(f)
+        return cls({
+            name: (entry.get("properties", {}), entry.get("default", {}))
+            for name, entry in data.items()
+        })
+
+    def __contains__(self, name):
+        return name in self._name_indices
+
+    def block_type(self, name):
+        """Return the BlockType of a block name, or None if the block is unknown."""
+        block_type = self._block_types.get(name)
+        if block_type is None:
+            index = self._name_indices.get(name)
+            if index is None:
+                return None
+            properties, default = self._entries[name]
+            block_type = self._block_types[name] = BlockType(name, properties, default, self._base_ids[index])
+        return block_type
+
+    def parse(self, block):
+        """Return the canonical string and the state id of a block state string.
+
+        Blocks that aren't in the list and states with block entity data are returned
+        as given, with None for their state id. Raises InvalidBlock for malformed states
+        and for unknown properties or values of known blocks.
+        """
+        parsed = self._parsed.get(block)
+        if parsed is None:
+            parsed = self._parse(block)
+            if len(self._parsed) < PARSE_CACHE_SIZE:
+                self._parsed[block] = parsed
+        return parsed
+
+    def canonical(self, block):
+        return self.parse(block)[0]
+
+    def state_id(self, block):
+        return self.parse(block)[1]
+
+    def state(self, state_id):
+        """Return the canonical string of a state id."""
+        state = self._states.get(state_id)
+        if state is None:
+            if not 0 <= state_id < self.state_count:
+                raise InvalidBlock(f"Unknown block state id {state_id}")
+            block_type = self.block_type(self._names[bisect_right(self._base_ids, state_id) - 1])
+            state = self._states[state_id] = sys.intern(block_type.state(state_id))
+        return state
+
+    def _parse(self, block):
+        text, brace, _ = block.strip().partition("{")
+        name, bracket, rest = text.partition("[")
+        name = name.strip()
+        if not BLOCK_NAME.fullmatch(name):
+            raise InvalidBlock(f"Malformed block state {block}")
+        if ":" not in name:
+            name = NAMESPACE + name
+
+        pairs = []
+        if bracket:
+            rest = rest.rstrip()
+            if not rest.endswith("]"):
+                raise InvalidBlock(f"Malformed block state {block}")
+            for pair in rest[:-1].split(",") if rest[:-1].strip() else ():
+                key, equals, value = (part.strip() for part in pair.partition("="))
+                if not equals or not PROPERTY_TOKEN.fullmatch(key) or not PROPERTY_TOKEN.fullmatch(value):
+                    raise InvalidBlock(f"Malformed block state {block}")
+                pairs.append((key, value))
+
+        block_type = self.block_type(name)
+        if block_type is None:
+            if len({key for key, _ in pairs}) < len(pairs):
+                raise InvalidBlock(f"A property is given twice in {block}")
+            return block, None
+
+        values = dict(block_type.default)
+        given = set()
+        for key, value in pairs:
+            if key not in block_type.properties:
+                raise InvalidBlock(f"{name} has no property {key}")
+            if key in given:
+                raise InvalidBlock(f"Property {key} is given twice in {block}")
+            if value not in block_type._value_indices[key]:
+                raise InvalidBlock(
+                    f"Invalid value {value} for {key} of {name}, "
+                    f"expected one of {', '.join(block_type.properties[key])}"
+                )
+            given.add(key)
+            values[key] = value
+        if brace:
+            # block entity data is left to the schematic writer
+            return block, None
+
+        state_id = block_type.state_id(values)
+        return self.state(state_id), state_id
+
+
+def get_registry():
+    """Return the process wide registry, loading the block list on first use."""
+    global _registry
+    if _registry is None:
+        _registry = BlockRegistry.load()
+    return _registry
+
+
+def canonical_block(block):
+    return get_registry().canonical(block)
+
+
+def block_state(state_id):
+    return get_registry().state(state_id)
+
+
+def convert_report(report_path, output_path=BLOCKS_FILE):
+    """Write the block list of a vanilla data generator blocks.json report."""
+    with open(report_path) as f:
+        report = json.load(f)
+    blocks = {}
+    for name, entry in report.items():
+        properties = entry.get("properties", {})
+        default = next(state for state in entry["states"] if state.get("default")).get("properties", {})
+        blocks[name] = {"properties": properties, "default": default} if properties else {}
+    with open(output_path, "w") as f:
+        f.write("{\n")
+        f.write(",\n".join(f"{json.dumps(name)}: {json.dumps(entry)}" for name, entry in sorted(blocks.items())))
+        f.write("\n}\n")
+    print(f"Wrote {len(blocks)} blocks to {output_path}")
+
+
+if __name__ == "__main__":
+    convert_report(*sys.argv[1:])
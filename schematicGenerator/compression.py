@@ -0,0 +1,69 @@
+"""gzip compression of the schematics, through a faster zlib compatible backend when one is installed.
+
+GZIP_BACKEND picks the backend: zlib-ng (the zlib-ng package), isal (python-isal) or
+zlib (the standard library). auto, the default, takes the first one installed in that
+order. Levels are zlib's, from 0 (stored, not compressed, the fastest) to 9. isal only
+has levels 0 to 3, zlib's levels are mapped onto them.
+"""
+import gzip
+import io
+import os
+
+# read by pool workers too, which don't load the server settings
+GZIP_BACKEND = os.environ.get("GZIP_BACKEND", "auto")
+# level of gzip.GzipFile, the level .schem files were always written with
+DEFAULT_LEVEL = 9
+# isal level of every zlib level, level 0 keeps the standard library which can store data
+ISAL_LEVELS = (None, 0, 0, 1, 1, 2, 2, 2, 3, 3)
+
+
+def _load_backend(name):
+    """Return the name and the gzip module of a backend, falling back to zlib when it isn't installed."""
+    if name not in ("auto", "zlib-ng", "isal", "zlib"):
+        raise ValueError(f"Unknown GZIP_BACKEND {name}, expected auto, zlib-ng, isal or zlib")
+    if name in ("auto", "zlib-ng"):
+        try:
+            from zlib_ng import gzip_ng
+            return "zlib-ng", gzip_ng
+        except ImportError:
+            if name == "zlib-ng":
+                print("GZIP_BACKEND zlib-ng isn't installed, using zlib")
+    if name in ("auto", "isal"):
+        try:
+            from isal import igzip
+            return "isal", igzip
+        except ImportError:
+            if name == "isal":
+                print("GZIP_BACKEND isal isn't installed, using zlib")
+    return "zlib", gzip
+
+
+backend, _gzip = _load_backend(GZIP_BACKEND)
+
+
+def check_level(level):
+    """Return level if it is a zlib compression level, raise ValueError otherwise."""
+    if isinstance(level, bool) or not isinstance(level, int) or not 0 <= level <= 9:
+        raise ValueError(f"Compression level should be an integer from 0 to 9, got {level!r}")
+    return level
+
+
+def open_gzip(fileobj, level=DEFAULT_LEVEL):
+    """Return a gzip file object compressing what is written to it into fileobj."""
+    if backend == "isal":
+        if level == 0:
+            return gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=0)
+        return _gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=ISAL_LEVELS[level])
+    return _gzip.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level)
+
+
+def gzipped(write, level=DEFAULT_LEVEL):
+    """Return the gzip bytes of what write(fileobj) writes."""
+    buffer = io.BytesIO()
+    with open_gzip(buffer, level) as gzip_file:
+        write(gzip_file)
+    return buffer.getvalue()
+
+
+def compress(data, level=DEFAULT_LEVEL):
+    return gzipped(lambda gzip_file: gzip_file.write(data), level)
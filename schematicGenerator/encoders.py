@@ -0,0 +1,364 @@
+"""Encoders of generated blocks into the schematic formats /generate can answer with.
+
+Every encoder works from a BlockVolume, built once from whatever a generator returned,
+so one generation can be written in several formats. A volume travels and is cached as
+its run-length encoding, the rle format, which is also served to internal consumers.
+
+Formats, picked with ?format= or by media type in the Accept header:
+- schem: Sponge v2 .schem, the default
+- schem-v3: Sponge v3 .schem
+- litematic: Litematica .litematic, a single region
+- schematic: legacy MCEdit .schematic, pre-1.13 numeric ids, only for the blocks of
+  LEGACY_IDS and without their properties
+- rle: BlockVolume.to_rle, not compressed
+"""
+import struct
+import time
+
+import numpy as np
+from mcschematic import Version
+from nbtlib import File, Compound, Int, Long, Short, String, ByteArray, IntArray, LongArray, List
+
+from schematicGenerator.compression import DEFAULT_LEVEL, gzipped
+from schematicGenerator.schematic import (
+    ArraySchematic,
+    SlabStream,
+    check_block_limit,
+    encode_varints,
+    mcschematic_blocks,
+    write_sponge_v2,
+)
+from schematicGenerator.serialization import DEFAULT_VERSION, MIME_TYPE
+
+DEFAULT_FORMAT = "schem"
+RLE_MAGIC = b"BRLE"
+# magic, format version, width, height, length, origin x, y, z, palette size
+RLE_HEADER = struct.Struct("<4sB3I3iI")
+LITEMATIC_VERSION = 6
+# values packed by pack_bits in one go, a multiple of 64 so every chunk starts on a long
+PACK_CHUNK = 1 << 20
+
+ENCODERS = {}  # format name -> Encoder
+MEDIA_TYPES = {}  # media type -> Encoder
+
+# legacy data values of the 16 colors, in order
+DYES = (
+    "white", "orange", "magenta", "light_blue", "yellow", "lime", "pink", "gray",
+    "light_gray", "cyan", "purple", "blue", "brown", "green", "red", "black",
+)
+# block name -> (numeric id, data value) before the 1.13 flattening
+LEGACY_IDS = {
+    "minecraft:air": (0, 0), "minecraft:stone": (1, 0), "minecraft:granite": (1, 1),
+    "minecraft:polished_granite": (1, 2), "minecraft:diorite": (1, 3), "minecraft:polished_diorite": (1, 4),
+    "minecraft:andesite": (1, 5), "minecraft:polished_andesite": (1, 6), "minecraft:grass_block": (2, 0),
+    "minecraft:dirt": (3, 0), "minecraft:coarse_dirt": (3, 1), "minecraft:podzol": (3, 2),
+    "minecraft:cobblestone": (4, 0), "minecraft:bedrock": (7, 0), "minecraft:water": (9, 0),
+    "minecraft:lava": (11, 0), "minecraft:sand": (12, 0), "minecraft:red_sand": (12, 1),
+    "minecraft:gravel": (13, 0), "minecraft:gold_ore": (14, 0), "minecraft:iron_ore": (15, 0),
+    "minecraft:coal_ore": (16, 0), "minecraft:sponge": (19, 0), "minecraft:glass": (20, 0),
+    "minecraft:lapis_block": (22, 0), "minecraft:sandstone": (24, 0), "minecraft:gold_block": (41, 0),
+    "minecraft:iron_block": (42, 0), "minecraft:bricks": (45, 0), "minecraft:tnt": (46, 0),
+    "minecraft:bookshelf": (47, 0), "minecraft:mossy_cobblestone": (48, 0), "minecraft:obsidian": (49, 0),
+    "minecraft:diamond_block": (57, 0), "minecraft:ice": (79, 0), "minecraft:snow_block": (80, 0),
+    "minecraft:clay": (82, 0), "minecraft:netherrack": (87, 0), "minecraft:soul_sand": (88, 0),
+    "minecraft:glowstone": (89, 0), "minecraft:stone_bricks": (98, 0), "minecraft:melon": (103, 0),
+    "minecraft:nether_bricks": (112, 0), "minecraft:end_stone": (121, 0), "minecraft:emerald_block": (133, 0),
+    "minecraft:redstone_block": (152, 0), "minecraft:quartz_block": (155, 0), "minecraft:prismarine": (168, 0),
+    "minecraft:sea_lantern": (169, 0), "minecraft:hay_block": (170, 0), "minecraft:terracotta": (172, 0),
+    "minecraft:coal_block": (173, 0), "minecraft:packed_ice": (174, 0), "minecraft:red_sandstone": (179, 0),
+    "minecraft:purpur_block": (201, 0), "minecraft:magma_block": (213, 0), "minecraft:red_nether_bricks": (215, 0),
+    "minecraft:bone_block": (216, 0),
+}
+# colored blocks share one id, their color is the data value
+LEGACY_IDS.update({
+    f"minecraft:{dye}_{block}": (block_id, data)
+    for block, block_id in (
+        ("wool", 35), ("stained_glass", 95), ("terracotta", 159), ("stained_glass_pane", 160),
+        ("carpet", 171), ("concrete", 251), ("concrete_powder", 252),
+    )
+    for data, dye in enumerate(DYES)
+})
+LEGACY_IDS.update({
+    f"minecraft:{wood}_planks": (5, data)
+    for data, wood in enumerate(("oak", "spruce", "birch", "jungle", "acacia", "dark_oak"))
+})
+
+
+def run_length_arrays(values):
+    """Return the values and lengths of the runs of equal values of an array, flattened."""
+    values = np.asarray(values).ravel()
+    if not values.size:
+        return values, np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate(([True], values[1:] != values[:-1])))
+    return values[starts], np.diff(np.append(starts, values.size))
+
+
+class BlockVolume:
+    """Blocks shared by the encoders: [y, z, x] palette indices where air is 0, and the
+    world position of blocks[0, 0, 0]."""
+
+    __slots__ = ("blocks", "origin", "palette")
+
+    def __init__(self, blocks, origin, palette):
+        self.blocks = blocks
+        self.origin = tuple(origin)
+        self.palette = list(palette)
+
+    @classmethod
+    def from_schematic(cls, schem, max_blocks=None):
+        """Build the volume of anything a generator can return, raising TooManyBlocks above max_blocks.
+
+        An ArraySchematic or MCSchematic is trimmed to its non air blocks, a SlabStream
+        keeps its whole box like its .schem does. Block entities are refused, only the
+        schem format of the original schematic can hold them.
+        """
+        if isinstance(schem, SlabStream):
+            blocks = np.concatenate(list(schem.palette_slabs(max_blocks)))
+            origin, palette = schem.origin, list(schem.palette)
+        else:
+            if isinstance(schem, ArraySchematic):
+                blocks, origin, palette = schem._trimmed()
+            else:
+                blocks, origin, palette = mcschematic_blocks(schem)
+            height, length, width = blocks.shape
+            check_block_limit(width, height, length, max_blocks)
+        for block in palette:
+            if block[-1] == "}":
+                raise ValueError(f"Block entities can only be written as {DEFAULT_FORMAT}: {block}")
+        return cls(blocks, origin, palette)
+
+    @property
+    def shape(self):
+        """Return (width, height, length)."""
+        height, length, width = self.blocks.shape
+        return width, height, length
+
+    def block_count(self):
+        return int(np.count_nonzero(self.blocks))
+
+    def to_rle(self):
+        """Encode the volume as a little-endian run-length binary.
+
+        RLE_HEADER, then every palette entry as a uint16 byte length and its UTF-8 bytes,
+        a uint32 run count, the uint16 palette index of every run and the uint32 length
+        of every run. Runs follow the blocks ordered by y, then z, then x.
+        """
+        values, counts = run_length_arrays(self.blocks)
+        parts = [RLE_HEADER.pack(RLE_MAGIC, 1, *self.shape, *self.origin, len(self.palette))]
+        for block in self.palette:
+            encoded = block.encode()
+            parts.append(struct.pack("<H", len(encoded)) + encoded)
+        parts.append(struct.pack("<I", len(values)))
+        parts.append(values.astype("<u2").tobytes())
+        parts.append(counts.astype("<u4").tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_rle(cls, data):
+        magic, _, width, height, length, x, y, z, palette_size = RLE_HEADER.unpack_from(data)
+        if magic != RLE_MAGIC:
+            raise ValueError("Not a run-length block volume")
+        position = RLE_HEADER.size
+        palette = []
+        for _ in range(palette_size):
+            (size,) = struct.unpack_from("<H", data, position)
+            palette.append(data[position + 2:position + 2 + size].decode())
+            position += 2 + size
+        (runs,) = struct.unpack_from("<I", data, position)
+        position += 4
+        values = np.frombuffer(data, dtype="<u2", count=runs, offset=position)
+        counts = np.frombuffer(data, dtype="<u4", count=runs, offset=position + 2 * runs)
+        blocks = np.repeat(values.astype(np.uint16), counts).reshape(height, length, width)
+        return cls(blocks, (x, y, z), palette)
+
+
+class Encoder:
+    """A schematic format: its ?format= name, the media type matched against Accept and sent
+    as Content-Type, its file extension and encode(volume, version, name, level) returning
+    its bytes.
+
+    versioned encoders write the Minecraft data version, the others ignore it. gzipped
+    formats are gzip files compressed at level, the others ignore it and are compressed
+    for transfer only, with Content-Encoding.
+    """
+
+    __slots__ = ("name", "media_type", "extension", "encode", "versioned", "gzipped")
+
+    def __init__(self, name, media_type, extension, encode, versioned=True, gzipped=True):
+        self.name = name
+        self.media_type = media_type
+        self.extension = extension
+        self.encode = encode
+        self.versioned = versioned
+        self.gzipped = gzipped
+
+
+def register_encoder(encoder):
+    ENCODERS[encoder.name] = encoder
+    MEDIA_TYPES[encoder.media_type] = encoder
+    return encoder
+
+
+def parse_version(name):
+    """Return the mcschematic.Version named "1.20.4", "JE_1_20_4" or "24w14a"."""
+    key = name.strip().upper().replace(".", "_").replace("-", "_")
+    if not key.startswith("JE_"):
+        key = "JE_" + key
+    try:
+        return Version[key]
+    except KeyError:
+        raise ValueError(f"Unknown Minecraft version {name}") from None
+
+
+def variant_key(key, encoder, version=DEFAULT_VERSION, level=None):
+    """Return the cache key of one encoding of a generation, the default encoding keeps the generation's key.
+
+    level is None for the server's default compression level.
+    """
+    if encoder.name == DEFAULT_FORMAT and version == DEFAULT_VERSION and level is None:
+        return key
+    parts = [key, encoder.name]
+    if encoder.versioned:
+        parts.append(version.name)
+    if encoder.gzipped and level is not None:
+        parts.append(f"gz{level}")
+    return ".".join(parts)
+
+
+def _byte_array(data):
+    return ByteArray(np.frombuffer(data, dtype=np.int8))
+
+
+def _unsigned_short(value):
+    # dimensions are unsigned shorts stored in a signed tag
+    return Short(value - 0x10000 if value > 0x7FFF else value)
+
+
+def _block_properties(block):
+    """Split a block state string into its name and its {property: value}."""
+    name, _, properties = block.partition("[")
+    return name, dict(pair.split("=", 1) for pair in properties.rstrip("]").split(",") if pair)
+
+
+def encode_sponge_v2(volume, version, name, level=DEFAULT_LEVEL):
+    return gzipped(lambda f: write_sponge_v2(f, version, volume.blocks, volume.origin, volume.palette), level)
+
+
+def encode_sponge_v3(volume, version, name, level=DEFAULT_LEVEL):
+    width, height, length = volume.shape
+    x, y, z = volume.origin
+    schematic = Compound({
+        "Version": Int(3),
+        "DataVersion": Int(version.value),
+        "Metadata": Compound({"WEOffsetX": Int(x), "WEOffsetY": Int(y), "WEOffsetZ": Int(z)}),
+        "Width": _unsigned_short(width),
+        "Height": _unsigned_short(height),
+        "Length": _unsigned_short(length),
+        "Offset": IntArray([x, y, z]),
+        "Blocks": Compound({
+            "Palette": Compound({block: Int(index) for index, block in enumerate(volume.palette)}),
+            "Data": _byte_array(encode_varints(volume.blocks)),
+            "BlockEntities": List[Compound]([]),
+        }),
+    })
+    return gzipped(File({"Schematic": schematic}, root_name="").write, level)
+
+
+def pack_bits(values, bits):
+    """Pack values below 2**bits into 64 bit words the way Litematica does: back to back from
+    the lowest bit of the first word, a value crossing two words is split between them."""
+    values = np.asarray(values).ravel()
+    words = np.zeros(-(-values.size * bits // 64), dtype=np.uint64)
+    words_per_chunk = PACK_CHUNK * bits // 64
+    for chunk_start in range(0, values.size, PACK_CHUNK):
+        chunk = values[chunk_start:chunk_start + PACK_CHUNK].astype(np.uint64)
+        positions = np.arange(chunk.size, dtype=np.uint64) * np.uint64(bits)
+        word = (positions >> np.uint64(6)).astype(np.intp) + chunk_start // PACK_CHUNK * words_per_chunk
+        offset = positions & np.uint64(63)
+        # each word gets the low parts of the values starting in it, ORed together
+        starts = np.flatnonzero(np.diff(word, prepend=-1))
+        words[word[starts]] = np.bitwise_or.reduceat(chunk << offset, starts)
+        crossing = offset + np.uint64(bits) > np.uint64(64)
+        words[word[crossing] + 1] |= chunk[crossing] >> (np.uint64(64) - offset[crossing])
+    return words
+
+
+def encode_litematic(volume, version, name, level=DEFAULT_LEVEL):
+    width, height, length = volume.shape
+    bits = max(2, (len(volume.palette) - 1).bit_length())
+    palette = []
+    for block in volume.palette:
+        block_name, properties = _block_properties(block)
+        entry = Compound({"Name": String(block_name)})
+        if properties:
+            entry["Properties"] = Compound({key: String(value) for key, value in properties.items()})
+        palette.append(entry)
+    now = Long(int(time.time() * 1000))
+    size = Compound({"x": Int(width), "y": Int(height), "z": Int(length)})
+    region = Compound({
+        "Position": Compound({"x": Int(0), "y": Int(0), "z": Int(0)}),
+        "Size": size,
+        "BlockStatePalette": List[Compound](palette),
+        "BlockStates": LongArray(pack_bits(volume.blocks, bits).view(np.int64)),
+        "TileEntities": List[Compound]([]),
+        "Entities": List[Compound]([]),
+        "PendingBlockTicks": List[Compound]([]),
+        "PendingFluidTicks": List[Compound]([]),
+    })
+    litematic = File({
+        "MinecraftDataVersion": Int(version.value),
+        "Version": Int(LITEMATIC_VERSION),
+        "Metadata": Compound({
+            "Name": String(name),
+            "Author": String(""),
+            "Description": String(""),
+            "RegionCount": Int(1),
+            "TotalBlocks": Int(volume.block_count()),
+            "TotalVolume": Int(width * height * length),
+            "TimeCreated": now,
+            "TimeModified": now,
+            "EnclosingSize": size,
+        }),
+        "Regions": Compound({name: region}),
+    }, root_name="")
+    return gzipped(litematic.write, level)
+
+
+def encode_legacy(volume, version, name, level=DEFAULT_LEVEL):
+    ids = np.zeros(len(volume.palette), dtype=np.uint8)
+    data = np.zeros(len(volume.palette), dtype=np.uint8)
+    for index, block in enumerate(volume.palette):
+        block_name = block.partition("[")[0]
+        if block_name not in LEGACY_IDS:
+            raise ValueError(f"{block_name} has no legacy .schematic id")
+        ids[index], data[index] = LEGACY_IDS[block_name]
+    width, height, length = volume.shape
+    x, y, z = volume.origin
+    schematic = File({
+        "Width": _unsigned_short(width),
+        "Height": _unsigned_short(height),
+        "Length": _unsigned_short(length),
+        "Materials": String("Alpha"),
+        "Blocks": _byte_array(ids[volume.blocks].tobytes()),
+        "Data": _byte_array(data[volume.blocks].tobytes()),
+        "Entities": List[Compound]([]),
+        "TileEntities": List[Compound]([]),
+        "WEOriginX": Int(0),
+        "WEOriginY": Int(0),
+        "WEOriginZ": Int(0),
+        "WEOffsetX": Int(x),
+        "WEOffsetY": Int(y),
+        "WEOffsetZ": Int(z),
+    }, root_name="Schematic")
+    return gzipped(schematic.write, level)
+
+
+def encode_rle(volume, version, name, level=DEFAULT_LEVEL):
+    return volume.to_rle()
+
+
+register_encoder(Encoder(DEFAULT_FORMAT, MIME_TYPE, ".schem", encode_sponge_v2))
+register_encoder(Encoder("schem-v3", "application/x-sponge-schematic-v3", ".schem", encode_sponge_v3))
+register_encoder(Encoder("litematic", "application/x-litematic", ".litematic", encode_litematic))
+register_encoder(Encoder("schematic", "application/x-mcedit-schematic", ".schematic", encode_legacy, versioned=False))
+register_encoder(Encoder("rle", "application/x-block-rle", ".rle", encode_rle, versioned=False, gzipped=False))
@@ -1,6 +1,8 @@
-import math
+import numpy as np
 from schematicGenerator.inputs import IntInput, BoolInput, BlockInput, StringInput
 from schematicGenerator.base_generator import BaseGenerator, GeneratorMetaData
+from schematicGenerator.volume import volume_to_schematic
+from schematicGenerator.raster import disc_mask, ring_mask
 import mcschematic
 
 
@@ -10,6 +12,10 @@ class CircleGenerator(BaseGenerator):
         author="Nano",
         categories=["shapes"],
     )
+    @classmethod
+    def estimate_cost(cls, radius, **kwargs):
+        return (2 * radius + 1) ** 2
+
     @classmethod
     def generate(
         cls,
@@ -25,14 +31,8 @@ class CircleGenerator(BaseGenerator):
         ),
     ) -> mcschematic.MCSchematic:
         print("Generating")
-        schem: mcschematic.MCSchematic = mcschematic.MCSchematic()
-        for x in range(-radius, radius + 1):
-            for z in range(-radius, radius + 1):
-                distance = math.sqrt(x**2 + z**2)
-                if filled:
-                    if distance <= radius:
-                        schem.setBlock((x + radius, 0, z + radius), block)
-                else:
-                    if radius - 1 <= distance <= radius + 1:
-                        schem.setBlock((x + radius, 0, z + radius), block)
-        return schem
+        if filled:
+            mask = disc_mask(radius**2, radius)
+        else:
+            mask = ring_mask((radius - 1) ** 2, (radius + 1) ** 2, radius)
+        return volume_to_schematic(mask[:, np.newaxis, :], [block])
@@ -1,9 +1,25 @@
 import math
+import numpy as np
 from schematicGenerator.inputs import IntInput, BoolInput, BlockInput
 from schematicGenerator.base_generator import BaseGenerator, GeneratorMetaData
+from schematicGenerator.volume import volume_to_schematic
+from schematicGenerator.raster import (
+    convex_polygon_spans,
+    regular_polygon_vertices,
+    subtract_spans,
+    spans_to_mask,
+)
 import mcschematic
 
 
+def exact_distance_to_edge(x, z, angle_step):
+    distance = math.sqrt(x**2 + z**2)
+    angle = math.atan2(z, x)
+    nearest_vertex = round(angle / angle_step)
+    angle_to_vertex = nearest_vertex * angle_step
+    return distance * math.cos(angle - angle_to_vertex)
+
+
 class PolygonGenerator(BaseGenerator):
     meta_data = GeneratorMetaData(
         description="Generates a regular polygon with a given number of sides and radius",
@@ -11,6 +27,10 @@ class PolygonGenerator(BaseGenerator):
         categories=["shapes"],
     )
 
+    @classmethod
+    def estimate_cost(cls, radius, **kwargs):
+        return (2 * radius + 1) ** 2
+
     @classmethod
     def generate(
         cls,
@@ -28,22 +48,22 @@ class PolygonGenerator(BaseGenerator):
             description="The block to use for the polygon",
         ),
     ) -> mcschematic.MCSchematic:
-        schem: mcschematic.MCSchematic = mcschematic.MCSchematic()
         angle_step = 2 * math.pi / sides
 
-        for x in range(-radius, radius + 1):
-            for z in range(-radius, radius + 1):
-                distance = math.sqrt(x**2 + z**2)
-                angle = math.atan2(z, x)
-                nearest_vertex = round(angle / angle_step)
-                angle_to_vertex = nearest_vertex * angle_step
-                distance_to_edge = distance * math.cos(angle - angle_to_vertex)
-
-                if filled:
-                    if distance_to_edge <= radius:
-                        schem.setBlock((x + radius, 0, z + radius), block)
-                else:
-                    if radius - 1 <= distance_to_edge <= radius + 1:
-                        schem.setBlock((x + radius, 0, z + radius), block)
-
-        return schem
+        # the polygon is scanned in floating point, cells at the ends of each row can sit
+        # right on an edge and are decided with the exact scalar formula
+        outer = radius if filled else radius + 1
+        spans = convex_polygon_spans(
+            regular_polygon_vertices(sides, outer),
+            bound=radius,
+            inside=lambda x, z: exact_distance_to_edge(x, z, angle_step) <= outer,
+        )
+        if not filled:
+            spans = subtract_spans(spans, convex_polygon_spans(
+                regular_polygon_vertices(sides, radius - 1),
+                bound=radius,
+                inside=lambda x, z: exact_distance_to_edge(x, z, angle_step) < radius - 1,
+            ))
+        mask = spans_to_mask(spans, radius)
+
+        return volume_to_schematic(mask[:, np.newaxis, :], [block])
@@ -0,0 +1,47 @@
+import numpy as np
+from schematicGenerator.inputs import IntInput, BoolInput, BlockInput
+from schematicGenerator.base_generator import BaseGenerator, GeneratorMetaData
+from schematicGenerator.schematic import SlabStream
+from schematicGenerator.raster import disc_mask, ring_mask
+
+
+class SphereGenerator(BaseGenerator):
+    meta_data = GeneratorMetaData(
+        description="Generates a sphere of a given radius and block",
+        categories=["shapes"],
+    )
+    streamed = True
+
+    @classmethod
+    def estimate_cost(cls, radius, **kwargs):
+        return (2 * radius + 1) ** 3
+
+    @classmethod
+    def generate(
+        cls,
+        radius: int = IntInput(
+            min_value=1, max_value=128, description="The radius of the sphere"
+        ),
+        filled: bool = BoolInput(
+            default=True, description="Whether the sphere should be filled or not"
+        ),
+        block: list = BlockInput(
+            default="minecraft:white_concrete",
+            description="The block to use for the sphere",
+        ),
+    ) -> SlabStream:
+        size = 2 * radius + 1
+        return SlabStream(
+            size, size, size, [block], cls.layers(radius, filled), origin=(-radius, -radius, -radius)
+        )
+
+    @classmethod
+    def layers(cls, radius, filled):
+        """Yield the sphere one y layer at a time, each layer is a disc or a ring."""
+        for y in range(-radius, radius + 1):
+            if filled:
+                mask = disc_mask(radius**2 - y**2, radius)
+            else:
+                mask = ring_mask((radius - 1) ** 2 - y**2, (radius + 1) ** 2 - y**2, radius)
+            yield mask[:, np.newaxis, :]
+            cls.report_progress((y + radius + 1) / (2 * radius + 1))
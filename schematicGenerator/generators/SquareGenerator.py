@@ -1,6 +1,8 @@
-import math
+import numpy as np
 from schematicGenerator.inputs import IntInput, BoolInput, BlockInput, StringInput
 from schematicGenerator.base_generator import BaseGenerator, GeneratorMetaData
+from schematicGenerator.volume import volume_to_schematic
+from schematicGenerator.raster import rectangle_spans, spans_to_mask
 import mcschematic
 
 
@@ -10,6 +12,10 @@ class SquareGenerator(BaseGenerator):
         author="Sloimy   ",
         categories=["shapes"],
     )
+    @classmethod
+    def estimate_cost(cls, side_length, **kwargs):
+        return (2 * side_length + 1) ** 2
+
     @classmethod
     def generate(
         cls,
@@ -25,12 +31,10 @@ class SquareGenerator(BaseGenerator):
         ),
     ) -> mcschematic.MCSchematic:
         print("Generating")
-        schem: mcschematic.MCSchematic = mcschematic.MCSchematic()
-        for x in range(-side_length, side_length + 1):
-            for z in range(-side_length, side_length + 1):
-                if filled:
-                    schem.setBlock((x + side_length, 0, z + side_length), block)
-                else:
-                    if side_length - 1 <= x <= side_length + 1 and side_length - 1 <= z <= side_length + 1:
-                        schem.setBlock((x + side_length, 0, z + side_length), block)
-        return schem
\ No newline at end of file
+        if filled:
+            spans = rectangle_spans(-side_length, side_length, -side_length, side_length)
+        else:
+            edge = (side_length - 1, side_length + 1)
+            spans = rectangle_spans(*edge, *edge, bound=side_length)
+        mask = spans_to_mask(spans, side_length)
+        return volume_to_schematic(mask[:, np.newaxis, :], [block])
\ No newline at end of file
@@ -1,15 +1,86 @@
+from schematicGenerator.blocks import get_registry, InvalidBlock
+
+
+class InputError(ValueError):
+    """Invalid input value, path locates it in the payload, like ("points", 12, "x")."""
+
+    def __init__(self, reason, path=()):
+        super().__init__(reason, path)
+        self.reason = reason
+        self.path = path
+
+    @classmethod
+    def wrap(cls, error):
+        return error if isinstance(error, cls) else cls(str(error))
+
+    def at(self, key):
+        """Return this error as seen from the container holding the value at key."""
+        return InputError(self.reason, (key,) + self.path)
+
+    def __str__(self):
+        if not self.path:
+            return self.reason
+        return f"{format_path(self.path)}: {self.reason}"
+
+
+def format_path(path):
+    """("points", 12, "x") -> points[12].x"""
+    text = ""
+    for key in path:
+        if isinstance(key, int):
+            text += f"[{key}]"
+        else:
+            text += f".{key}" if text else key
+    return text
+
+
+def allowed_set(allowed_values):
+    """Return allowed values as a frozenset for O(1) membership checks, unhashable ones stay a list."""
+    try:
+        return frozenset(allowed_values)
+    except TypeError:
+        return list(allowed_values)
+
+
+def is_allowed(value, allowed):
+    try:
+        return value in allowed
+    except TypeError:
+        # unhashable values can't be in a frozenset
+        return False
+
+
+def not_allowed_message(value, allowed_values):
+    return f"Value '{value}' is not allowed. Allowed values are: {', '.join(map(str, allowed_values))}"
 
 
 class BaseInput:
+    # inputs are compiled into a validator function on first use, they shouldn't change after that
+    _validator = None
+
     def __init__(self, default=None, description=""):
         self.default = default
         self.description = description
 
-    def validate(self, value):
+    def compile(self):
+        """Return a function validating a value, it raises InputError on invalid values."""
         raise NotImplementedError
 
+    def compiled(self):
+        """Return the validator function of this input, compiling it on first use."""
+        if self._validator is None:
+            if type(self).validate is not BaseInput.validate:
+                # inputs overriding validate instead of compile keep working inside arrays and dicts
+                self._validator = self.validate
+            else:
+                self._validator = self.compile()
+        return self._validator
+
+    def validate(self, value):
+        return self.compiled()(value)
+
     def to_dict(self):
-        data = {k: v for k, v in vars(self).items() if v is not None}
+        data = {k: v for k, v in vars(self).items() if v is not None and not k.startswith("_")}
         data["type"] = self.__class__.__name__
         return data
 
@@ -19,20 +90,29 @@ class IntInput(BaseInput):
         self.min_value = min_value
         self.max_value = max_value
 
-    def validate(self, value):
-        if not isinstance(value, int):
-            raise ValueError(f"Expected an integer, got {type(value)}")
-        if self.min_value is not None and value < self.min_value:
-            raise ValueError(f"Value should be >= {self.min_value}")
-        if self.max_value is not None and value > self.max_value:
-            raise ValueError(f"Value should be <= {self.max_value}")
-        return value
+    def compile(self):
+        min_value = self.min_value
+        max_value = self.max_value
+
+        def validate(value):
+            if not isinstance(value, int):
+                raise InputError(f"Expected an integer, got {type(value)}")
+            if min_value is not None and value < min_value:
+                raise InputError(f"Value should be >= {min_value}")
+            if max_value is not None and value > max_value:
+                raise InputError(f"Value should be <= {max_value}")
+            return value
+
+        return validate
 
 class BoolInput(BaseInput):
-    def validate(self, value):
-        if not isinstance(value, bool):
-            raise ValueError(f"Expected a boolean, got {type(value)}")
-        return value
+    def compile(self):
+        def validate(value):
+            if not isinstance(value, bool):
+                raise InputError(f"Expected a boolean, got {type(value)}")
+            return value
+
+        return validate
     
 # a set input only accepts values from a set
 # it isn't made to be used directly, but rather as a base class for other inputs like the BlockInput
@@ -41,11 +121,17 @@ class  SetInput(BaseInput):
         super().__init__(**kwargs)
         self.allowed_values = allowed_values
 
-    def validate(self, value):
-        if self.allowed_values is not None and value not in self.allowed_values:
-            raise ValueError(f"Value '{value}' is not allowed. Allowed values are: {', '.join(self.allowed_values)}")
+    def compile(self):
+        if self.allowed_values is None:
+            return lambda value: value
+        allowed = allowed_set(self.allowed_values)
+
+        def validate(value):
+            if not is_allowed(value, allowed):
+                raise InputError(not_allowed_message(value, self.allowed_values))
+            return value
 
-        return value
+        return validate
 
     def to_dict(self):
         data = super().to_dict()
@@ -56,7 +142,20 @@ class  SetInput(BaseInput):
     
 
 class BlockInput(BaseInput):
-    pass
+    """Block state, returned in its canonical form when the block registry knows the block."""
+
+    def compile(self):
+        parse = get_registry().parse
+
+        def validate(value):
+            if not isinstance(value, str):
+                raise InputError(f"Expected a block string, got {type(value).__name__}")
+            try:
+                return parse(value)[0]
+            except InvalidBlock as e:
+                raise InputError(str(e)) from None
+
+        return validate
 
 class StringInput(BaseInput):
     def __init__(self, min_length=None, max_length=None, allowed_values=None, **kwargs):
@@ -65,20 +164,27 @@ class StringInput(BaseInput):
         self.max_length = max_length
         self.allowed_values = allowed_values
 
-    def validate(self, value):
-        if not isinstance(value, str):
-            raise ValueError(f"Expected a string, got {type(value).__name__}")
+    def compile(self):
+        min_length = self.min_length
+        max_length = self.max_length
+        allowed = allowed_set(self.allowed_values) if self.allowed_values is not None else None
+
+        def validate(value):
+            if not isinstance(value, str):
+                raise InputError(f"Expected a string, got {type(value).__name__}")
+
+            if min_length is not None and len(value) < min_length:
+                raise InputError(f"String is too short. Minimum length is {min_length}")
 
-        if self.min_length is not None and len(value) < self.min_length:
-            raise ValueError(f"String is too short. Minimum length is {self.min_length}")
+            if max_length is not None and len(value) > max_length:
+                raise InputError(f"String is too long. Maximum length is {max_length}")
 
-        if self.max_length is not None and len(value) > self.max_length:
-            raise ValueError(f"String is too long. Maximum length is {self.max_length}")
+            if allowed is not None and value not in allowed:
+                raise InputError(not_allowed_message(value, self.allowed_values))
 
-        if self.allowed_values is not None and value not in self.allowed_values:
-            raise ValueError(f"Value '{value}' is not allowed. Allowed values are: {', '.join(self.allowed_values)}")
+            return value
 
-        return value
+        return validate
 
     def to_dict(self):
         data = super().to_dict()
@@ -99,27 +205,42 @@ class ArrayInput(BaseInput):
         self.min_length = min_length
         self.max_length = max_length
 
-    def validate(self, values):
-        if not isinstance(values, list):
-            raise ValueError(f"Expected a list, got {type(values).__name__}")
+    def compile(self):
+        element = self.element_type.compiled()
+        min_length = self.min_length
+        max_length = self.max_length
+        default = self.default
 
-        # Check min and max length constraints
-        if self.min_length is not None and len(values) < self.min_length:
-            # If default values are provided and can be used to fill up to min_length
-            if self.default and len(self.default) + len(values) >= self.min_length:
-                values.extend(self.default[len(values):self.min_length])
-            else:
-                raise ValueError(f"List is too short. Minimum length is {self.min_length}")
+        def validate(values):
+            if not isinstance(values, list):
+                raise InputError(f"Expected a list, got {type(values).__name__}")
 
-        if self.max_length is not None and len(values) > self.max_length:
-            raise ValueError(f"List is too long. Maximum length is {self.max_length}")
+            # Check min and max length constraints
+            if min_length is not None and len(values) < min_length:
+                # If default values are provided and can be used to fill up to min_length
+                if default and len(default) + len(values) >= min_length:
+                    # the request's list is left untouched
+                    values = values + default[len(values):min_length]
+                else:
+                    raise InputError(f"List is too short. Minimum length is {min_length}")
 
-        validated_values = []
-        for value in values:
-            validated_value = self.element_type.validate(value)
-            validated_values.append(validated_value)
+            if max_length is not None and len(values) > max_length:
+                raise InputError(f"List is too long. Maximum length is {max_length}")
 
-        return validated_values
+            try:
+                return [element(value) for value in values]
+            except ValueError as e:
+                error = e
+            # validators don't have side effects, the slow path runs again to find the failing index
+            for index, value in enumerate(values):
+                try:
+                    element(value)
+                except ValueError as e:
+                    raise InputError.wrap(e).at(index) from None
+            # the failure didn't happen again, it is reported without an index
+            raise InputError.wrap(error) from None
+
+        return validate
 
     def to_dict(self):
         data = super().to_dict()
@@ -137,22 +258,31 @@ class DictInput(BaseInput):
             raise TypeError("All values in input_dict must be instances of BaseInput or its subclasses")
         self.input_dict = input_dict
 
-    def validate(self, values):
-        if not isinstance(values, dict):
-            raise ValueError(f"Expected a dictionary, got {type(values).__name__}")
+    def compile(self):
+        fields = tuple(
+            (key, input_type.compiled(), input_type.default)
+            for key, input_type in self.input_dict.items()
+        )
+
+        def validate(values):
+            if not isinstance(values, dict):
+                raise InputError(f"Expected a dictionary, got {type(values).__name__}")
 
-        validated_values = {}
-        for key, input_type in self.input_dict.items():
-            if key not in values:
-                if input_type.default is not None:
-                    validated_values[key] = input_type.default
+            validated_values = {}
+            for key, field, default in fields:
+                if key in values:
+                    try:
+                        validated_values[key] = field(values[key])
+                    except ValueError as e:
+                        raise InputError.wrap(e).at(key) from None
+                elif default is not None:
+                    validated_values[key] = default
                 else:
-                    raise ValueError(f"Missing required key: {key}")
-            else:
-                validated_value = input_type.validate(values[key])
-                validated_values[key] = validated_value
+                    raise InputError(f"Missing required key: {key}")
+
+            return validated_values
 
-        return validated_values
+        return validate
 
     def to_dict(self):
         data = super().to_dict()
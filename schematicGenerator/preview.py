@@ -0,0 +1,162 @@
+"""Low resolution previews of schematics, much cheaper to produce and to send than the NBT.
+
+A preview is computed from the same blocks as the .schem, layer by layer from the
+bottom so a SlabStream never has more than one slab in memory. Columns of scale x scale
+blocks (and scale layers for voxels) are reduced to one cell which takes the highest
+palette index of its blocks, so any block shows up.
+
+Formats:
+- png: top-down view, the color of each cell's highest block shaded by its height,
+  empty cells are transparent. Rows go north to south (z), columns west to east (x).
+- rle: JSON voxels {"size", "scale", "origin", "palette", "runs"}, where runs is a flat
+  [palette index, count, ...] list of the cells ordered by y, then z, then x.
+"""
+import json
+import math
+import struct
+import zlib
+from hashlib import sha256
+
+import numpy as np
+
+from schematicGenerator.encoders import run_length_arrays
+from schematicGenerator.schematic import ArraySchematic, SlabStream, check_block_limit, mcschematic_blocks
+
+FORMATS = {"png": "image/png", "rle": "application/json"}
+
+DYE_COLORS = {
+    "white": (233, 236, 236), "orange": (240, 118, 19), "magenta": (189, 68, 179),
+    "light_blue": (58, 175, 217), "yellow": (248, 197, 39), "lime": (112, 185, 25),
+    "pink": (237, 141, 172), "gray": (62, 68, 71), "light_gray": (142, 142, 134),
+    "cyan": (21, 137, 145), "purple": (121, 42, 172), "blue": (53, 57, 157),
+    "brown": (114, 71, 40), "green": (84, 109, 27), "red": (161, 39, 34), "black": (20, 21, 25),
+}
+# first matching word of a block's name, when it has no dye color
+MATERIAL_COLORS = (
+    ("water", (63, 118, 228)), ("lava", (207, 92, 15)), ("leaves", (60, 120, 40)),
+    ("grass", (95, 159, 53)), ("glass", (192, 220, 230)), ("ice", (160, 190, 250)),
+    ("snow", (249, 254, 254)), ("sand", (219, 207, 163)), ("dirt", (134, 96, 67)),
+    ("quartz", (235, 229, 222)), ("brick", (150, 97, 83)), ("gold", (246, 208, 61)),
+    ("iron", (220, 220, 220)), ("diamond", (98, 237, 228)), ("copper", (192, 107, 79)),
+    ("oak", (162, 130, 78)), ("spruce", (114, 84, 48)), ("birch", (192, 175, 121)),
+    ("jungle", (160, 115, 80)), ("acacia", (168, 90, 50)), ("mangrove", (117, 54, 48)),
+    ("crimson", (101, 48, 70)), ("warped", (43, 104, 99)), ("obsidian", (15, 10, 24)),
+    ("netherrack", (97, 38, 38)), ("stone", (125, 125, 125)), ("deepslate", (80, 80, 82)),
+)
+
+
+def block_color(block):
+    """Return an approximate (r, g, b) color of a block state."""
+    name = block.partition("[")[0].partition("{")[0].rpartition(":")[2]
+    for dye in sorted(DYE_COLORS, key=len, reverse=True):
+        if name.startswith(dye + "_"):
+            return DYE_COLORS[dye]
+    words = name.split("_")
+    for material, color in MATERIAL_COLORS:
+        if material in words:
+            return color
+    # unknown blocks get a stable color of their own
+    return tuple(sha256(name.encode()).digest()[:3])
+
+
+def _pool(layer, scale):
+    """Reduce a [z, x] layer to cells of scale x scale blocks holding their highest value."""
+    if scale == 1:
+        return layer
+    length, width = layer.shape
+    padded = np.zeros((-(-length // scale) * scale, -(-width // scale) * scale), dtype=layer.dtype)
+    padded[:length, :width] = layer
+    return padded.reshape(padded.shape[0] // scale, scale, padded.shape[1] // scale, scale).max(axis=(1, 3))
+
+
+class _Reducer:
+    """Accumulates the layers of a schematic, bottom to top, into the preview's cells."""
+
+    def __init__(self, width, height, length, scale, voxels):
+        self.scale = scale
+        cells = (-(-length // scale), -(-width // scale))
+        self.heights = np.full(cells, -1, dtype=np.int32)
+        self.tops = np.zeros(cells, dtype=np.uint16)
+        self.voxels = np.zeros((-(-height // scale),) + cells, dtype=np.uint16) if voxels else None
+
+    def add(self, y, layer):
+        pooled = _pool(layer, self.scale)
+        occupied = pooled != 0
+        self.heights[occupied] = y
+        self.tops[occupied] = pooled[occupied]
+        if self.voxels is not None:
+            np.maximum(self.voxels[y // self.scale], pooled, out=self.voxels[y // self.scale])
+
+
+def render_preview(schem, preview_format, max_size, max_blocks=None):
+    """Return the preview bytes of a schematic, at most max_size cells wide and long."""
+    if isinstance(schem, SlabStream):
+        width, height, length = schem.width, schem.height, schem.length
+        origin, palette = schem.origin, list(schem.palette)
+        check_block_limit(width, height, length, max_blocks)
+        layers = (layer for slab in schem.palette_slabs() for layer in slab)
+    else:
+        if isinstance(schem, ArraySchematic):
+            blocks, origin, palette = schem._trimmed()
+        else:
+            blocks, origin, palette = mcschematic_blocks(schem)
+        height, length, width = blocks.shape
+        check_block_limit(width, height, length, max_blocks)
+        layers = iter(blocks)
+
+    scale = max(1, math.ceil(max(width, length) / max_size))
+    reducer = _Reducer(width, height, length, scale, voxels=preview_format == "rle")
+    for y, layer in enumerate(layers):
+        reducer.add(y, layer)
+
+    if preview_format == "png":
+        return encode_png(_colormap(reducer.heights, reducer.tops, palette))
+    return _encode_rle(reducer.voxels, scale, origin, palette)
+
+
+def _colormap(heights, tops, palette):
+    """Return the RGBA pixels of a top-down view, brighter where blocks are higher."""
+    colors = np.array([block_color(block) for block in palette], dtype=np.float32)
+    occupied = heights >= 0
+    pixels = np.zeros(heights.shape + (4,), dtype=np.uint8)
+    if occupied.any():
+        low, high = heights[occupied].min(), heights[occupied].max()
+        shade = 0.55 + 0.45 * (heights - low) / max(high - low, 1)
+        rgb = colors[tops] * shade[..., np.newaxis]
+        pixels[occupied, :3] = np.clip(rgb[occupied], 0, 255).astype(np.uint8)
+        pixels[occupied, 3] = 255
+    return pixels
+
+
+def _png_chunk(chunk_type, data):
+    return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+
+
+def encode_png(pixels):
+    """Encode [rows, columns, 4] RGBA pixels as a PNG."""
+    rows, columns, _ = pixels.shape
+    # every row starts with filter type 0, no filtering
+    scanlines = np.zeros((rows, columns * 4 + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.reshape(rows, columns * 4)
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", columns, rows, 8, 6, 0, 0, 0)),
+        _png_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+def run_lengths(values):
+    """Return the flat [value, count, ...] run-length encoding of an array."""
+    return np.column_stack(run_length_arrays(values)).ravel().tolist()
+
+
+def _encode_rle(voxels, scale, origin, palette):
+    height, length, width = voxels.shape
+    return json.dumps({
+        "size": [width, height, length],
+        "scale": scale,
+        "origin": list(origin),
+        "palette": palette,
+        "runs": run_lengths(voxels),
+    }, separators=(",", ":")).encode()
@@ -0,0 +1,233 @@
+"""Rasterization kernels for the shape generators, working on rows instead of every cell.
+
+Shapes mirrored on both axes (discs and rings) are described by the half width of each
+row, found with integer walks along their boundary, and turned into boolean
+[x + bound, z + bound] masks. Other shapes are produced as spans: (n, 3) integer arrays
+of (x, z0, z1) rows, each covering the cells (x, z0) to (x, z1) inclusive, in increasing
+x, and drawn with spans_to_mask. Cells with |x| or |z| above bound are clipped away.
+
+Finding the shape is O(rows), but the masks are still dense (2 * bound + 1)² grids, as
+volume_to_schematic and the schematic writers take: building, storing and encoding a
+shape stays O(area). What the kernels save is the per cell distance and trigonometry.
+"""
+import math
+
+import numpy as np
+
+# distance under which a float edge intersection is treated as touching a row
+EDGE_TOLERANCE = 1e-9
+# spans longer than this are drawn one slice at a time, shorter ones cell by cell in one go
+LONG_SPAN = 48
+
+
+def circle_half_widths(limit):
+    """Return h where h[x] is the largest z >= 0 with x² + z² <= limit, for x from 0 to isqrt(limit).
+
+    An integer midpoint walk over the first octant (x <= z), the rest is read back from
+    it by symmetry: (x, z) is in the disc exactly when (z, x) is.
+    """
+    if limit < 0:
+        return []
+    radius = math.isqrt(limit)
+    half_widths = [0] * (radius + 1)
+    x, z = 0, radius
+    while True:
+        while z >= x and x * x + z * z > limit:
+            z -= 1
+        if z < x:
+            break
+        half_widths[x] = z
+        x += 1
+    # past the diagonal, the widest column z reaching row x gives its half width
+    z = x - 1
+    for row in range(x, radius + 1):
+        while half_widths[z] < row:
+            z -= 1
+        half_widths[row] = z
+    return half_widths
+
+
+def _clip(spans, bound):
+    """Clip an (n, 3) span array to the bound and drop the spans left empty."""
+    if bound is not None:
+        spans = spans[(-bound <= spans[:, 0]) & (spans[:, 0] <= bound)]
+        np.maximum(spans[:, 1], -bound, out=spans[:, 1])
+        np.minimum(spans[:, 2], bound, out=spans[:, 2])
+    return spans[spans[:, 1] <= spans[:, 2]]
+
+
+def _span_array(spans):
+    return np.array(spans, dtype=np.int64).reshape(-1, 3)
+
+
+def _row_half_widths(half_widths, bound):
+    """Half width of every row from -bound to bound, -1 on the rows the shape doesn't reach."""
+    rows = np.full(2 * bound + 1, -1, dtype=np.int64)
+    count = min(len(half_widths), bound + 1)
+    widths = np.asarray(half_widths[:count], dtype=np.int64)
+    rows[bound:bound + count] = widths
+    rows[bound - count + 1:bound + 1] = widths[::-1]
+    return rows
+
+
+def half_widths_to_mask(half_widths, bound, hole_half_widths=()):
+    """Draw a shape mirrored on both axes into a boolean grid indexed [x + bound, z + bound].
+
+    Row x holds the cells with |z| <= half_widths[|x|] and, when a hole is given,
+    |z| > hole_half_widths[|x|]. The shape is known from its rows, the grid is filled with
+    one comparison per cell, cheaper than drawing spans for shapes this dense.
+    """
+    z = np.abs(np.arange(-bound, bound + 1))
+    mask = z <= _row_half_widths(half_widths, bound)[:, np.newaxis]
+    if len(hole_half_widths):
+        mask &= z > _row_half_widths(hole_half_widths, bound)[:, np.newaxis]
+    return mask
+
+
+def disc_mask(limit, bound):
+    """Cells with x² + z² <= limit."""
+    return half_widths_to_mask(circle_half_widths(limit), bound)
+
+
+def ring_mask(inner_limit, outer_limit, bound):
+    """Cells with inner_limit <= x² + z² <= outer_limit."""
+    return half_widths_to_mask(circle_half_widths(outer_limit), bound, circle_half_widths(inner_limit - 1))
+
+
+def rectangle_spans(x0, x1, z0, z1, bound=None):
+    x = np.arange(x0, x1 + 1)
+    return _clip(np.column_stack((x, np.full(len(x), z0), np.full(len(x), z1))), bound)
+
+
+def subtract_spans(spans, holes):
+    """Remove the cells of holes from spans."""
+    holes_by_row = {}
+    for x, z0, z1 in holes.tolist():
+        holes_by_row.setdefault(x, []).append((z0, z1))
+    result = []
+    for x, z0, z1 in spans.tolist():
+        for hole_start, hole_end in sorted(holes_by_row.get(x, ())):
+            if hole_end < z0 or hole_start > z1:
+                continue
+            if z0 < hole_start:
+                result.append((x, z0, hole_start - 1))
+            z0 = hole_end + 1
+        if z0 <= z1:
+            result.append((x, z0, z1))
+    return _span_array(result)
+
+
+def _runs(x, cells, inside):
+    """Spans of the cells of a row for which inside is true."""
+    start = None
+    for z in cells:
+        if inside(x, z):
+            if start is None:
+                start = z
+        elif start is not None:
+            yield x, start, z - 1
+            start = None
+    if start is not None:
+        yield x, start, cells[-1]
+
+
+def convex_polygon_spans(vertices, bound=None, inside=None):
+    """Scanline fill of a convex polygon given by its (x, z) vertices in order.
+
+    Spans hold the cells whose center is in the polygon. The edge crossings of every row
+    are computed at once in floating point. inside(x, z), when given, is the exact
+    membership test deciding the cells whose center lies within rounding error of an
+    edge, at the ends of the spans or on rows running along an edge.
+    """
+    xs = [vertex[0] for vertex in vertices]
+    first, last = math.floor(min(xs)) - 1, math.ceil(max(xs)) + 1
+    if bound is not None:
+        first, last = max(first, -bound), min(last, bound)
+    rows = np.arange(first, last + 1)
+    lows = np.full(len(rows), np.inf)
+    highs = np.full(len(rows), -np.inf)
+    # how far a crossing moves along z for a given error across its edge
+    low_slopes = np.zeros(len(rows))
+    high_slopes = np.zeros(len(rows))
+    along_edge = np.zeros(len(rows), dtype=bool)
+    for (px, pz), (qx, qz) in zip(vertices, vertices[1:] + vertices[:1]):
+        touching = (min(px, qx) - EDGE_TOLERANCE <= rows) & (rows <= max(px, qx) + EDGE_TOLERANCE)
+        if abs(qx - px) <= EDGE_TOLERANCE:
+            along_edge |= touching
+            low, high, slope = min(pz, qz), max(pz, qz), np.inf
+        else:
+            t = np.clip((rows - px) / (qx - px), 0.0, 1.0)
+            low = high = pz + t * (qz - pz)
+            slope = abs((qz - pz) / (qx - px))
+        lower = touching & (low < lows)
+        lows = np.where(lower, low, lows)
+        low_slopes = np.where(lower, slope, low_slopes)
+        higher = touching & (high > highs)
+        highs = np.where(higher, high, highs)
+        high_slopes = np.where(higher, slope, high_slopes)
+
+    crossed = np.isfinite(lows)
+    rows, lows, highs = rows[crossed], lows[crossed], highs[crossed]
+    z0s, z1s = np.ceil(lows).astype(np.int64), np.floor(highs).astype(np.int64)
+    if inside is None:
+        return _clip(np.column_stack((rows, z0s, z1s)), bound)
+
+    tolerance = 1e-6
+    uncertain_lows = np.abs(lows - np.round(lows)) <= tolerance * (1 + low_slopes[crossed])
+    uncertain_highs = np.abs(highs - np.round(highs)) <= tolerance * (1 + high_slopes[crossed])
+    spans = []
+    for x, z0, z1, uncertain_low, uncertain_high, along in zip(
+        rows.tolist(), z0s.tolist(), z1s.tolist(),
+        uncertain_lows.tolist(), uncertain_highs.tolist(), along_edge[crossed].tolist(),
+    ):
+        if along:
+            # the whole row is on the boundary, every cell is decided exactly
+            cells = range(z0 - 1, z1 + 2)
+            if bound is not None:
+                cells = range(max(cells.start, -bound), min(cells.stop, bound + 1))
+            if len(cells):
+                spans += _runs(x, cells, inside)
+            continue
+        # an uncertain end is off by less than a cell
+        if uncertain_low:
+            if inside(x, z0 - 1):
+                z0 -= 1
+            elif z0 <= z1 and not inside(x, z0):
+                z0 += 1
+        if uncertain_high:
+            if inside(x, z1 + 1):
+                z1 += 1
+            elif z0 <= z1 and not inside(x, z1):
+                z1 -= 1
+        spans.append((x, z0, z1))
+    return _clip(_span_array(spans), bound)
+
+
+def regular_polygon_vertices(sides, apothem):
+    """Vertices of the regular polygon whose edges face the angles 0, 2π / sides, ... at apothem."""
+    step = 2 * math.pi / sides
+    circumradius = apothem / math.cos(step / 2)
+    return [
+        (circumradius * math.cos((k + 0.5) * step), circumradius * math.sin((k + 0.5) * step))
+        for k in range(sides)
+    ]
+
+
+def spans_to_mask(spans, bound):
+    """Draw spans into a boolean grid indexed [x + bound, z + bound], covering -bound to bound.
+
+    Only the cells of the spans are written: long spans as row slices, the short ones
+    all at once with their cell indices.
+    """
+    mask = np.zeros((2 * bound + 1, 2 * bound + 1), dtype=bool)
+    lengths = spans[:, 2] - spans[:, 1] + 1
+    long_spans = lengths > LONG_SPAN
+    for x, z0, z1 in (spans[long_spans] + bound).tolist():
+        mask[x, z0:z1 + 1] = True
+    spans, lengths = spans[~long_spans], lengths[~long_spans]
+    rows = np.repeat(spans[:, 0] + bound, lengths)
+    # each cell's column: its span's start plus its rank in the span
+    first_cells = np.cumsum(lengths) - lengths
+    columns = np.arange(len(rows)) + np.repeat(spans[:, 1] + bound - first_cells, lengths)
+    mask[rows, columns] = True
+    return mask
@@ -0,0 +1,354 @@
+import gzip
+import os
+import struct
+
+import numpy as np
+
+from schematicGenerator.blocks import block_state
+
+AIR = "minecraft:air"
+# written in the Metadata compound of every schematic, like MCSchematic.save does
+GENERATED_BY = (
+    "Generated with love using Sloimay's MCSchematic Python Library, "
+    "itself dependant on Valentin Berlier's nbtlib library."
+)
+
+TAG_END = 0
+TAG_SHORT = 2
+TAG_INT = 3
+TAG_BYTE_ARRAY = 7
+TAG_STRING = 8
+TAG_LIST = 9
+TAG_COMPOUND = 10
+
+
+class TooManyBlocks(ValueError):
+    """Raised by the writers when a schematic holds more blocks than they are allowed to write."""
+
+
+def check_block_limit(width, height, length, max_blocks):
+    """Raise TooManyBlocks if a width x height x length region has more than max_blocks blocks."""
+    blocks = width * height * length
+    if max_blocks is not None and blocks > max_blocks:
+        raise TooManyBlocks(f"The schematic has {blocks} blocks, more than the limit of {max_blocks}")
+
+
+def encode_varints(values):
+    """Encode an array of non negative palette indices (< 2**21) as a varint byte string."""
+    values = np.asarray(values).ravel()
+    if not values.size or int(values.max()) < 0x80:
+        return values.astype(np.uint8).tobytes()
+
+    values = values.astype(np.uint32)
+    lengths = 1 + (values >= 1 << 7) + (values >= 1 << 14)
+    starts = np.cumsum(lengths) - lengths
+    encoded = np.empty(int(lengths.sum()), dtype=np.uint8)
+    encoded[starts] = (values & 0x7F) | ((lengths > 1) << 7)
+    two_bytes = lengths > 1
+    encoded[starts[two_bytes] + 1] = ((values[two_bytes] >> 7) & 0x7F) | ((lengths[two_bytes] > 2) << 7)
+    three_bytes = lengths > 2
+    encoded[starts[three_bytes] + 2] = values[three_bytes] >> 14
+    return encoded.tobytes()
+
+
+def encode_fixed_varints(values, width):
+    """Encode palette indices (< 2**14) as varints all padded to width bytes.
+
+    Readers decode the padding bytes as zero high bits, the encoded length of a block
+    count is then known before the blocks are.
+    """
+    values = np.asarray(values).ravel()
+    if width == 1:
+        return values.astype(np.uint8).tobytes()
+    values = values.astype(np.uint16)
+    encoded = np.empty((values.size, 2), dtype=np.uint8)
+    encoded[:, 0] = (values & 0x7F) | 0x80
+    encoded[:, 1] = values >> 7
+    return encoded.tobytes()
+
+
+def _tag_header(tag_type, name):
+    name = name.encode()
+    return struct.pack(">bH", tag_type, len(name)) + name
+
+
+def _int_tag(name, value):
+    return _tag_header(TAG_INT, name) + struct.pack(">i", value)
+
+
+def _string_tag(name, value):
+    value = value.encode()
+    return _tag_header(TAG_STRING, name) + struct.pack(">H", len(value)) + value
+
+
+def _short_tag(name, value):
+    # Sponge dimensions are unsigned shorts stored in a signed tag
+    return _tag_header(TAG_SHORT, name) + struct.pack(">h", value - 0x10000 if value > 0x7FFF else value)
+
+
+def _write_schematic_start(fileobj, version, offset, width, height, length, palette, block_data_size):
+    """Write every Sponge v2 tag up to the BlockData payload, which must follow."""
+    fileobj.write(_tag_header(TAG_COMPOUND, "Schematic"))
+    fileobj.write(_int_tag("Version", 2))
+    fileobj.write(_int_tag("DataVersion", version.value))
+    fileobj.write(_tag_header(TAG_COMPOUND, "Metadata"))
+    fileobj.write(_int_tag("WEOffsetX", offset[0]))
+    fileobj.write(_int_tag("WEOffsetY", offset[1]))
+    fileobj.write(_int_tag("WEOffsetZ", offset[2]))
+    fileobj.write(_tag_header(TAG_COMPOUND, "MCSchematicMetadata"))
+    fileobj.write(_string_tag("Generated", GENERATED_BY))
+    fileobj.write(bytes([TAG_END]))
+    fileobj.write(bytes([TAG_END]))
+    fileobj.write(_short_tag("Height", height))
+    fileobj.write(_short_tag("Length", length))
+    fileobj.write(_short_tag("Width", width))
+    fileobj.write(_int_tag("PaletteMax", len(palette)))
+    fileobj.write(_tag_header(TAG_COMPOUND, "Palette"))
+    for index, block in enumerate(palette):
+        fileobj.write(_int_tag(block, index))
+    fileobj.write(bytes([TAG_END]))
+    fileobj.write(_tag_header(TAG_BYTE_ARRAY, "BlockData") + struct.pack(">i", block_data_size))
+
+
+def _write_schematic_end(fileobj):
+    fileobj.write(_tag_header(TAG_LIST, "BlockEntities") + struct.pack(">bi", TAG_END, 0))
+    fileobj.write(bytes([TAG_END]))
+
+
+def write_sponge_v2(fileobj, version, blocks, offset, palette):
+    """Write the uncompressed Sponge v2 NBT of [y, z, x] palette indices whose blocks[0, 0, 0] is at offset."""
+    height, length, width = blocks.shape
+    block_data = encode_varints(blocks)
+    _write_schematic_start(fileobj, version, offset, width, height, length, palette, len(block_data))
+    fileobj.write(block_data)
+    _write_schematic_end(fileobj)
+
+
+def mcschematic_blocks(schem):
+    """Return the [y, z, x] palette indices, origin and palette of an MCSchematic."""
+    structure = schem.getStructure()
+    states = structure.getBlockStates()
+    if not states:
+        return np.zeros((1, 1, 1), dtype=np.uint16), (0, 0, 0), [AIR]
+    (x0, y0, z0), (x1, y1, z1) = structure.getBounds()
+    palette = [AIR]
+    remap = {}
+    for block, internal in structure.getInternalBlockPalette().items():
+        if not isinstance(block, str):
+            # the palette maps ids back to blocks too
+            continue
+        if block == AIR:
+            remap[internal] = 0
+        else:
+            remap[internal] = len(palette)
+            palette.append(block)
+    blocks = np.zeros((y1 - y0 + 1, z1 - z0 + 1, x1 - x0 + 1), dtype=np.uint16)
+    positions = np.array(list(states), dtype=np.int64)
+    indices = np.array([remap[internal] for internal in states.values()], dtype=np.uint16)
+    blocks[positions[:, 1] - y0, positions[:, 2] - z0, positions[:, 0] - x0] = indices
+    return blocks, (x0, y0, z0), palette
+
+
+class BlockPalette:
+    """Ordered list of block states where each state's position is its palette index, air is 0."""
+
+    __slots__ = ("blocks", "_indices")
+
+    def __init__(self, blocks=()):
+        self.blocks = [AIR]
+        self._indices = {AIR: 0}
+        for block in blocks:
+            self.index(block)
+
+    def index(self, block):
+        """Return the palette index of a block state string or a block registry state id, adding it if needed."""
+        index = self._indices.get(block)
+        if index is None:
+            if isinstance(block, int):
+                index = self._indices[block] = self.index(block_state(block))
+                return index
+            if block[-1] == "}":
+                raise ValueError(f"Block entities are not supported by ArraySchematic: {block}")
+            index = self._indices[block] = len(self.blocks)
+            self.blocks.append(block)
+        return index
+
+    def __getitem__(self, index):
+        return self.blocks[index]
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+
+class ArraySchematic:
+    """Compact schematic: a BlockPalette plus one uint16 palette index per block.
+
+    blocks is indexed [y, z, x], the order of the Sponge BlockData stream, and origin is
+    the world position of blocks[0, 0, 0]. It can be returned from BaseGenerator.generate
+    in place of an mcschematic.MCSchematic.
+    """
+
+    __slots__ = ("palette", "blocks", "origin")
+
+    def __init__(self, width, height, length, origin=(0, 0, 0)):
+        self.palette = BlockPalette()
+        self.blocks = np.zeros((height, length, width), dtype=np.uint16)
+        self.origin = tuple(origin)
+
+    @classmethod
+    def from_volume(cls, volume, palette, origin=(0, 0, 0)):
+        """Build a schematic from a volume indexed [x, y, z].
+
+        A boolean volume places palette[0] wherever it is True, an integer volume holds
+        palette indices where 0 is air and i places palette[i - 1].
+        """
+        volume = np.asarray(volume)
+        schem = cls.__new__(cls)
+        schem.palette = BlockPalette(palette)
+        schem.origin = tuple(origin)
+        indices = np.asarray([0] + [schem.palette.index(block) for block in palette], dtype=np.uint16)
+        if volume.dtype == bool:
+            volume = volume.astype(np.uint8)
+        schem.blocks = np.ascontiguousarray(indices[volume].transpose(1, 2, 0))
+        return schem
+
+    @property
+    def width(self):
+        return self.blocks.shape[2]
+
+    @property
+    def height(self):
+        return self.blocks.shape[0]
+
+    @property
+    def length(self):
+        return self.blocks.shape[1]
+
+    def _local(self, position):
+        x, y, z = (position[i] - self.origin[i] for i in range(3))
+        if not (0 <= x < self.width and 0 <= y < self.height and 0 <= z < self.length):
+            raise IndexError(f"Position {position} is outside of the schematic")
+        return y, z, x
+
+    def setBlock(self, position, blockData):
+        self.blocks[self._local(position)] = self.palette.index(blockData)
+
+    def getBlockStateAt(self, position):
+        return self.palette[self.blocks[self._local(position)]]
+
+    def block_count(self):
+        """Return the number of non air blocks."""
+        return int(np.count_nonzero(self.blocks))
+
+    def _trimmed(self):
+        """Return the non air bounding box of the blocks, its world offset and a compacted palette."""
+        occupied = self.blocks != 0
+        if not occupied.any():
+            return np.zeros((1, 1, 1), dtype=np.uint16), (0, 0, 0), [AIR]
+        bounds = []
+        for axis in range(3):
+            other_axes = tuple(a for a in range(3) if a != axis)
+            filled = np.flatnonzero(occupied.any(axis=other_axes))
+            bounds.append((filled[0], filled[-1] + 1))
+        (y0, y1), (z0, z1), (x0, x1) = bounds
+        blocks = self.blocks[y0:y1, z0:z1, x0:x1]
+        offset = (self.origin[0] + int(x0), self.origin[1] + int(y0), self.origin[2] + int(z0))
+
+        # drop palette entries that are not used anymore, keeping the order of the others
+        used = np.flatnonzero(np.bincount(blocks.ravel(), minlength=len(self.palette)))
+        used = np.union1d(used, [0])
+        remap = np.zeros(len(self.palette), dtype=np.uint16)
+        remap[used] = np.arange(len(used), dtype=np.uint16)
+        return remap[blocks], offset, [self.palette[i] for i in used]
+
+    def write_nbt(self, fileobj, version, max_blocks=None):
+        """Write the uncompressed Sponge v2 NBT of this schematic to a file object."""
+        blocks, offset, palette = self._trimmed()
+        height, length, width = blocks.shape
+        check_block_limit(width, height, length, max_blocks)
+        write_sponge_v2(fileobj, version, blocks, offset, palette)
+
+    def save(self, outputFolderPath, schemName, version):
+        """Save as <outputFolderPath>/<schemName>.schem, like MCSchematic.save."""
+        path = os.path.join(outputFolderPath, schemName + ".schem")
+        with gzip.open(path, "wb") as fileobj:
+            self.write_nbt(fileobj, version)
+
+
+class SlabStream:
+    """Schematic produced lazily, one slab of y layers at a time, to keep memory bounded.
+
+    slabs is an iterable of volumes indexed [x, y, z], boolean or holding palette indices
+    like in ArraySchematic.from_volume, whose heights add up to height. palette must be
+    known up front and list every block the slabs use. Unlike ArraySchematic the output
+    isn't trimmed to its non air blocks, it covers width x height x length from origin.
+    A generator can return one from generate, see BaseGenerator.streamed.
+    """
+
+    __slots__ = ("width", "height", "length", "palette", "slabs", "origin", "_indices", "_block_count")
+
+    def __init__(self, width, height, length, palette, slabs, origin=(0, 0, 0)):
+        self.width = width
+        self.height = height
+        self.length = length
+        self.palette = BlockPalette(palette)
+        self.slabs = slabs
+        self.origin = tuple(origin)
+        self._indices = np.asarray([0] + [self.palette.index(block) for block in palette], dtype=np.uint16)
+        self._block_count = None
+
+    def palette_slabs(self, max_blocks=None):
+        """Generate the slabs as palette indices indexed [y, z, x], checking they fit the schematic.
+
+        The slabs can only be generated once, by this or by write_nbt.
+        """
+        # checked before any slab is generated
+        check_block_limit(self.width, self.height, self.length, max_blocks)
+        written = 0
+        block_count = 0
+        for slab in self.slabs:
+            slab = np.asarray(slab)
+            if slab.shape[0] != self.width or slab.shape[2] != self.length:
+                raise ValueError(f"Slab of shape {slab.shape} doesn't match the schematic's width and length")
+            written += slab.shape[1]
+            if written > self.height:
+                raise ValueError(f"Slabs are higher than the schematic's height of {self.height}")
+            if slab.dtype == bool:
+                slab = slab.astype(np.uint8)
+            elif slab.size and int(slab.max()) >= len(self._indices):
+                raise ValueError("Slab uses a block that isn't in the palette")
+            slab = self._indices[slab]
+            block_count += int(np.count_nonzero(slab))
+            # Sponge orders BlockData by y, then z, then x
+            yield slab.transpose(1, 2, 0)
+        if written != self.height:
+            raise ValueError(f"Slabs cover {written} layers out of {self.height}")
+        self._block_count = block_count
+
+    def write_nbt(self, fileobj, version, max_blocks=None):
+        """Write the uncompressed Sponge v2 NBT, encoding BlockData slab by slab."""
+        check_block_limit(self.width, self.height, self.length, max_blocks)
+        if len(self.palette) > 1 << 14:
+            raise ValueError("A streamed schematic can't use more than 16384 block states")
+        # padding every varint to the same width gives the BlockData length before any slab
+        varint_width = 1 if len(self.palette) <= 0x80 else 2
+        _write_schematic_start(
+            fileobj, version, self.origin, self.width, self.height, self.length,
+            self.palette, self.width * self.height * self.length * varint_width,
+        )
+        for slab in self.palette_slabs():
+            fileobj.write(encode_fixed_varints(slab, varint_width))
+        _write_schematic_end(fileobj)
+
+    def block_count(self):
+        """Return the number of non air blocks, known once the slabs have been written."""
+        return self._block_count
+
+    def save(self, outputFolderPath, schemName, version):
+        """Save as <outputFolderPath>/<schemName>.schem, like MCSchematic.save."""
+        path = os.path.join(outputFolderPath, schemName + ".schem")
+        with gzip.open(path, "wb") as fileobj:
+            self.write_nbt(fileobj, version)
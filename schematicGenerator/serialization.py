@@ -0,0 +1,105 @@
+import io
+
+import mcschematic
+import nbtlib
+import numpy as np
+from nbtlib import File, Compound, Int, IntArray, Short, String, ByteArray, List
+
+from schematicGenerator.compression import DEFAULT_LEVEL, open_gzip
+from schematicGenerator.schematic import (
+    AIR, GENERATED_BY, ArraySchematic, SlabStream, check_block_limit, encode_varints,
+)
+
+DEFAULT_VERSION = mcschematic.Version.JE_1_19
+MIME_TYPE = "application/octet-stream"
+
+
+def encode_block_states(structure, dims, offset):
+    """Return the varint BlockData of an MCStructure, in Sponge's y, z, x order with its palette ids."""
+    blocks = np.zeros((dims[1], dims[2], dims[0]), dtype=np.uint32)
+    states = structure.getBlockStates()
+    if states:
+        positions = np.array(list(states), dtype=np.int64) - offset
+        blocks[positions[:, 1], positions[:, 2], positions[:, 0]] = list(states.values())
+    return encode_varints(blocks)
+
+
+def block_entity_compound(position, block_entity):
+    """Return the BlockEntities entry of a "id[states]{nbt}" block at a position relative to the schematic."""
+    nbt_start = block_entity.find("{")
+    states_start = block_entity.find("[")
+    id_end = nbt_start if states_start == -1 or nbt_start < states_start else states_start
+    compound = Compound()
+    compound.merge(nbtlib.parse_nbt(block_entity[nbt_start:]))
+    compound.merge(Compound({"Pos": IntArray(position)}))
+    compound.merge(Compound({"Id": String(block_entity[:id_end])}))
+    return compound
+
+
+def schematic_to_nbt(schem, version=DEFAULT_VERSION, max_blocks=None):
+    """Build the Sponge schematic NBT tree of an MCSchematic, the same way MCSchematic.save does.
+
+    Only the public accessors of mcschematic are used, its encoding helpers are private.
+    """
+    structure = schem.getStructure()
+    bounds = structure.getBounds()
+    dims = structure.getStructureDimensions(bounds)
+    check_block_limit(*dims, max_blocks)
+    offset = bounds[0]
+
+    palette = structure.getBlockPalette()
+    block_data = encode_block_states(structure, dims, offset)
+    block_entities = [
+        block_entity_compound(
+            (position[0] - offset[0], position[1] - offset[1], position[2] - offset[2]),
+            block_entity,
+        )
+        for position, block_entity in structure.getBlockEntities().items()
+    ]
+
+    return File({
+        "Version": Int(2),
+        "DataVersion": Int(version.value),
+        "Metadata": Compound({
+            "WEOffsetX": Int(offset[0]),
+            "WEOffsetY": Int(offset[1]),
+            "WEOffsetZ": Int(offset[2]),
+            "MCSchematicMetadata": Compound({"Generated": String(GENERATED_BY)}),
+        }),
+        "Height": Short(dims[1]),
+        "Length": Short(dims[2]),
+        "Width": Short(dims[0]),
+        "PaletteMax": Int(len(palette)),
+        "Palette": Compound(palette),
+        "BlockData": ByteArray(np.frombuffer(block_data, dtype=np.int8)),
+        "BlockEntities": List(block_entities),
+    }, gzipped=True, root_name="Schematic")
+
+
+def block_count(schem):
+    """Return the number of non air blocks of a schematic, after it has been written."""
+    if isinstance(schem, (ArraySchematic, SlabStream)):
+        return schem.block_count()
+    structure = schem.getStructure()
+    air = structure.getInternalBlockPalette().get(AIR)
+    return sum(1 for state in structure.getBlockStates().values() if state != air)
+
+
+def write_schematic(schem, fileobj, version=DEFAULT_VERSION, max_blocks=None, level=DEFAULT_LEVEL):
+    """Write the gzipped .schem of a schematic to a binary file object, as it is encoded.
+
+    level is the gzip compression level, 0 stores the NBT uncompressed.
+    Raises TooManyBlocks when the schematic has more than max_blocks blocks.
+    """
+    with open_gzip(fileobj, level) as gzip_file:
+        if isinstance(schem, (ArraySchematic, SlabStream)):
+            schem.write_nbt(gzip_file, version, max_blocks)
+        else:
+            schematic_to_nbt(schem, version, max_blocks).write(gzip_file)
+
+
+def serialize_schematic(schem, version=DEFAULT_VERSION, max_blocks=None, level=DEFAULT_LEVEL):
+    """Return the gzipped .schem bytes of a schematic without touching the disk."""
+    buffer = io.BytesIO()
+    write_schematic(schem, buffer, version, max_blocks, level)
+    return buffer.getvalue()
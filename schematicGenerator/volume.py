@@ -0,0 +1,34 @@
+import numpy as np
+import mcschematic
+
+from schematicGenerator.schematic import ArraySchematic
+
+
+def volume_to_schematic(volume, palette, origin=(0, 0, 0)):
+    """Turn a block volume into a schematic in a single pass.
+
+    volume is indexed [x, y, z]. A boolean volume places palette[0] wherever it is True,
+    an integer volume holds palette indices where 0 is air and i places palette[i - 1].
+    Returns an ArraySchematic, or an MCSchematic when the palette contains block entities.
+    """
+    if not any(block[-1] == "}" for block in palette):
+        return ArraySchematic.from_volume(volume, palette, origin)
+
+    # only mcschematic keeps block entity NBT, every block goes through its public setBlock
+    schem = mcschematic.MCSchematic()
+    volume = np.asarray(volume)
+    if volume.dtype == bool:
+        volume = volume.astype(np.uint8)
+
+    for index, block in enumerate(palette, start=1):
+        positions = np.nonzero(volume == index)
+        if not len(positions[0]):
+            continue
+        positions = zip(
+            (positions[0] + origin[0]).tolist(),
+            (positions[1] + origin[1]).tolist(),
+            (positions[2] + origin[2]).tolist(),
+        )
+        for position in positions:
+            schem.setBlock(position, block)
+    return schem
@@ -0,0 +1,189 @@
+import asyncio
+import base64
+import json
+import zipfile
+
+from sanic import response
+
+from . import settings, rate_limit, worker_pool
+from .result_cache import cache_key
+from .routes import generator_class_name, generate_cached, is_cached, quality_values, requested_format
+from hotloading.hotload_manager import GeneratorLoadError, resolve_generator, generators_version
+from schematicGenerator.encoders import variant_key
+
+
+class BatchJob:
+    def __init__(self, index, generator_name, generator_class=None, args=None, key=None, error=None):
+        self.index = index
+        self.generator_name = generator_name
+        self.generator_class = generator_class
+        self.args = args
+        self.key = key
+        self.error = error
+
+
+async def prepare_job(index, job):
+    """Resolve and validate one {generator, args} job, invalid jobs carry their error."""
+    if not isinstance(job, dict) or not isinstance(job.get("generator"), str):
+        return BatchJob(index, None, error="A job should be an object with a generator name and args")
+    generator_name = generator_class_name(job["generator"])
+    try:
+        generator_class = await resolve_generator(generator_name)
+    except GeneratorLoadError as e:
+        return BatchJob(index, generator_name, error=str(e))
+    if not generator_class:
+        return BatchJob(index, generator_name, error=f"Generator {generator_name} not found")
+    try:
+        args = generator_class.validate_inputs(**(job.get("args") or {}))
+    except Exception as e:
+        return BatchJob(index, generator_name, error=str(e))
+    return BatchJob(index, generator_name, generator_class, args, cache_key(generator_class, args))
+
+
+class ChunkWriter:
+    """Unseekable file object keeping what zipfile writes until it is sent."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class NdjsonEncoder:
+    content_type = "application/x-ndjson"
+
+    def __init__(self, encoder, version):
+        self.encoder = encoder
+        self.version = version
+
+    def encode(self, job, data):
+        line = {"index": job.index, "generator": job.generator_name}
+        if job.error is not None:
+            line["error"] = job.error
+        else:
+            line["args"] = job.args
+            line["etag"] = f'"{variant_key(job.key, self.encoder, self.version)}"'
+            line["schematic"] = base64.b64encode(data).decode()
+        return json.dumps(line).encode() + b"\n"
+
+    def close(self):
+        return b""
+
+
+class ZipEncoder:
+    content_type = "application/zip"
+
+    def __init__(self, encoder, version):
+        self.encoder = encoder
+        self.writer = ChunkWriter()
+        self.archive = zipfile.ZipFile(self.writer, "w", compression=zipfile.ZIP_STORED)
+
+    def encode(self, job, data):
+        name = f"{job.index:04d}-{job.generator_name}"
+        if job.error is not None:
+            self.archive.writestr(name + ".error.json", json.dumps({"error": job.error}))
+        else:
+            # gzipped formats aren't compressed again
+            compression = zipfile.ZIP_STORED if self.encoder.gzipped else zipfile.ZIP_DEFLATED
+            self.archive.writestr(name + self.encoder.extension, data, compress_type=compression)
+        return self.writer.pop()
+
+    def close(self):
+        self.archive.close()
+        return self.writer.pop()
+
+
+ARCHIVES = {"ndjson": NdjsonEncoder, "zip": ZipEncoder}
+
+
+def requested_archive(request):
+    """Return the archive of a batch: ?archive=, else zip when Accept prefers it to NDJSON.
+
+    ?format= and ?version= choose the encoding of the schematics inside, like for a single
+    generation. Raises ValueError for unknown archives.
+    """
+    name = request.args.get("archive")
+    if name is None:
+        qualities = dict(quality_values(request.headers.get("Accept", "")))
+        zip_quality = qualities.get(ZipEncoder.content_type, 0.0)
+        if zip_quality > 0 and zip_quality >= qualities.get(NdjsonEncoder.content_type, 0.0):
+            return ZipEncoder
+        return NdjsonEncoder
+    archive = ARCHIVES.get(name)
+    if archive is None:
+        raise ValueError(f"Unknown archive {name}, expected one of {', '.join(ARCHIVES)}")
+    return archive
+
+
+async def generate_batch(request):
+    body = request.json
+    jobs = body.get("jobs") if isinstance(body, dict) else body
+    if not isinstance(jobs, list):
+        return response.json({"error": "Expected a list of {generator, args} jobs"}, status=400)
+    if len(jobs) > settings.BATCH_MAX_JOBS:
+        return response.json(
+            {"error": f"A batch can't have more than {settings.BATCH_MAX_JOBS} jobs"}, status=413
+        )
+
+    try:
+        archive_class = requested_archive(request)
+        encoder, version = requested_format(request, negotiate=False)
+    except ValueError as e:
+        return response.json({"error": str(e)}, status=400)
+
+    # every job is validated before anything runs
+    jobs = [await prepare_job(index, job) for index, job in enumerate(jobs)]
+    try:
+        # the jobs answered from the cache aren't charged
+        cost = sum(
+            rate_limit.generation_cost(job.generator_class, job.args) for job in jobs
+            if job.error is None and not is_cached(job.key, encoder, version)
+        )
+        if cost:
+            await rate_limit.admit(request, "batch", cost)
+    except rate_limit.RateLimited as e:
+        return response.json({"error": str(e)}, status=429, headers={"Retry-After": str(e.retry_after)})
+    archive = archive_class(encoder, version)
+    # a batch keeps at most one job per pool worker in flight, leaving room for other requests
+    semaphore = asyncio.Semaphore(worker_pool.pool.size)
+
+    async def run(job):
+        async with semaphore:
+            try:
+                return job, await generate_cached(job.generator_class, job.args, job.key, encoder, version)
+            except Exception as e:
+                job.error = str(e) or type(e).__name__
+                return job, None
+
+    tasks = [asyncio.ensure_future(run(job)) for job in jobs if job.error is None]
+    try:
+        stream = await request.respond(
+            content_type=archive.content_type,
+            headers={"X-Generators-Version": generators_version()},
+        )
+        for job in jobs:
+            if job.error is not None:
+                await stream.send(archive.encode(job, None))
+        for task in asyncio.as_completed(tasks):
+            job, data = await task
+            await stream.send(archive.encode(job, data))
+        await stream.send(archive.close())
+        await stream.eof()
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,64 @@
+import gzip
+import hashlib
+import json
+import threading
+
+from hotloading import hotload_manager
+
+# how many catalog changes are remembered to answer ?since=<version> with a diff
+CHANGE_LOG_SIZE = 256
+
+
+def encode_json(data):
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+class CatalogSnapshot:
+    """Immutable, pre-encoded state of the /generators catalog."""
+
+    def __init__(self, version, generators):
+        self.version = version
+        self.generators = generators
+        self.body = encode_json([{name: data} for name, data in generators.items()])
+        self.gzipped = gzip.compress(self.body)
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+
+
+class Catalog:
+    """The /generators catalog, rebuilt only when the hot-load manager changes generators."""
+
+    def __init__(self):
+        self.snapshot = CatalogSnapshot(0, {})
+        self.changes = []  # (version, generator names) in increasing version order
+        self._lock = threading.Lock()
+
+    def rebuild(self, generator_names=()):
+        with self._lock:
+            version = self.snapshot.version + 1
+            generators = hotload_manager.generator_catalog()
+            self.changes.append((version, frozenset(generator_names)))
+            del self.changes[:-CHANGE_LOG_SIZE]
+            # swapping the reference keeps readers on a consistent snapshot
+            self.snapshot = CatalogSnapshot(version, generators)
+
+    def diff(self, since):
+        """Return the changes made after version since, or None if they are no longer known."""
+        snapshot = self.snapshot
+        changes = self.changes
+        if since > snapshot.version or not changes or since < changes[0][0] - 1:
+            return None
+        changed = set()
+        for version, names in changes:
+            if since < version <= snapshot.version:
+                changed |= names
+        return {
+            "version": snapshot.version,
+            "generators": [
+                {name: snapshot.generators[name]} for name in sorted(changed) if name in snapshot.generators
+            ],
+            "removed": sorted(name for name in changed if name not in snapshot.generators),
+        }
+
+
+catalog = Catalog()
+hotload_manager.add_change_listener(lambda action_type, names: catalog.rebuild(names))
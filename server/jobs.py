@@ -0,0 +1,259 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+
+from sanic import response
+
+from . import settings, websocket_routes, metrics, rate_limit
+from .websocket_routes import send_job
+from . import worker_pool
+from .worker_pool import run_generation, add_progress_listener, PoolSaturated, QueueTimeout
+from .result_cache import result_cache, cache_key
+from .routes import generator_class_name
+from hotloading.hotload_manager import GeneratorLoadError, resolve_generator
+from schematicGenerator.serialization import MIME_TYPE
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+class JobStore:
+    """Job records and their results, shared by every worker when the server runs several.
+
+    Records are plain dicts so they can live in a Manager dict, changes go through the
+    lock so a job can't be both started by its worker and cancelled from another one.
+    """
+
+    def __init__(self, jobs, results, lock):
+        self.jobs = jobs
+        self.results = results
+        self.lock = lock
+
+    @classmethod
+    def create(cls, manager):
+        return cls(manager.dict(), manager.dict(), manager.Lock())
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def result(self, job_id):
+        return self.results.get(job_id)
+
+    def add(self, job):
+        with self.lock:
+            self.jobs[job["id"]] = job
+
+    def update(self, job_id, statuses=None, **changes):
+        """Apply changes to a job, when statuses is given only if the job is in one of them.
+
+        Returns the updated record, or None if the job is unknown or in another status.
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or (statuses is not None and job["status"] not in statuses):
+                return None
+            job.update(changes)
+            self.jobs[job_id] = job
+            return job
+
+    def finish(self, job_id, status, result=None, **changes):
+        if result is not None:
+            self.results[job_id] = result
+        return self.update(job_id, status=status, finished=time.time(), **changes)
+
+    def prune(self):
+        """Forget the jobs that finished more than JOB_RETENTION seconds ago."""
+        deadline = time.time() - settings.JOB_RETENTION
+        with self.lock:
+            expired = [
+                job_id for job_id, job in self.jobs.items()
+                if job["finished"] is not None and job["finished"] < deadline
+            ]
+            for job_id in expired:
+                del self.jobs[job_id]
+                self.results.pop(job_id, None)
+
+
+store = JobStore({}, {}, threading.Lock())
+semaphore = None
+queued = 0
+local_jobs = set()  # ids of the unfinished jobs run by this worker
+
+
+def job_view(job):
+    view = dict(job)
+    if job["status"] == DONE:
+        view["result"] = f"/jobs/{job['id']}/result"
+    return view
+
+
+def job_event(job):
+    """Websocket message of a job's status or progress, without its arguments."""
+    view = job_view(job)
+    del view["args"]
+    return json.dumps({"type": "job", **view})
+
+
+def current_job_event(job_id):
+    job = store.get(job_id)
+    return None if job is None else job_event(job)
+
+
+websocket_routes.job_state = current_job_event
+
+
+def publish_job(job):
+    """Send a job's status or progress to the websocket clients following it."""
+    if job is not None:
+        send_job(job["id"], job_event(job))
+
+
+def on_progress(job_id, fraction, message):
+    publish_job(store.update(job_id, (RUNNING,), progress=fraction, message=message))
+
+
+add_progress_listener(on_progress)
+
+
+async def generate_job(generator_class, args, job_id):
+    # synchronous requests may fill the pool, a job waits for room instead of failing
+    while True:
+        try:
+            return await run_generation(generator_class, args, job_id=job_id)
+        except (PoolSaturated, QueueTimeout):
+            await asyncio.sleep(1)
+
+
+async def run_job(job_id, generator_class, args, key):
+    global queued
+    waiting = True
+    local_jobs.add(job_id)
+    try:
+        async with semaphore:
+            queued -= 1
+            waiting = False
+            job = store.update(job_id, (QUEUED,), status=RUNNING, started=time.time())
+            if job is None:
+                # cancelled while it was queued
+                return
+            publish_job(job)
+            try:
+                result = result_cache.get(key)
+                metrics.cache_requests.inc((generator_class.__name__, "miss" if result is None else "hit"))
+                if result is None:
+                    result = await generate_job(generator_class, args, job_id)
+                    result_cache.put(key, generator_class.__name__, result)
+            except Exception as e:
+                publish_job(store.finish(job_id, FAILED, error=str(e) or type(e).__name__))
+                return
+            publish_job(store.finish(job_id, DONE, result, progress=1.0, message=None))
+    finally:
+        if waiting:
+            queued -= 1
+        local_jobs.discard(job_id)
+
+
+async def submit_job(request, generator_name):
+    global queued
+    generator_name = generator_class_name(generator_name)
+    try:
+        generator_class = await resolve_generator(generator_name)
+    except GeneratorLoadError as e:
+        return response.json({"error": str(e)}, status=500)
+    if not generator_class:
+        return response.json(
+            {"error": f"Generator {generator_name} not found"}, status=404
+        )
+    try:
+        args = generator_class.validate_inputs(**(request.json or {}))
+    except Exception as e:
+        return response.json({"error": str(e)}, status=400)
+    if queued >= settings.JOB_QUEUE_SIZE:
+        return response.json({"error": "Too many jobs waiting, try again later"}, status=429)
+    key = cache_key(generator_class, args)
+    try:
+        # a job whose result is cached already costs nothing
+        if key not in result_cache:
+            await rate_limit.admit(request, generator_name, rate_limit.generation_cost(generator_class, args))
+    except rate_limit.RateLimited as e:
+        return response.json({"error": str(e)}, status=429, headers={"Retry-After": str(e.retry_after)})
+
+    job = {
+        "id": uuid.uuid4().hex,
+        "generator": generator_name,
+        "args": args,
+        "status": QUEUED,
+        "progress": 0.0,
+        "message": None,
+        "error": None,
+        "created": time.time(),
+        "started": None,
+        "finished": None,
+    }
+    store.prune()
+    store.add(job)
+    publish_job(job)
+    queued += 1
+    asyncio.ensure_future(run_job(job["id"], generator_class, args, key))
+    return response.json(job_view(job), status=202, headers={"Location": f"/jobs/{job['id']}"})
+
+
+async def job_status(request, job_id):
+    job = store.get(job_id)
+    if job is None:
+        return response.json({"error": f"Job {job_id} not found"}, status=404)
+    return response.json(job_view(job))
+
+
+async def job_result(request, job_id):
+    job = store.get(job_id)
+    if job is None:
+        return response.json({"error": f"Job {job_id} not found"}, status=404)
+    if job["status"] != DONE:
+        return response.json({"error": f"Job is {job['status']}"}, status=409)
+    filename = job["generator"] + ".schem"
+    return response.raw(
+        store.result(job_id),
+        content_type=MIME_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+async def cancel_job(request, job_id):
+    job = store.update(job_id, (QUEUED,), status=CANCELLED, finished=time.time())
+    if job is None:
+        job = store.get(job_id)
+        if job is None:
+            return response.json({"error": f"Job {job_id} not found"}, status=404)
+        return response.json({"error": f"Job is {job['status']}, only queued jobs can be cancelled"}, status=409)
+    publish_job(job)
+    return response.json(job_view(job))
+
+
+async def create_job_store(app, loop):
+    """Share the job store between workers, runs once in the main process after create_channel."""
+    shared_store = JobStore.create(websocket_routes.manager)
+    app.shared_ctx.jobs = shared_store.jobs
+    app.shared_ctx.job_results = shared_store.results
+    app.shared_ctx.jobs_lock = shared_store.lock
+
+
+async def start_jobs(app, loop):
+    global store, semaphore
+    semaphore = asyncio.Semaphore(worker_pool.pool.size)
+    jobs = getattr(app.shared_ctx, "jobs", None)
+    if jobs is not None:
+        store = JobStore(jobs, app.shared_ctx.job_results, app.shared_ctx.jobs_lock)
+
+
+async def stop_jobs(app, loop):
+    for job_id in list(local_jobs):
+        publish_job(store.update(
+            job_id, (QUEUED, RUNNING), status=FAILED, finished=time.time(),
+            error="The server stopped before the job finished",
+        ))
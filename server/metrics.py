@@ -0,0 +1,206 @@
+import asyncio
+import os
+import threading
+from bisect import bisect_left
+
+from sanic import response
+
+from . import websocket_routes
+from hotloading import hotload_manager
+
+# upper bounds (in seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# upper bounds of the block count histogram buckets
+BLOCK_BUCKETS = (10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000)
+# seconds between two publications of a worker's metrics to the other workers
+PUBLISH_INTERVAL = 5.0
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    """Monotonic value per label set.
+
+    aggregate says how the values of several workers are combined: "sum" for events
+    counted by a single worker, "max" for events every worker sees, like reloads.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, description, label_names, aggregate="sum"):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.aggregate = aggregate
+        self.values = {}  # label values -> value
+
+    def inc(self, labels, amount=1):
+        with _lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def merge(self, value, other):
+        return max(value, other) if self.aggregate == "max" else value + other
+
+    def samples(self, labels, value):
+        yield self.name + "_total", labels, value
+
+
+class Histogram:
+    """Distribution of observations per label set, as cumulative buckets, a sum and a count."""
+
+    kind = "histogram"
+    aggregate = "sum"
+
+    def __init__(self, name, description, label_names, buckets):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self.values = {}  # label values -> [per bucket counts..., +Inf count, sum]
+
+    def observe(self, labels, value):
+        with _lock:
+            counts = self.values.get(labels)
+            if counts is None:
+                counts = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def merge(self, value, other):
+        return [a + b for a, b in zip(value, other)]
+
+    def samples(self, labels, value):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ("+Inf",), value):
+            cumulative += count
+            yield self.name + "_bucket", labels + (("le", str(bound)),), cumulative
+        yield self.name + "_sum", labels, value[-1]
+        yield self.name + "_count", labels, cumulative
+
+
+_lock = threading.Lock()
+registry = []
+shared_snapshots = None  # worker name -> snapshot, when the server runs several workers
+_publisher = None
+
+
+def register(metric):
+    registry.append(metric)
+    return metric
+
+
+stage_seconds = register(Histogram(
+    "schem_stage_seconds",
+    "Time spent in each stage of a generation: validate, generate, serialize (or preview) and write.",
+    ("generator", "stage"),
+    LATENCY_BUCKETS,
+))
+output_blocks = register(Histogram(
+    "schem_output_blocks", "Non air blocks of the generated schematics.", ("generator",), BLOCK_BUCKETS
+))
+output_bytes = register(Counter(
+    "schem_output_bytes", "Bytes of serialized schematics produced.", ("generator",)
+))
+generations = register(Counter(
+    "schem_generations", "Generations by outcome.", ("generator", "outcome")
+))
+encodings = register(Counter(
+    "schem_encodings", "Encodings of cached volumes into other formats by outcome.", ("generator", "outcome")
+))
+cache_requests = register(Counter(
+    "schem_cache_requests", "Result cache lookups by result, hit or miss.", ("generator", "result")
+))
+rate_limited = register(Counter(
+    "schem_rate_limited", "Generations over their client's budget, delayed or rejected.", ("generator", "outcome")
+))
+reloads = register(Counter(
+    "schem_generator_reloads", "Hot-load changes applied, by action.", ("generator", "action"), aggregate="max"
+))
+
+
+def count_reloads(action_type, generator_names):
+    for name in generator_names:
+        reloads.inc((name, action_type))
+
+
+hotload_manager.add_change_listener(count_reloads)
+
+
+def snapshot():
+    """Return a picklable copy of the values of every metric."""
+    with _lock:
+        return {
+            metric.name: {labels: list(value) if isinstance(value, list) else value
+                          for labels, value in metric.values.items()}
+            for metric in registry
+        }
+
+
+def merge_snapshots(snapshots):
+    merged = {metric.name: {} for metric in registry}
+    for metric in registry:
+        values = merged[metric.name]
+        for worker_snapshot in snapshots:
+            for labels, value in worker_snapshot.get(metric.name, {}).items():
+                values[labels] = metric.merge(values[labels], value) if labels in values else value
+    return merged
+
+
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def render(values):
+    """Render merged metric values in the Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.description}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, value in sorted(values[metric.name].items()):
+            labels = tuple(zip(metric.label_names, labels))
+            for name, sample_labels, sample in metric.samples(labels, value):
+                label_text = ",".join(f'{key}="{escape(label)}"' for key, label in sample_labels)
+                lines.append(f"{name}{{{label_text}}} {sample}")
+    return "\n".join(lines) + "\n"
+
+
+def worker_name():
+    return os.environ.get("SANIC_WORKER_NAME") or str(os.getpid())
+
+
+def publish():
+    if shared_snapshots is not None:
+        shared_snapshots[worker_name()] = snapshot()
+
+
+async def publish_periodically():
+    while True:
+        await asyncio.sleep(PUBLISH_INTERVAL)
+        publish()
+
+
+async def metrics(request):
+    if shared_snapshots is None:
+        values = merge_snapshots([snapshot()])
+    else:
+        publish()
+        values = merge_snapshots(shared_snapshots.values())
+    return response.text(render(values), content_type=CONTENT_TYPE)
+
+
+async def create_metrics_store(app, loop):
+    """Create the dict workers publish their metrics to, runs once in the main process after create_channel."""
+    app.shared_ctx.metrics = websocket_routes.manager.dict()
+
+
+async def start_metrics(app, loop):
+    global shared_snapshots, _publisher
+    shared_snapshots = getattr(app.shared_ctx, "metrics", None)
+    if shared_snapshots is not None:
+        _publisher = asyncio.ensure_future(publish_periodically())
+
+
+async def stop_metrics(app, loop):
+    if _publisher is not None:
+        _publisher.cancel()
+        publish()
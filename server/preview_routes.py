@@ -0,0 +1,96 @@
+import asyncio
+import json
+
+from sanic import response
+
+from . import settings, rate_limit
+from .worker_pool import (
+    run_generation,
+    PoolSaturated,
+    QueueTimeout,
+    GenerationTimeout,
+    GenerationLimitExceeded,
+    WorkerCrashed,
+)
+from .result_cache import ResultCache, cache_key
+from .routes import generator_class_name, etag_matches, accepts_gzip
+from hotloading import hotload_manager
+from hotloading.hotload_manager import GeneratorLoadError, resolve_generator, generators_version
+from schematicGenerator.preview import FORMATS
+from schematicGenerator.compression import compress
+
+preview_cache = ResultCache(settings.PREVIEW_CACHE_BYTES, settings.PREVIEW_CACHE_ENTRIES)
+hotload_manager.add_change_listener(lambda action_type, names: preview_cache.invalidate(names))
+
+
+def query_arguments(request):
+    """Read generator inputs from the query string, each value is parsed as JSON when it can be.
+
+    ?radius=8&filled=false&block=red_wool gives {"radius": 8, "filled": False, "block": "red_wool"},
+    quote a value ("8") to pass it as a string.
+    """
+    args = {}
+    for name, values in request.args.items():
+        if name == "format":
+            continue
+        try:
+            args[name] = json.loads(values[-1])
+        except ValueError:
+            args[name] = values[-1]
+    return args
+
+
+async def preview(request, generator_name):
+    """Low resolution preview of a generation, a png top-down view or rle voxels (?format=)."""
+    generator_name = generator_class_name(generator_name)
+    try:
+        generator_class = await resolve_generator(generator_name)
+    except GeneratorLoadError as e:
+        return response.json({"error": str(e)}, status=500)
+    if not generator_class:
+        return response.json(
+            {"error": f"Generator {generator_name} not found"}, status=404
+        )
+    preview_format = request.args.get("format", "png")
+    if preview_format not in FORMATS:
+        return response.json(
+            {"error": f"Unknown preview format {preview_format}, expected one of {', '.join(FORMATS)}"},
+            status=400,
+        )
+
+    # png is compressed already, rle JSON is cached and sent gzipped to the clients accepting it
+    content_encoded = preview_format == "rle" and accepts_gzip(request)
+    try:
+        args = generator_class.validate_inputs(**query_arguments(request))
+        key = f"{cache_key(generator_class, args)}.{preview_format}.{settings.PREVIEW_MAX_SIZE}"
+        if content_encoded:
+            key += ".gzip"
+        etag = f'"{key}"'
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "X-Generators-Version": generators_version()}
+        if content_encoded:
+            headers["Content-Encoding"] = "gzip"
+        if etag_matches(request, etag):
+            return response.empty(status=304, headers={"ETag": etag, "Vary": "Accept-Encoding"})
+        result = preview_cache.get(key)
+        if result is None:
+            # only previews that have to be generated are charged
+            await rate_limit.admit(request, generator_name, rate_limit.generation_cost(generator_class, args))
+            result = await run_generation(generator_class, args, preview=preview_format)
+            if content_encoded:
+                result = await asyncio.to_thread(compress, result, settings.GZIP_LEVEL)
+            preview_cache.put(key, generator_name, result)
+        return response.raw(result, content_type=FORMATS[preview_format], headers=headers)
+    except PoolSaturated as e:
+        return response.json({"error": str(e)}, status=429)
+    except QueueTimeout as e:
+        return response.json({"error": str(e)}, status=503)
+    except rate_limit.RateLimited as e:
+        return response.json({"error": str(e)}, status=429, headers={"Retry-After": str(e.retry_after)})
+    except GenerationTimeout as e:
+        return response.json({"error": str(e), "limit": e.limit}, status=504)
+    except GenerationLimitExceeded as e:
+        return response.json({"error": str(e), "limit": e.limit}, status=422)
+    except WorkerCrashed as e:
+        return response.json({"error": str(e)}, status=500)
+    except Exception as e:
+        return response.json({"error": str(e)}, status=400)
@@ -0,0 +1,274 @@
+"""Pool of processes running one task at a time, each of them can die without affecting the others.
+
+The processes are plain subprocesses (python -m server.process_pool), not multiprocessing
+children, so they can be started from Sanic's daemonic workers. Tasks are sent pickled
+on their stdin, their messages, results and errors come back pickled on another pipe,
+leaving stdout and stderr to the code they run. Every frame is prefixed by its length.
+
+A task waiting for a process is a task that hasn't started, its time limits only start
+when a process picks it up. A process dying while running a task fails that task alone
+with ProcessDied and is replaced. A task sent to a process that died before reading it
+never started, it is sent to another process instead.
+"""
+import asyncio
+import os
+import pickle
+import signal
+import struct
+import sys
+import time
+
+FRAME_HEADER = struct.Struct("<Q")
+# times a task that never reached a process is sent to a new one
+RESUBMIT_ATTEMPTS = 3
+# seconds a process gets to start and pick up its task, imports included
+START_TIMEOUT = 60.0
+
+
+class ProcessDied(Exception):
+    """Raised when the process running a task died, after elapsed seconds of running it."""
+
+    def __init__(self, message, elapsed):
+        super().__init__(message)
+        self.elapsed = elapsed
+
+
+class QueueTimeout(Exception):
+    """Raised when no process was free to run a task within its queue timeout."""
+
+
+class _NotStarted(Exception):
+    """The process died before it read the task, the task can run somewhere else."""
+
+
+# frame writer of the current task process, set by serve
+_results = None
+
+
+def send_message(message):
+    """Send a message from a running task to the on_message callback of its run call."""
+    _write_frame(_results, ("message", message))
+
+
+def _write_frame(f, payload):
+    data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+    f.write(FRAME_HEADER.pack(len(data)))
+    f.write(data)
+    f.flush()
+
+
+def _read_frame(f):
+    header = f.read(FRAME_HEADER.size)
+    if len(header) < FRAME_HEADER.size:
+        return None
+    (size,) = FRAME_HEADER.unpack(header)
+    return pickle.loads(f.read(size))
+
+
+def _picklable(error):
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+def serve(result_fd):
+    """Main loop of a pool process: run the tasks read from stdin until it is closed."""
+    global _results
+    # the server handles Ctrl-C, it stops its processes itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _results = os.fdopen(result_fd, "wb")
+    tasks = sys.stdin.buffer
+    initializer, initargs = _read_frame(tasks) or (None, ())
+    if initializer is not None:
+        initializer(*initargs)
+    while (task := _read_frame(tasks)) is not None:
+        function, args = task
+        _write_frame(_results, ("started", None))
+        try:
+            outcome = ("result", function(*args))
+        except Exception as e:
+            outcome = ("error", _picklable(e))
+        try:
+            _write_frame(_results, outcome)
+        except Exception as e:
+            _write_frame(_results, ("error", _picklable(e)))
+
+
+class _Process:
+    """A pool process and the pipes to it."""
+
+    def __init__(self, process, reader):
+        self.process = process
+        self.reader = reader
+        self.tasks = 0
+
+    async def read_frame(self):
+        try:
+            header = await self.reader.readexactly(FRAME_HEADER.size)
+            (size,) = FRAME_HEADER.unpack(header)
+            return pickle.loads(await self.reader.readexactly(size))
+        except asyncio.IncompleteReadError:
+            return None
+
+    async def send(self, payload):
+        data = pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL)
+        self.process.stdin.write(FRAME_HEADER.pack(len(data)) + data)
+        await self.process.stdin.drain()
+
+    def kill(self):
+        if self.process.returncode is None:
+            self.process.kill()
+
+
+class ProcessPool:
+    """size processes, each running one task at a time, replaced after max_tasks_per_child tasks."""
+
+    def __init__(self, size, initializer=None, initargs=(), max_tasks_per_child=None):
+        self.size = size
+        self.initializer = initializer
+        self.initargs = initargs
+        self.max_tasks_per_child = max_tasks_per_child
+        self._idle = asyncio.Queue()
+        self._processes = set()
+        # replacements being spawned, close waits for them
+        self._replacing = set()
+        self._closed = False
+
+    async def start(self):
+        for _ in range(self.size):
+            self._idle.put_nowait(await self._spawn())
+
+    async def _spawn(self):
+        loop = asyncio.get_running_loop()
+        read_fd, write_fd = os.pipe()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, "-m", "server.process_pool", str(write_fd),
+                stdin=asyncio.subprocess.PIPE, pass_fds=(write_fd,),
+            )
+        finally:
+            os.close(write_fd)
+        reader = asyncio.StreamReader(limit=2 ** 20)
+        await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, "rb", 0))
+        worker = _Process(process, reader)
+        await worker.send((self.initializer, self.initargs))
+        self._processes.add(worker)
+        return worker
+
+    def _retire(self, worker, kill=False):
+        """Stop a process and start its replacement in the background."""
+        self._processes.discard(worker)
+        if kill:
+            worker.kill()
+        elif worker.process.stdin is not None:
+            worker.process.stdin.close()
+        if not self._closed:
+            replacement = asyncio.ensure_future(self._replace())
+            self._replacing.add(replacement)
+            replacement.add_done_callback(self._replacing.discard)
+
+    async def _replace(self):
+        try:
+            self._idle.put_nowait(await self._spawn())
+        except Exception as e:
+            print(f"Couldn't start a pool process: {e}")
+
+    async def run(self, function, args, kill_after, queue_timeout=None, on_message=None, on_done=None):
+        """Run function(*args) in a pool process and return its result, or raise its error.
+
+        queue_timeout bounds the wait for a free process (QueueTimeout), kill_after the
+        seconds the task may then run before its process is killed (ProcessDied). A task
+        cancelled while it runs keeps its process until it is done. on_done is called
+        once the task is over in its process, when it is cancelled too, or as soon as run
+        returns if it never reached one.
+        """
+        execution = None
+        try:
+            for _ in range(RESUBMIT_ATTEMPTS):
+                try:
+                    worker = await asyncio.wait_for(self._idle.get(), queue_timeout)
+                except asyncio.TimeoutError:
+                    raise QueueTimeout(f"No generator process was free within {queue_timeout} seconds") from None
+                execution = asyncio.ensure_future(self._execute(worker, function, args, kill_after, on_message))
+                # nobody reads the outcome of a task whose caller was cancelled
+                execution.add_done_callback(lambda done: done.cancelled() or done.exception())
+                try:
+                    return await asyncio.shield(execution)
+                except _NotStarted:
+                    continue
+            raise ProcessDied("The pool processes keep dying before they can run a task", 0.0)
+        finally:
+            if on_done is not None:
+                if execution is None or execution.done():
+                    on_done()
+                else:
+                    execution.add_done_callback(lambda done: on_done())
+
+    async def _execute(self, worker, function, args, kill_after, on_message):
+        started = None
+        healthy = False
+        try:
+            if worker.process.returncode is not None:
+                raise _NotStarted()
+            await worker.send((function, args))
+            while True:
+                timeout = START_TIMEOUT if started is None else max(0.0, started + kill_after - time.monotonic())
+                try:
+                    frame = await asyncio.wait_for(worker.read_frame(), timeout)
+                except asyncio.TimeoutError:
+                    worker.kill()
+                    if started is None:
+                        raise _NotStarted() from None
+                    raise ProcessDied(
+                        f"The process was killed after running for {kill_after} seconds",
+                        time.monotonic() - started,
+                    ) from None
+                if frame is None:
+                    if started is None:
+                        raise _NotStarted()
+                    raise ProcessDied("The generator process died", time.monotonic() - started)
+                kind, payload = frame
+                if kind == "started":
+                    started = time.monotonic()
+                elif kind == "message":
+                    if on_message is not None:
+                        try:
+                            on_message(payload)
+                        except Exception as e:
+                            print(f"Pool message handler failed: {e}")
+                else:
+                    healthy = True
+                    if kind == "error":
+                        raise payload
+                    return payload
+        except (BrokenPipeError, ConnectionResetError):
+            raise _NotStarted() from None
+        finally:
+            worker.tasks += 1
+            if not healthy or (self.max_tasks_per_child and worker.tasks >= self.max_tasks_per_child):
+                self._retire(worker, kill=not healthy)
+            elif self._closed:
+                self._retire(worker)
+            else:
+                self._idle.put_nowait(worker)
+
+    async def close(self):
+        """Stop every process, the running tasks are killed."""
+        self._closed = True
+        if self._replacing:
+            await asyncio.wait(list(self._replacing))
+        workers = list(self._processes)
+        while not self._idle.empty():
+            self._retire(self._idle.get_nowait())
+        for worker in list(self._processes):
+            self._retire(worker, kill=True)
+        if workers:
+            await asyncio.wait([asyncio.ensure_future(worker.process.wait()) for worker in workers], timeout=5)
+
+
+if __name__ == "__main__":
+    # the tasks import server.process_pool, which isn't this __main__ module
+    from server import process_pool
+    process_pool.serve(int(sys.argv[1]))
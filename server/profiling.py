@@ -0,0 +1,245 @@
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from functools import wraps
+
+from sanic import response
+
+from . import settings
+
+MODES = ("sample", "cprofile")
+# number of functions listed in a profile's summary
+TOP_FUNCTIONS = 25
+
+_profile_id = re.compile(r"[0-9a-f]{32}")
+
+
+class ProfilingForbidden(Exception):
+    """Raised when a request asks for a profile without a valid admin token."""
+
+
+class Sampler:
+    """Samples the stack of a thread at a fixed interval, from a background thread.
+
+    Frames above root, the frame the sampling started from, aren't recorded.
+    """
+
+    def __init__(self, thread_id, root, interval):
+        self.thread_id = thread_id
+        self.root = root
+        self.interval = interval
+        self.stacks = Counter()  # collapsed stack -> number of samples
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                stack.append(frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+def frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def top_from_samples(stacks, interval):
+    """Return the functions found in the most samples, with their estimated self and total seconds."""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        frames = stack.split(";")
+        own[frames[-1]] += count
+        for name in set(frames):
+            total[name] += count
+    return [
+        {"function": name, "self": own[name] * interval, "total": count * interval, "samples": count}
+        for name, count in total.most_common(TOP_FUNCTIONS)
+    ]
+
+
+def top_from_stats(stats):
+    """Return the functions with the most own time of a pstats.Stats."""
+    functions = [
+        {
+            "function": f"{name} ({os.path.basename(filename)}:{line})",
+            "calls": calls,
+            "self": own_time,
+            "total": total_time,
+        }
+        for (filename, line, name), (_, calls, own_time, total_time, _) in stats.stats.items()
+    ]
+    functions.sort(key=lambda function: function["self"], reverse=True)
+    return functions[:TOP_FUNCTIONS]
+
+
+def profile_call(mode, func, *args):
+    """Call func under the given profiler, returns its result and the raw profile.
+
+    The profile is a dict with the mode, the duration and, depending on the mode, the
+    sampled collapsed stacks or the cProfile profiler.
+    """
+    start = time.perf_counter()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        result = profiler.runcall(func, *args)
+        return result, {"mode": mode, "duration": time.perf_counter() - start, "profiler": profiler}
+
+    sampler = Sampler(threading.get_ident(), sys._getframe(), settings.PROFILE_SAMPLE_INTERVAL)
+    sampler.start()
+    try:
+        result = func(*args)
+    finally:
+        sampler.stop()
+    return result, {"mode": mode, "duration": time.perf_counter() - start, "stacks": sampler.stacks}
+
+
+def profile_path(profile_id, extension):
+    return os.path.join(settings.PROFILE_DIR, profile_id + extension)
+
+
+def save_profile(profile_id, generator_name, args, profile, trigger):
+    """Store a profile as <id>.json with a .folded (sampled) or .prof (cProfile) companion."""
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    summary = {
+        "id": profile_id,
+        "generator": generator_name,
+        "args": args,
+        "mode": profile["mode"],
+        "trigger": trigger,
+        "duration": profile["duration"],
+        "created": time.time(),
+    }
+    if profile["mode"] == "cprofile":
+        profile["profiler"].dump_stats(profile_path(profile_id, ".prof"))
+        summary["top"] = top_from_stats(pstats.Stats(profile["profiler"]))
+    else:
+        with open(profile_path(profile_id, ".folded"), "w") as f:
+            f.writelines(f"{stack} {count}\n" for stack, count in profile["stacks"].items())
+        summary["samples"] = sum(profile["stacks"].values())
+        summary["top"] = top_from_samples(profile["stacks"], settings.PROFILE_SAMPLE_INTERVAL)
+    with open(profile_path(profile_id, ".json"), "w") as f:
+        json.dump(summary, f)
+    prune_profiles()
+
+
+def prune_profiles():
+    """Remove the oldest profiles beyond PROFILE_KEEP."""
+    summaries = sorted(
+        (entry for entry in os.scandir(settings.PROFILE_DIR) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in summaries[:-settings.PROFILE_KEEP]:
+        profile_id = entry.name[:-len(".json")]
+        for extension in (".json", ".folded", ".prof"):
+            try:
+                os.remove(profile_path(profile_id, extension))
+            except FileNotFoundError:
+                pass
+
+
+def is_admin(request):
+    token = request.headers.get("X-Admin-Token")
+    return bool(settings.ADMIN_TOKEN and token) and hmac.compare_digest(token, settings.ADMIN_TOKEN)
+
+
+def requested_mode(request):
+    """Return the profiler a request asks for with ?profile= or X-Profile, or None.
+
+    Raises ProfilingForbidden unless the request carries the admin token.
+    """
+    mode = request.args.get("profile") or request.headers.get("X-Profile")
+    if not mode:
+        return None
+    if not is_admin(request):
+        raise ProfilingForbidden("Profiling requires a valid X-Admin-Token")
+    if mode not in MODES:
+        raise ValueError(f"Unknown profiler {mode}, expected one of {', '.join(MODES)}")
+    return mode
+
+
+def new_profile_id():
+    return uuid.uuid4().hex
+
+
+def admin_only(handler):
+    @wraps(handler)
+    async def wrapper(request, *args, **kwargs):
+        if not is_admin(request):
+            return response.json({"error": "This endpoint requires a valid X-Admin-Token"}, status=403)
+        return await handler(request, *args, **kwargs)
+
+    return wrapper
+
+
+def read_summary(profile_id):
+    if not _profile_id.fullmatch(profile_id):
+        return None
+    try:
+        with open(profile_path(profile_id, ".json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+@admin_only
+async def list_profiles(request):
+    summaries = []
+    if os.path.isdir(settings.PROFILE_DIR):
+        for entry in os.scandir(settings.PROFILE_DIR):
+            if entry.name.endswith(".json"):
+                summary = read_summary(entry.name[:-len(".json")])
+                if summary is not None:
+                    summary.pop("top", None)
+                    summaries.append(summary)
+    summaries.sort(key=lambda summary: summary["created"], reverse=True)
+    return response.json(summaries)
+
+
+@admin_only
+async def get_profile(request, profile_id):
+    summary = read_summary(profile_id)
+    if summary is None:
+        return response.json({"error": f"Profile {profile_id} not found"}, status=404)
+    return response.json(summary)
+
+
+@admin_only
+async def get_profile_stacks(request, profile_id):
+    """Collapsed stacks of a sampled profile, the input of flamegraph.pl or speedscope."""
+    summary = read_summary(profile_id)
+    if summary is None or summary["mode"] != "sample":
+        return response.json({"error": f"Sampled profile {profile_id} not found"}, status=404)
+    return await response.file(profile_path(profile_id, ".folded"), mime_type="text/plain")
+
+
+@admin_only
+async def get_profile_stats(request, profile_id):
+    """pstats dump of a cProfile profile, readable with pstats or snakeviz."""
+    summary = read_summary(profile_id)
+    if summary is None or summary["mode"] != "cprofile":
+        return response.json({"error": f"cProfile profile {profile_id} not found"}, status=404)
+    return await response.file(
+        profile_path(profile_id, ".prof"),
+        mime_type="application/octet-stream",
+        filename=profile_id + ".prof",
+    )
@@ -0,0 +1,125 @@
+"""Per-client admission control of the generations, with token buckets.
+
+Every client, a known API key or else an address, has a bucket of RATE_LIMIT_BURST
+blocks refilled with RATE_LIMIT_BLOCKS blocks a second. A generation costs the blocks
+its generator estimates from the validated inputs, see BaseGenerator.estimate_cost. Only
+generations that actually run are charged, results answered from the caches are free. A
+request the bucket can't pay for right away waits for its tokens when they come within
+RATE_LIMIT_MAX_WAIT seconds, it is rejected with RateLimited otherwise.
+"""
+import asyncio
+import math
+import threading
+import time
+
+from . import settings, websocket_routes, metrics
+
+# seconds between two passes forgetting the buckets that filled up again
+PRUNE_INTERVAL = 60.0
+
+
+class RateLimited(Exception):
+    """Raised when a client's bucket can't pay for a request within RATE_LIMIT_MAX_WAIT seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Too many generations, try again in {retry_after} seconds")
+        self.retry_after = retry_after
+
+
+class BucketStore:
+    """Token buckets of the clients, shared by every worker when the server runs several.
+
+    A bucket is a (tokens, time.monotonic() of its last update) pair, tokens are only
+    brought up to date when the bucket is used.
+    """
+
+    def __init__(self, buckets, lock):
+        self.buckets = buckets
+        self.lock = lock
+        self.pruned = time.monotonic()
+
+    @classmethod
+    def create(cls, manager):
+        return cls(manager.dict(), manager.Lock())
+
+    def take(self, client, cost, now):
+        """Take cost tokens from a client's bucket and return the seconds to wait for them.
+
+        Tokens that have to be waited for are taken all the same, the bucket goes below
+        zero and the next requests of the client wait behind this one. Nothing is taken
+        when the wait is longer than RATE_LIMIT_MAX_WAIT.
+        """
+        rate, burst = settings.RATE_LIMIT_BLOCKS, settings.RATE_LIMIT_BURST
+        with self.lock:
+            tokens, updated = self.buckets.get(client, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate)
+            wait = max(0.0, (cost - tokens) / rate)
+            if wait <= settings.RATE_LIMIT_MAX_WAIT:
+                tokens -= cost
+            self.buckets[client] = (tokens, now)
+        return wait
+
+    def prune(self, now):
+        """Forget the buckets that are full again, a full bucket is the same as none."""
+        rate, burst = settings.RATE_LIMIT_BLOCKS, settings.RATE_LIMIT_BURST
+        with self.lock:
+            full = [
+                client for client, (tokens, updated) in self.buckets.items()
+                if tokens + (now - updated) * rate >= burst
+            ]
+            for client in full:
+                del self.buckets[client]
+        self.pruned = now
+
+
+store = BucketStore({}, threading.Lock())
+
+
+def client_key(request):
+    """Return the bucket of a request: its API key if it is one of RATE_LIMIT_API_KEYS, else its address."""
+    api_key = request.headers.get("X-Api-Key")
+    if api_key and api_key in settings.RATE_LIMIT_API_KEYS:
+        return "key:" + api_key
+    return "address:" + (request.remote_addr or request.ip)
+
+
+def generation_cost(generator_class, args):
+    """Return the blocks a generation of validated arguments is charged, at least RATE_LIMIT_MIN_COST."""
+    cost = generator_class.estimate_cost(**args)
+    if cost is None:
+        cost = settings.RATE_LIMIT_DEFAULT_COST
+    return max(cost, settings.RATE_LIMIT_MIN_COST)
+
+
+async def admit(request, generator_name, cost):
+    """Charge cost blocks to the client of a request, waiting for them when the bucket is short.
+
+    A request never costs more than a full bucket. Raises RateLimited when the tokens
+    would take longer than RATE_LIMIT_MAX_WAIT seconds to come, nothing is charged then.
+    """
+    if not settings.RATE_LIMIT_BLOCKS:
+        return
+    now = time.monotonic()
+    if now - store.pruned > PRUNE_INTERVAL:
+        store.prune(now)
+    wait = store.take(client_key(request), min(cost, settings.RATE_LIMIT_BURST), now)
+    if wait > settings.RATE_LIMIT_MAX_WAIT:
+        metrics.rate_limited.inc((generator_name, "rejected"))
+        raise RateLimited(math.ceil(wait))
+    if wait > 0:
+        metrics.rate_limited.inc((generator_name, "delayed"))
+        await asyncio.sleep(wait)
+
+
+async def create_rate_limit_store(app, loop):
+    """Share the buckets between workers, runs once in the main process after create_channel."""
+    shared_store = BucketStore.create(websocket_routes.manager)
+    app.shared_ctx.rate_limit_buckets = shared_store.buckets
+    app.shared_ctx.rate_limit_lock = shared_store.lock
+
+
+async def start_rate_limit(app, loop):
+    global store
+    buckets = getattr(app.shared_ctx, "rate_limit_buckets", None)
+    if buckets is not None:
+        store = BucketStore(buckets, app.shared_ctx.rate_limit_lock)
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from hotloading import hotload_manager
+from server import settings
+
+
+def cache_key(generator_class, validated_args):
+    """Return the content address of a generation: generator, module source and canonical inputs."""
+    module_name = hotload_manager.generator_modules.get(generator_class.__name__)
+    source_hash = hotload_manager.module_hashes.get(module_name, "")
+    canonical_args = json.dumps(validated_args, sort_keys=True, separators=(",", ":"))
+    key_source = f"{generator_class.__name__}:{source_hash}:{canonical_args}"
+    return hashlib.sha256(key_source.encode()).hexdigest()
+
+
+class ResultCache:
+    """LRU cache of serialized results, bounded both in entries and in total bytes."""
+
+    def __init__(self, max_bytes, max_entries):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (generator name, data)
+        # hot reloads invalidate from the watchdog thread
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def put(self, key, generator_name, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (generator_name, data)
+            self.size += len(data)
+            while self.size > self.max_bytes or len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, generator_names):
+        """Drop every entry produced by one of the given generators."""
+        with self._lock:
+            stale = [key for key, (name, _) in self._entries.items() if name in generator_names]
+            for key in stale:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+result_cache = ResultCache(settings.RESULT_CACHE_BYTES, settings.RESULT_CACHE_ENTRIES)
+hotload_manager.add_change_listener(lambda action_type, names: result_cache.invalidate(names))
+# run-length volumes of generations, by the generation's key, see schematicGenerator.encoders
+volume_cache = ResultCache(settings.VOLUME_CACHE_BYTES, settings.VOLUME_CACHE_ENTRIES)
+hotload_manager.add_change_listener(lambda action_type, names: volume_cache.invalidate(names))
@@ -1,19 +1,245 @@
+import asyncio
+import os
+import tempfile
+import time
 from sanic import response
-from .websocket_routes import queue
-from hotloading.hotload_manager import generators_dict
-import mcschematic
+from .worker_pool import (
+    run_generation,
+    run_encoding,
+    PoolSaturated,
+    QueueTimeout,
+    GenerationTimeout,
+    GenerationLimitExceeded,
+    WorkerCrashed,
+)
+from . import settings, metrics, profiling, rate_limit
+from .result_cache import result_cache, volume_cache, cache_key
+from .catalog import catalog
+from hotloading.hotload_manager import GeneratorLoadError, resolve_generator, generators_version
+from schematicGenerator.serialization import DEFAULT_VERSION, MIME_TYPE
+from schematicGenerator.encoders import DEFAULT_FORMAT, ENCODERS, MEDIA_TYPES, parse_version, variant_key
+from schematicGenerator.compression import check_level, compress
+
+
+class FormatNotAcceptable(Exception):
+    """Raised when none of the media types of an Accept header is an available format."""
+
+
+def etag_matches(request, etag):
+    """Check whether the request's If-None-Match header matches the given ETag."""
+    if_none_match = request.headers.get("If-None-Match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+def accepts_gzip(request):
+    """Check whether the Accept-Encoding header allows gzip, by name, as x-gzip or through *.
+
+    Codings listed with q=0 are refused, an explicit gzip entry wins over *.
+    """
+    qualities = {}
+    for coding, quality in quality_values(request.headers.get("Accept-Encoding", "")):
+        if coding == "x-gzip":
+            coding = "gzip"
+        qualities[coding] = max(qualities.get(coding, 0.0), quality)
+    quality = qualities.get("gzip", qualities.get("*", 0.0))
+    return quality > 0
 
 async def list_generators(request):
-    generators = [{k: v.to_dict()} for k, v in generators_dict.items()]
-    return response.json(generators)
+    snapshot = catalog.snapshot
+    headers = {
+        "ETag": snapshot.etag,
+        "X-Catalog-Version": str(snapshot.version),
+        "X-Generators-Version": generators_version(),
+        "Vary": "Accept-Encoding",
+    }
 
-async def generate(request, generator_name):
+    since = request.args.get("since")
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return response.json({"error": "since should be a catalog version"}, status=400)
+        if since == snapshot.version:
+            return response.empty(status=304, headers=headers)
+        diff = catalog.diff(since)
+        if diff is not None:
+            return response.json(diff, headers=headers)
+    elif etag_matches(request, snapshot.etag):
+        return response.empty(status=304, headers=headers)
+
+    if accepts_gzip(request):
+        headers["Content-Encoding"] = "gzip"
+        return response.raw(snapshot.gzipped, content_type="application/json", headers=headers)
+    return response.raw(snapshot.body, content_type="application/json", headers=headers)
+
+def generator_class_name(generator_name):
     # convert generator_name to class name 
     # e.g. circle-generator -> CircleGenerator
-    generator_name = "".join(
+    return "".join(
         [word.capitalize() for word in generator_name.split("-")]
     )
-    generator_class = generators_dict.get(generator_name)
+
+def quality_values(header):
+    """Yield the (value, quality) pairs of an Accept style header, values lowercased."""
+    for item in header.split(","):
+        value, *parameters = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for parameter in parameters:
+            name, _, quality_value = parameter.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(quality_value)
+                except ValueError:
+                    quality = 0.0
+        if value:
+            yield value.lower(), quality
+
+def accepted_encoder(accept):
+    """Return the encoder of the preferred media type of an Accept header, schem when there is none.
+
+    Wildcards stand for schem, a specific media type wins over a wildcard of the same quality.
+    """
+    if not accept:
+        return ENCODERS[DEFAULT_FORMAT]
+    best, best_rank = None, None
+    for media_type, quality in quality_values(accept):
+        wildcard = media_type in ("*/*", "application/*")
+        encoder = ENCODERS[DEFAULT_FORMAT] if wildcard else MEDIA_TYPES.get(media_type)
+        rank = (quality, not wildcard)
+        if encoder is not None and quality > 0 and (best_rank is None or rank > best_rank):
+            best, best_rank = encoder, rank
+    if best is None:
+        raise FormatNotAcceptable(
+            f"No available format matches {accept}, expected one of {', '.join(MEDIA_TYPES)}"
+        )
+    return best
+
+def requested_format(request, negotiate=True):
+    """Return the encoder and the Minecraft version a request asks for.
+
+    ?format= takes precedence over the Accept header and ?version= (e.g. 1.20.4) defaults
+    to DEFAULT_VERSION. negotiate=False leaves the Accept header out, for routes that
+    don't send a schematic as their body. Raises ValueError for unknown formats or versions.
+    """
+    version = request.args.get("version")
+    version = parse_version(version) if version else DEFAULT_VERSION
+    format_name = request.args.get("format")
+    if format_name is None:
+        if not negotiate:
+            return ENCODERS[DEFAULT_FORMAT], version
+        return accepted_encoder(request.headers.get("Accept")), version
+    encoder = ENCODERS.get(format_name)
+    if encoder is None:
+        raise ValueError(f"Unknown format {format_name}, expected one of {', '.join(ENCODERS)}")
+    return encoder, version
+
+def requested_level(request, generator_class):
+    """Return the gzip level asked for with ?compression=, else the generator's compression_level.
+
+    None stands for GZIP_LEVEL. Raises ValueError for anything but 0 to 9.
+    """
+    level = request.args.get("compression")
+    if level is None:
+        level = generator_class.compression_level
+    elif level.isdigit():
+        level = int(level)
+    if level is None or level == settings.GZIP_LEVEL:
+        return None
+    return check_level(level)
+
+def is_cached(key, encoder, version=DEFAULT_VERSION, level=None):
+    """Check whether generate_cached has what it needs to answer without generating."""
+    return variant_key(key, encoder, version, level) in result_cache or key in volume_cache
+
+async def generate_cached(
+    generator_class, args, key, encoder=None, version=DEFAULT_VERSION, level=None, content_encoded=False,
+    admit=None,
+):
+    """Return the encoded bytes of validated arguments, from the result cache when possible.
+
+    encoder defaults to schem and level, the gzip level, to GZIP_LEVEL. Formats other
+    than schem keep the run-length volume they are encoded from, any format of the same
+    arguments is then encoded from it without generating again. content_encoded returns
+    the bytes of a format that isn't gzipped compressed, to be sent with Content-Encoding.
+    admit, when given, is awaited right before a generation actually runs, cache hits
+    don't go through it.
+    """
+    encoder = encoder or ENCODERS[DEFAULT_FORMAT]
+    generator_name = generator_class.__name__
+    variant = variant_key(key, encoder, version, level)
+    encoding = (encoder.name, version, settings.GZIP_LEVEL if level is None else level)
+    if content_encoded and not encoder.gzipped:
+        # variant_key leaves the level out of formats that aren't gzipped themselves
+        gzip_variant = f"{variant}.gzip{encoding[2]}"
+        result = result_cache.get(gzip_variant)
+        if result is None:
+            data = await generate_cached(generator_class, args, key, encoder, version, level, admit=admit)
+            result = await asyncio.to_thread(compress, data, encoding[2])
+            result_cache.put(gzip_variant, generator_name, result)
+        return result
+
+    result = result_cache.get(variant)
+    metrics.cache_requests.inc((generator_name, "miss" if result is None else "hit"))
+    if result is None:
+        volume = volume_cache.get(key)
+        if volume is not None:
+            result = await run_encoding(generator_class, volume, encoding)
+        else:
+            if admit is not None:
+                await admit()
+            if encoder.name == DEFAULT_FORMAT:
+                result = await run_generation(generator_class, args, encoding=encoding)
+            else:
+                result, volume = await run_generation(generator_class, args, encoding=encoding)
+                volume_cache.put(key, generator_name, volume)
+        result_cache.put(variant, generator_name, result)
+    return result
+
+def abort_stream(request, generator_name, error):
+    """Drop the connection of a response that has started, nothing else can be sent on it."""
+    print(f"Sending {generator_name} failed after its response started: {error}")
+    if request.transport is not None:
+        request.transport.close()
+
+async def send_schematic(request, generator_name, data, headers, content_type=MIME_TYPE):
+    """Send encoded schematic bytes, timing how long writing them to the client takes."""
+    start = time.perf_counter()
+    stream = await request.respond(
+        content_type=content_type, headers={**headers, "Content-Length": str(len(data))}
+    )
+    try:
+        # headers go first on their own, the cached bytes are then handed to the transport
+        # as they are instead of being copied after the headers
+        await stream.send(b"", end_stream=False)
+        await stream.send(data, end_stream=True)
+    except Exception as e:
+        abort_stream(request, generator_name, e)
+        return
+    metrics.stage_seconds.observe((generator_name, "write"), time.perf_counter() - start)
+
+async def send_spooled(request, generator_name, path, headers, content_type=MIME_TYPE):
+    """Stream a spooled schematic in chunks, the file is removed as soon as it is open."""
+    start = time.perf_counter()
+    with open(path, "rb") as f:
+        os.remove(path)
+        stream = await request.respond(content_type=content_type, headers=headers)
+        try:
+            while chunk := f.read(settings.SPOOL_CHUNK_SIZE):
+                await stream.send(chunk)
+            await stream.eof()
+        except Exception as e:
+            abort_stream(request, generator_name, e)
+            return
+    metrics.stage_seconds.observe((generator_name, "write"), time.perf_counter() - start)
+
+async def generate(request, generator_name):
+    generator_name = generator_class_name(generator_name)
+    try:
+        generator_class = await resolve_generator(generator_name)
+    except GeneratorLoadError as e:
+        return response.json({"error": str(e)}, status=500)
     if not generator_class:
         return response.json(
             {"error": f"Generator {generator_name} not found"}, status=404
@@ -21,13 +247,87 @@ async def generate(request, generator_name):
 
     args = request.json
     try:
-        schem = generator_class.generate(**args)
-        name = "test"
-        schem.save("./generated_schems", name, mcschematic.Version.JE_1_19)
-        return await response.file(
-            "./generated_schems/" + name + ".schem",
-            filename=name + ".schem",
-            mime_type="application/octet-stream",
-        )
+        encoder, version = requested_format(request)
+        level = requested_level(request, generator_class)
+    except FormatNotAcceptable as e:
+        return response.json({"error": str(e)}, status=406)
+    except ValueError as e:
+        return response.json({"error": str(e)}, status=400)
+    filename = generator_name + encoder.extension
+    encoding = (encoder.name, version, settings.GZIP_LEVEL if level is None else level)
+    # gzip files are sent as they are, other formats are gzipped for the transfer only
+    content_encoded = not encoder.gzipped and accepts_gzip(request)
+    try:
+        start = time.perf_counter()
+        args = generator_class.validate_inputs(**(args or {}))
+        metrics.stage_seconds.observe((generator_name, "validate"), time.perf_counter() - start)
+        key = cache_key(generator_class, args)
+        etag = variant_key(key, encoder, version, level)
+        etag = f'"{etag}.gzip{encoding[2]}"' if content_encoded else f'"{etag}"'
+        vary = "Accept, Accept-Encoding"
+        headers = {
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "ETag": etag,
+            "Vary": vary,
+            "X-Generators-Version": generators_version(),
+        }
+        if content_encoded:
+            headers["Content-Encoding"] = "gzip"
+        profile_mode = profiling.requested_mode(request)
+        if profile_mode is None and etag_matches(request, etag):
+            return response.empty(status=304, headers={"ETag": etag, "Vary": vary})
+        # clients are charged for the generations they cause, not for cached results
+        cost = rate_limit.generation_cost(generator_class, args)
+
+        async def admit():
+            await rate_limit.admit(request, generator_name, cost)
+
+        spool_dir = settings.SCHEM_SPOOL_DIR
+        if generator_class.streamed and spool_dir is None:
+            # streamed schematics can outgrow memory, they always go through a file
+            spool_dir = tempfile.gettempdir()
+        if encoder.name != DEFAULT_FORMAT:
+            # other formats are encoded in memory, from a volume bounded by GENERATE_MAX_BLOCKS
+            spool_dir = None
+        # the schematic is generated and encoded completely before its response starts,
+        # errors are only sent as JSON up to that point
+        if profile_mode is not None:
+            # profiled calls skip the result cache, they have to run
+            profile_id = profiling.new_profile_id()
+            headers["X-Profile-Id"] = profile_id
+            await admit()
+            result = await run_generation(
+                generator_class, args, spool_dir, profile=(profile_mode, profile_id), encoding=encoding
+            )
+            if encoder.name != DEFAULT_FORMAT:
+                result, _ = result
+            if content_encoded:
+                result = await asyncio.to_thread(compress, result, encoding[2])
+        elif spool_dir is None:
+            result = await generate_cached(
+                generator_class, args, key, encoder, version, level, content_encoded, admit=admit
+            )
+        else:
+            await admit()
+            result = await run_generation(generator_class, args, spool_dir, encoding=encoding)
+    except profiling.ProfilingForbidden as e:
+        return response.json({"error": str(e)}, status=403)
+    except PoolSaturated as e:
+        return response.json({"error": str(e)}, status=429)
+    except QueueTimeout as e:
+        return response.json({"error": str(e)}, status=503)
+    except rate_limit.RateLimited as e:
+        return response.json({"error": str(e)}, status=429, headers={"Retry-After": str(e.retry_after)})
+    except GenerationTimeout as e:
+        return response.json({"error": str(e), "limit": e.limit}, status=504)
+    except GenerationLimitExceeded as e:
+        return response.json({"error": str(e), "limit": e.limit}, status=422)
+    except WorkerCrashed as e:
+        return response.json({"error": str(e)}, status=500)
     except Exception as e:
         return response.json({"error": str(e)}, status=400)
+
+    if spool_dir is None:
+        await send_schematic(request, generator_name, result, headers, encoder.media_type)
+    else:
+        await send_spooled(request, generator_name, result, headers)
@@ -0,0 +1,95 @@
+import os
+import tempfile
+
+# Number of processes used to run generators and serialize their output, shared out between the
+# Sanic workers: each one starts GENERATE_WORKERS // workers of them, at least one
+GENERATE_WORKERS = int(os.environ.get("GENERATE_WORKERS", os.cpu_count() or 1))
+
+# How many generations may be queued or running at once in each Sanic worker before /generate answers 429
+GENERATE_QUEUE_SIZE = int(os.environ.get("GENERATE_QUEUE_SIZE", GENERATE_WORKERS * 4))
+
+# Default time budget (in seconds) for a single generation, generators can override it
+GENERATE_TIMEOUT = float(os.environ.get("GENERATE_TIMEOUT", 30))
+
+# Seconds a generation may wait for a free pool process before /generate answers 503,
+# its time budget only starts once a process picks it up
+GENERATE_QUEUE_TIMEOUT = float(os.environ.get("GENERATE_QUEUE_TIMEOUT", GENERATE_TIMEOUT))
+
+# When set, generated schematics are spooled to a unique file in this directory
+# instead of being kept in memory, the file is removed once it has been sent
+SCHEM_SPOOL_DIR = os.environ.get("SCHEM_SPOOL_DIR") or None
+
+# Bounds of the in-memory cache of generated schematics
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", 64 * 1024 * 1024))
+RESULT_CACHE_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", 1024))
+
+# Maximum number of jobs accepted by a single /generate/batch request
+BATCH_MAX_JOBS = int(os.environ.get("BATCH_MAX_JOBS", 1024))
+
+# Maximum number of asynchronous jobs waiting to run in a server worker before /jobs answers 429
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", 256))
+
+# Number of seconds finished jobs and their results are kept
+JOB_RETENTION = float(os.environ.get("JOB_RETENTION", 600))
+
+# Size of the chunks a spooled schematic is sent in
+SPOOL_CHUNK_SIZE = int(os.environ.get("SPOOL_CHUNK_SIZE", 256 * 1024))
+
+# Token expected in the X-Admin-Token header of admin requests, admin features are disabled when unset
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
+
+# Directory where generator profiles are stored, and how many of them are kept
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "schematic-profiles")
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", 200))
+
+# Seconds between two stack samples of the sampling profiler
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.005))
+
+# When set, every generation is sampled and the profiles of those slower than this many seconds are kept
+PROFILE_SLOW_SECONDS = float(os.environ["PROFILE_SLOW_SECONDS"]) if os.environ.get("PROFILE_SLOW_SECONDS") else None
+
+# Limits of a single generation in its pool process, see worker_pool._Limits
+# CPU seconds, the generator's timeout (or GENERATE_TIMEOUT) bounds its wall clock time
+GENERATE_CPU_SECONDS = float(os.environ.get("GENERATE_CPU_SECONDS", GENERATE_TIMEOUT))
+# address space of a pool process in bytes, 0 disables the limit
+GENERATE_MEMORY_LIMIT = int(os.environ.get("GENERATE_MEMORY_LIMIT", 2 * 1024 ** 3))
+# blocks (air included) a written schematic may hold
+GENERATE_MAX_BLOCKS = int(os.environ.get("GENERATE_MAX_BLOCKS", 2 ** 25))
+
+# Generations a pool process runs before it is replaced by a fresh one
+GENERATE_MAX_TASKS_PER_CHILD = int(os.environ.get("GENERATE_MAX_TASKS_PER_CHILD", 100))
+
+# Bounds of the in-memory cache of run-length block volumes, kept to encode a generation in other formats
+VOLUME_CACHE_BYTES = int(os.environ.get("VOLUME_CACHE_BYTES", 64 * 1024 * 1024))
+VOLUME_CACHE_ENTRIES = int(os.environ.get("VOLUME_CACHE_ENTRIES", 256))
+
+# gzip level of the schematics from 0 (stored, fastest) to 9 (smallest), see schematicGenerator.compression
+# for the backends, generators and requests (?compression=) can pick another one
+GZIP_LEVEL = int(os.environ.get("GZIP_LEVEL", 9))
+
+# Width and length in cells of /preview thumbnails, larger schematics are scaled down to fit
+PREVIEW_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", 128))
+# Bounds of the in-memory cache of previews
+PREVIEW_CACHE_BYTES = int(os.environ.get("PREVIEW_CACHE_BYTES", 16 * 1024 * 1024))
+PREVIEW_CACHE_ENTRIES = int(os.environ.get("PREVIEW_CACHE_ENTRIES", 1024))
+
+# File keeping the catalog entries and source hash of every generator module, so a starting server
+# lists the generators without importing them
+GENERATOR_INDEX = os.environ.get("GENERATOR_INDEX") or "./schematicGenerator/generator_index.json"
+# When on, generators indexed from their current source are imported on first use instead of at startup
+GENERATORS_LAZY = os.environ.get("GENERATORS_LAZY", "1") != "0"
+# When on, a lazy server imports the indexed generators in the background once it is started
+GENERATORS_WARM = os.environ.get("GENERATORS_WARM", "1") != "0"
+
+# Blocks each client may generate per second, generations cost the blocks of their bounding volume
+# (see BaseGenerator.estimate_cost and server.rate_limit), 0 disables the limit
+RATE_LIMIT_BLOCKS = int(os.environ.get("RATE_LIMIT_BLOCKS", 0))
+# Blocks a client may spend at once when it has been idle, a request never costs more than this
+RATE_LIMIT_BURST = int(os.environ.get("RATE_LIMIT_BURST", RATE_LIMIT_BLOCKS * 10))
+# Cost of a generation whose generator has no estimate, and the least any generation costs
+RATE_LIMIT_DEFAULT_COST = int(os.environ.get("RATE_LIMIT_DEFAULT_COST", 2 ** 20))
+RATE_LIMIT_MIN_COST = int(os.environ.get("RATE_LIMIT_MIN_COST", 4096))
+# Seconds a request over its client's budget may wait for it, longer waits are answered 429 with Retry-After
+RATE_LIMIT_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 1))
+# Comma separated API keys, sent in X-Api-Key, limited on their own instead of by client address
+RATE_LIMIT_API_KEYS = frozenset(key for key in os.environ.get("RATE_LIMIT_API_KEYS", "").split(",") if key)
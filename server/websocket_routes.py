@@ -1,21 +1,221 @@
 import asyncio
-from multiprocessing import Queue
+import json
+import threading
+from collections import deque
+from multiprocessing import Manager
 
-queue = Queue()
+# messages kept for a client that reads slower than events are published, oldest are dropped first
+SUBSCRIBER_BUFFER = 64
+# messages kept in the cross-worker channel
+CHANNEL_BUFFER = 256
+# jobs a single websocket client can follow at once
+MAX_FOLLOWED_JOBS = 256
 
-def show_queue():
-    push_back = []
-    print("Queue:")
-    while not queue.empty():
-        value = queue.get()
-        print(f"  {value}")
-        push_back.append(value)
-    for value in push_back:
-        queue.put(value)
 
-async def feed(request, ws):
+class Subscription:
+    """Bounded, drop-oldest message buffer of a single websocket client."""
+
+    def __init__(self, maxlen=SUBSCRIBER_BUFFER):
+        self.messages = deque(maxlen=maxlen)
+        self.ready = asyncio.Event()
+        self.dropped = 0
+        # ids of the jobs whose events the client receives
+        self.jobs = set()
+
+    def push(self, message):
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped += 1
+        self.messages.append(message)
+        self.ready.set()
+
+    async def get(self):
+        while not self.messages:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.messages.popleft()
+
+
+class Hub:
+    """Fans the published messages out to the subscriptions of this worker."""
+
+    def __init__(self):
+        self.subscriptions = set()
+        self.loop = None
+
+    def subscribe(self):
+        subscription = Subscription()
+        self.subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.discard(subscription)
+
+    def publish(self, message):
+        """Push a message to every subscription, must run on the hub's event loop."""
+        for subscription in self.subscriptions:
+            subscription.push(message)
+
+    def publish_job(self, job_id, message):
+        """Push a job's message to the subscriptions following the job, must run on the hub's event loop."""
+        for subscription in self.subscriptions:
+            if job_id in subscription.jobs:
+                subscription.push(message)
+
+    def publish_threadsafe(self, message):
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.publish, message)
+
+    def publish_job_threadsafe(self, payload):
+        """publish_job of a (job id, message) pair, from any thread."""
+        if self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.publish_job, *payload)
+
+
+class Channel:
+    """Cross-process broadcast log, every worker holding it receives every message.
+
+    Messages are (kind, payload) tuples stored as (sequence, message) pairs in a Manager
+    list, readers block on the Manager condition until a newer sequence shows up.
+    """
+
+    def __init__(self, log, condition):
+        self.log = log
+        self.condition = condition
+
+    @classmethod
+    def create(cls, manager):
+        return cls(manager.list(), manager.Condition())
+
+    def latest(self):
+        log = self.log[-1:]
+        return log[0][0] if log else 0
+
+    def publish(self, message):
+        with self.condition:
+            self.log.append((self.latest() + 1, message))
+            if len(self.log) > CHANNEL_BUFFER:
+                del self.log[0]
+            self.condition.notify_all()
+
+    def listen(self, callback, stop_event):
+        """Call callback with every message published from now on, until stop_event is set."""
+        last_seen = self.latest()
+        while not stop_event.is_set():
+            with self.condition:
+                self.condition.wait_for(lambda: self.latest() > last_seen, timeout=1.0)
+                entries = [entry for entry in self.log[:] if entry[0] > last_seen]
+            for sequence, message in entries:
+                last_seen = sequence
+                callback(message)
+
+
+hub = Hub()
+channel = None
+manager = None
+_stop_listening = threading.Event()
+# message kind -> callable receiving the payload, called from the channel's listener thread
+channel_handlers = {"websocket": hub.publish_threadsafe, "job": hub.publish_job_threadsafe}
+# callable returning the current message of a job id, or None, set by server.jobs
+job_state = None
+
+
+def dispatch(message):
+    kind, payload = message
+    handler = channel_handlers.get(kind)
+    if handler is None:
+        print(f"No handler for {kind} channel messages")
+        return
+    handler(payload)
+
+
+def broadcast(message):
+    """Send a message to the websocket clients of every worker, callable from any thread."""
+    if channel is not None:
+        channel.publish(("websocket", message))
+    else:
+        hub.publish_threadsafe(message)
+
+
+def send_job(job_id, message):
+    """Send a message about a job to the websocket clients following it in every worker."""
+    if channel is not None:
+        channel.publish(("job", (job_id, message)))
+    else:
+        hub.publish_job_threadsafe((job_id, message))
+
+
+async def create_channel(app, loop):
+    """Create the cross-worker channel, runs once in the main process."""
+    global manager, channel
+    manager = Manager()
+    channel = Channel.create(manager)
+    app.shared_ctx.websocket_log = channel.log
+    app.shared_ctx.websocket_condition = channel.condition
+
+
+async def close_channel(app, loop):
+    if manager is not None:
+        manager.shutdown()
+
+
+async def start_hub(app, loop):
+    global channel
+    hub.loop = asyncio.get_running_loop()
+    log = getattr(app.shared_ctx, "websocket_log", None)
+    if log is None:
+        # single process, events only come from this process
+        return
+    channel = Channel(log, app.shared_ctx.websocket_condition)
+    _stop_listening.clear()
+    threading.Thread(
+        target=channel.listen, args=(dispatch, _stop_listening), daemon=True
+    ).start()
+
+
+async def stop_hub(app, loop):
+    _stop_listening.set()
+
+
+def follow_job(subscription, job_id):
+    """Send a job's events to a subscription, starting with the job's current state."""
+    if len(subscription.jobs) >= MAX_FOLLOWED_JOBS or job_id in subscription.jobs:
+        return
+    subscription.jobs.add(job_id)
+    message = job_state(job_id) if job_state is not None else None
+    if message is not None:
+        subscription.push(message)
+
+
+async def receive_subscriptions(ws, subscription):
+    """Follow and unfollow jobs as the client asks, with {"subscribe": id} and {"unsubscribe": id}."""
     while True:
-        if not queue.empty():
-            # show_queue()
-            await ws.send(queue.get())
-        await asyncio.sleep(0.2)
+        message = await ws.recv()
+        try:
+            message = json.loads(message)
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(message, dict):
+            continue
+        if isinstance(message.get("subscribe"), str):
+            follow_job(subscription, message["subscribe"])
+        if isinstance(message.get("unsubscribe"), str):
+            subscription.jobs.discard(message["unsubscribe"])
+
+
+async def feed(request, ws):
+    """Generator changes for every client, the events of a job only for the clients following it.
+
+    Jobs are followed with ?jobs=<id>,<id> or by sending {"subscribe": <id>}, the id
+    returned when submitting a job is what allows following it.
+    """
+    subscription = hub.subscribe()
+    for job_id in request.args.get("jobs", "").split(","):
+        if job_id:
+            follow_job(subscription, job_id)
+    receiving = asyncio.ensure_future(receive_subscriptions(ws, subscription))
+    try:
+        while True:
+            await ws.send(await subscription.get())
+    finally:
+        receiving.cancel()
+        hub.unsubscribe(subscription)
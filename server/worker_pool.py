@@ -0,0 +1,375 @@
+import faulthandler
+import os
+import resource
+import signal
+import sys
+import time
+import uuid
+from multiprocessing import Value
+
+from hotloading import hotload_manager
+from schematicGenerator import base_generator
+from schematicGenerator.schematic import TooManyBlocks
+from schematicGenerator.serialization import DEFAULT_VERSION, serialize_schematic, write_schematic, block_count
+from schematicGenerator.encoders import DEFAULT_FORMAT, ENCODERS, BlockVolume
+from schematicGenerator.preview import render_preview
+from server import settings, metrics, profiling
+from server.process_pool import ProcessPool, ProcessDied, QueueTimeout, send_message
+
+
+class PoolSaturated(Exception):
+    """Raised when the generation queue is full."""
+
+
+class GenerationLimitExceeded(Exception):
+    """Raised when a generation goes over one of its limits, named by limit."""
+
+    limit = None
+
+
+class GenerationTimeout(GenerationLimitExceeded):
+    """Raised when a generation exceeds its time budget."""
+
+    limit = "wall_time"
+
+
+class CpuTimeExceeded(GenerationLimitExceeded):
+    limit = "cpu_time"
+
+
+class MemoryLimitExceeded(GenerationLimitExceeded):
+    limit = "memory"
+
+
+class BlockLimitExceeded(GenerationLimitExceeded):
+    limit = "blocks"
+
+
+class WorkerCrashed(Exception):
+    """Raised when the process running a generation died."""
+
+
+# minimum number of seconds between two progress reports of a generation
+PROGRESS_INTERVAL = 0.1
+# seconds a generation ignoring its limits gets before its process is killed
+KILL_GRACE = 5.0
+
+pool = None
+pending = 0
+progress_listeners = []
+
+
+def add_progress_listener(listener):
+    """Register a callable receiving (job_id, fraction, message) for every progress report."""
+    progress_listeners.append(listener)
+
+
+def _dispatch_progress(event):
+    """Hand a progress report of a pool process to the listeners."""
+    for listener in progress_listeners:
+        try:
+            listener(*event)
+        except Exception as e:
+            print(f"Progress listener failed: {e}")
+
+
+def _progress_reporter(job_id):
+    """Return the progress callback of a job, throttled to one report per PROGRESS_INTERVAL."""
+    last_report = 0.0
+
+    def report(fraction, message=None):
+        nonlocal last_report
+        now = time.monotonic()
+        if fraction < 1 and now - last_report < PROGRESS_INTERVAL:
+            return
+        last_report = now
+        send_message((job_id, min(max(float(fraction), 0.0), 1.0), message))
+
+    return report
+
+
+def _raise_on_signal(exception, message):
+    def handler(signum, frame):
+        raise exception(message)
+
+    return handler
+
+
+def _init_worker():
+    """Register the generators once when a pool process starts and install its limits."""
+    if settings.GENERATE_MEMORY_LIMIT:
+        # Linux doesn't enforce RLIMIT_RSS, the address space limit makes allocations fail instead
+        _, hard = resource.getrlimit(resource.RLIMIT_AS)
+        resource.setrlimit(resource.RLIMIT_AS, (settings.GENERATE_MEMORY_LIMIT, hard))
+    signal.signal(signal.SIGALRM, _raise_on_signal(GenerationTimeout, "Generation took too long"))
+    signal.signal(signal.SIGXCPU, _raise_on_signal(CpuTimeExceeded, "Generation used too much CPU time"))
+    if not hotload_manager.generator_modules:
+        hotload_manager.initialize_generators(notify=False, lazy=settings.GENERATORS_LAZY)
+
+
+def _sync_module(module_name, source_hash, source):
+    """Bring a generator module of this worker to the version the server resolved the task against.
+
+    The module is compiled from the source sent with the task, not from the file, which
+    may have changed or been broken since the server loaded it.
+    """
+    if hotload_manager.module_hashes.get(module_name) == source_hash and module_name in sys.modules:
+        return
+    compiled = hotload_manager.compile_generator(hotload_manager.get_module_path(module_name), source)
+    if compiled[1] != source_hash:
+        # the server swapped the module while the task was being built
+        raise RuntimeError(f"{module_name} changed while the generation was submitted, try again")
+    hotload_manager.install_generator(*compiled, notify=False)
+
+
+class _Limits:
+    """Wall clock and CPU time limits of one generation in a worker process.
+
+    Going over a limit raises in the generation's thread, from a signal handler. A
+    generation stuck where signals can't interrupt it, in native code for instance, is
+    killed by faulthandler's watchdog KILL_GRACE seconds after its wall clock limit, or
+    by the server KILL_GRACE seconds later if even that doesn't happen. Only its own
+    process dies, the other generations go on.
+    """
+
+    def __init__(self, timeout):
+        self.timeout = timeout
+
+    def __enter__(self):
+        # RLIMIT_CPU counts the whole life of the process, the limit is relative to its usage so far
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        used = usage.ru_utime + usage.ru_stime
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (int(used + settings.GENERATE_CPU_SECONDS) + 1, hard))
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        faulthandler.dump_traceback_later(self.timeout + KILL_GRACE, exit=True)
+
+    def __exit__(self, *exc_info):
+        faulthandler.cancel_dump_traceback_later()
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        resource.setrlimit(resource.RLIMIT_CPU, (hard, hard))
+
+
+def _run_generation(
+    generator_name, module_name, source_hash, source, args, spool_dir, timeout,
+    job_id=None, profile=None, preview=None, encoding=None,
+):
+    """Generate and serialize a schematic, executed inside a worker process.
+
+    Returns the .schem bytes, or the path of a unique spool file when spool_dir is set,
+    with the (generate seconds, serialize seconds, block count, byte count) of the run.
+    encoding is an optional (format name, mcschematic.Version, gzip level) tuple, it
+    defaults to schem at GZIP_LEVEL. Formats other than schem are encoded in memory and
+    returned with the run-length volume they were encoded from, as a (bytes, volume) pair.
+    When preview names a preview format the preview's bytes are returned instead of the
+    .schem, with a block count of None.
+    The generation is stopped with a GenerationLimitExceeded when it goes over timeout,
+    GENERATE_CPU_SECONDS, GENERATE_MEMORY_LIMIT or GENERATE_MAX_BLOCKS.
+    Progress reported by the generator is forwarded to the server when job_id is set.
+    The generator's module is compiled from source when this process doesn't have the
+    version of source_hash, see _sync_module.
+    profile is an optional (profiler, profile id) pair, the profile is then always stored.
+    """
+    _sync_module(module_name, source_hash, source)
+    generator_class = hotload_manager.get_generator(generator_name)
+    if not generator_class:
+        raise KeyError(f"Generator {generator_name} not found")
+    if job_id is not None:
+        base_generator.progress_callback = _progress_reporter(job_id)
+    try:
+        with _Limits(timeout):
+            return _run_profiled(generator_name, generator_class, args, spool_dir, profile, preview, encoding)
+    except MemoryError:
+        raise MemoryLimitExceeded("Generation used too much memory") from None
+    except TooManyBlocks as e:
+        raise BlockLimitExceeded(str(e)) from None
+    finally:
+        base_generator.progress_callback = None
+
+
+def _run_profiled(generator_name, generator_class, args, spool_dir, profile, preview, encoding):
+    if profile is not None:
+        mode, profile_id = profile
+    elif settings.PROFILE_SLOW_SECONDS is not None:
+        mode, profile_id = "sample", None
+    else:
+        return _generate_and_write(generator_class, args, spool_dir, preview, encoding)
+
+    result, captured = profiling.profile_call(
+        mode, _generate_and_write, generator_class, args, spool_dir, preview, encoding
+    )
+    if profile_id is not None:
+        profiling.save_profile(profile_id, generator_name, args, captured, "request")
+    elif captured["duration"] >= settings.PROFILE_SLOW_SECONDS:
+        profiling.save_profile(profiling.new_profile_id(), generator_name, args, captured, "slow")
+    return result
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _generate_and_write(generator_class, args, spool_dir, preview=None, encoding=None):
+    start = time.perf_counter()
+    schem = generator_class.generate(**args)
+    generated = time.perf_counter()
+    if preview is not None:
+        result = render_preview(schem, preview, settings.PREVIEW_MAX_SIZE, settings.GENERATE_MAX_BLOCKS)
+        return result, (generated - start, time.perf_counter() - generated, None, len(result))
+    encoder_name, version, level = encoding or (DEFAULT_FORMAT, DEFAULT_VERSION, settings.GZIP_LEVEL)
+    if encoder_name != DEFAULT_FORMAT:
+        volume = BlockVolume.from_schematic(schem, settings.GENERATE_MAX_BLOCKS)
+        result = ENCODERS[encoder_name].encode(volume, version, generator_class.__name__, level)
+        timings = (generated - start, time.perf_counter() - generated, volume.block_count(), len(result))
+        return (result, volume.to_rle()), timings
+    # a SlabStream only generates its blocks while it is written
+    if spool_dir is None:
+        result = serialize_schematic(schem, version, settings.GENERATE_MAX_BLOCKS, level)
+        size = len(result)
+    else:
+        result = os.path.join(spool_dir, uuid.uuid4().hex + ".schem")
+        try:
+            with open(result, "wb") as f:
+                write_schematic(schem, f, version, settings.GENERATE_MAX_BLOCKS, level)
+                size = f.tell()
+        except BaseException:
+            _remove_quietly(result)
+            raise
+    return result, (generated - start, time.perf_counter() - generated, block_count(schem), size)
+
+
+def _run_encoding(generator_name, volume, encoding, timeout):
+    """Encode the run-length volume of an earlier generation, executed inside a worker process.
+
+    Returns the encoded bytes with the (None, encode seconds, block count, byte count) of the run.
+    """
+    try:
+        with _Limits(timeout):
+            start = time.perf_counter()
+            encoder_name, version, level = encoding
+            volume = BlockVolume.from_rle(volume)
+            result = ENCODERS[encoder_name].encode(volume, version, generator_name, level)
+            return result, (None, time.perf_counter() - start, volume.block_count(), len(result))
+    except MemoryError:
+        raise MemoryLimitExceeded("Encoding used too much memory") from None
+
+
+async def share_server_workers(app, loop):
+    """Tell the workers how many of them share GENERATE_WORKERS, runs once in the main process."""
+    app.shared_ctx.server_workers = Value("i", max(app.state.workers, 1))
+
+
+async def start_pool(app, loop):
+    """Start this worker's share of the GENERATE_WORKERS pool processes, at least one."""
+    global pool
+    server_workers = getattr(app.shared_ctx, "server_workers", None)
+    size = settings.GENERATE_WORKERS
+    if server_workers is not None:
+        size = max(1, size // server_workers.value)
+    pool = ProcessPool(
+        size,
+        initializer=_init_worker,
+        # recycling processes contains the leaks of generators
+        max_tasks_per_child=settings.GENERATE_MAX_TASKS_PER_CHILD,
+    )
+    await pool.start()
+    print(f"Generator pool started with {size} workers")
+
+
+async def stop_pool(app, loop):
+    global pool
+    if pool:
+        await pool.close()
+        pool = None
+        print("Generator pool stopped")
+
+
+async def _submit(generator_name, task, timeout, outcomes):
+    """Run a task in the pool, enforcing the queue size and the timeout, and count its outcome.
+
+    The timeout starts once a pool process picks the task up, the wait for a free
+    process is bounded by GENERATE_QUEUE_TIMEOUT instead.
+    """
+    global pending
+    if pending >= settings.GENERATE_QUEUE_SIZE:
+        outcomes.inc((generator_name, "rejected"))
+        raise PoolSaturated("Too many generations in progress, try again later")
+
+    pending += 1
+    outcome = "error"
+
+    def release():
+        # a running task holds its slot until its process is done with it, even once its caller gave up
+        global pending
+        pending -= 1
+
+    try:
+        try:
+            result = await pool.run(
+                task[0], task[1:], timeout + 2 * KILL_GRACE, settings.GENERATE_QUEUE_TIMEOUT,
+                on_message=_dispatch_progress, on_done=release,
+            )
+        except QueueTimeout:
+            outcome = "queue_timeout"
+            raise
+        except GenerationLimitExceeded as e:
+            outcome = e.limit
+            raise
+        except ProcessDied as e:
+            if e.elapsed >= timeout:
+                # killed by the watchdog of its limits
+                outcome = "timeout"
+                raise GenerationTimeout(f"Generation took longer than {timeout} seconds") from None
+            outcome = "crashed"
+            raise WorkerCrashed("The generator process died, it may have gone over its limits") from None
+        outcome = "ok"
+    finally:
+        outcomes.inc((generator_name, outcome))
+    return result
+
+
+async def run_generation(
+    generator_class, args, spool_dir=None, job_id=None, profile=None, preview=None, encoding=None
+):
+    """Run a generation in the pool, enforcing the queue size and the generator's limits.
+
+    preview is an optional preview format, the preview is then returned instead of the .schem.
+    encoding is an optional (format name, mcschematic.Version, gzip level) tuple, formats
+    other than schem return an (encoded bytes, run-length volume) pair, see _run_generation.
+    """
+    generator_name = generator_class.__name__
+    module_name = hotload_manager.generator_modules[generator_name]
+    source_hash = hotload_manager.module_hashes.get(module_name)
+    source = hotload_manager.module_sources.get(module_name)
+    timeout = generator_class.timeout or settings.GENERATE_TIMEOUT
+    task = (
+        _run_generation, generator_name, module_name, source_hash, source, args, spool_dir, timeout,
+        job_id, profile, preview, encoding,
+    )
+    result, (generate_time, serialize_time, blocks, size) = await _submit(
+        generator_name, task, timeout, metrics.generations
+    )
+
+    metrics.stage_seconds.observe((generator_name, "generate"), generate_time)
+    if preview is not None:
+        metrics.stage_seconds.observe((generator_name, "preview"), serialize_time)
+        return result
+    metrics.stage_seconds.observe((generator_name, "serialize"), serialize_time)
+    metrics.output_blocks.observe((generator_name,), blocks)
+    metrics.output_bytes.inc((generator_name,), size)
+    return result
+
+
+async def run_encoding(generator_class, volume, encoding):
+    """Encode the run-length volume kept from an earlier generation in the pool, without generating again."""
+    generator_name = generator_class.__name__
+    timeout = generator_class.timeout or settings.GENERATE_TIMEOUT
+    task = (_run_encoding, generator_name, volume, encoding, timeout)
+    result, (_, encode_time, _, size) = await _submit(generator_name, task, timeout, metrics.encodings)
+    metrics.stage_seconds.observe((generator_name, "serialize"), encode_time)
+    metrics.output_bytes.inc((generator_name,), size)
+    return result
@@ -0,0 +1,32 @@
+"""Tasks run by the process pool tests, importable by the pool processes."""
+import os
+import time
+
+from server.process_pool import send_message
+
+
+def add(a, b):
+    return a + b
+
+
+def sleep(seconds):
+    time.sleep(seconds)
+    return seconds
+
+
+def fail(message):
+    raise KeyError(message)
+
+
+def crash():
+    os._exit(3)
+
+
+def report(count):
+    for i in range(count):
+        send_message(i)
+    return count
+
+
+def pid():
+    return os.getpid()
@@ -0,0 +1,49 @@
+import io
+import json
+import zipfile
+from types import SimpleNamespace
+
+import pytest
+
+from schematicGenerator.encoders import ENCODERS
+from schematicGenerator.serialization import DEFAULT_VERSION
+from server.batch_routes import BatchJob, NdjsonEncoder, ZipEncoder, requested_archive
+
+
+def make_request(args=None, headers=None):
+    return SimpleNamespace(args=args or {}, headers=headers or {})
+
+
+@pytest.mark.parametrize("args, headers, expected", [
+    ({}, {}, NdjsonEncoder),
+    ({"archive": "zip"}, {}, ZipEncoder),
+    ({"archive": "ndjson"}, {"Accept": "application/zip"}, NdjsonEncoder),
+    ({}, {"Accept": "application/zip"}, ZipEncoder),
+    ({}, {"Accept": "application/x-ndjson, application/zip;q=0.5"}, NdjsonEncoder),
+    ({}, {"Accept": "application/zip;q=0"}, NdjsonEncoder),
+    ({"format": "litematic"}, {"Accept": "application/zip"}, ZipEncoder),
+])
+def test_requested_archive(args, headers, expected):
+    assert requested_archive(make_request(args, headers)) is expected
+
+
+def test_unknown_archive():
+    with pytest.raises(ValueError):
+        requested_archive(make_request({"archive": "tar"}))
+
+
+def test_zip_entries_use_the_schematic_format():
+    archive = ZipEncoder(ENCODERS["litematic"], DEFAULT_VERSION)
+    data = archive.encode(BatchJob(0, "CircleGenerator", key="abc"), b"litematic bytes")
+    data += archive.encode(BatchJob(1, "NopeGenerator", error="Generator NopeGenerator not found"), None)
+    data += archive.close()
+    with zipfile.ZipFile(io.BytesIO(data)) as f:
+        assert f.namelist() == ["0000-CircleGenerator.litematic", "0001-NopeGenerator.error.json"]
+        assert f.read("0000-CircleGenerator.litematic") == b"litematic bytes"
+        assert json.loads(f.read("0001-NopeGenerator.error.json")) == {"error": "Generator NopeGenerator not found"}
+
+
+def test_ndjson_etag_names_the_format():
+    archive = NdjsonEncoder(ENCODERS["rle"], DEFAULT_VERSION)
+    line = json.loads(archive.encode(BatchJob(0, "CircleGenerator", args={"radius": 2}, key="abc"), b"x"))
+    assert line["etag"].startswith('"abc') and line["etag"] != '"abc"'
@@ -0,0 +1,93 @@
+import pytest
+
+from schematicGenerator.blocks import BlockRegistry, InvalidBlock, get_registry
+from schematicGenerator.inputs import BlockInput, InputError
+
+STAIRS = "minecraft:oak_stairs[facing=north,half=top,shape=straight,waterlogged=false]"
+
+
+@pytest.fixture
+def registry():
+    return BlockRegistry({
+        "minecraft:stone": ({}, {}),
+        "minecraft:oak_stairs": (
+            {
+                "facing": ["north", "south", "west", "east"],
+                "half": ["top", "bottom"],
+                "shape": ["straight", "inner_left", "inner_right", "outer_left", "outer_right"],
+                "waterlogged": ["true", "false"],
+            },
+            {"facing": "north", "half": "bottom", "shape": "straight", "waterlogged": "false"},
+        ),
+    })
+
+
+def test_known_blocks_are_canonicalized(registry):
+    assert registry.canonical("stone") == "minecraft:stone"
+    assert registry.canonical(" oak_stairs[half=top] ") == STAIRS
+    assert registry.canonical("minecraft:oak_stairs[waterlogged=false, half=top]") == STAIRS
+    assert registry.canonical("oak_stairs") == STAIRS.replace("half=top", "half=bottom")
+
+
+def test_state_ids_round_trip(registry):
+    assert registry.state_count == 1 + 4 * 2 * 5 * 2
+    ids = set()
+    for state_id in range(registry.state_count):
+        state = registry.state(state_id)
+        assert registry.parse(state) == (state, state_id)
+        ids.add(state_id)
+    assert len(ids) == registry.state_count
+    with pytest.raises(InvalidBlock):
+        registry.state(registry.state_count)
+
+
+def test_unknown_blocks_pass_through(registry):
+    for block in ("minecraft:chest", "torch", "cherry_planks", "mymod:pipe[connected=true,power=15]"):
+        assert registry.parse(block) == (block, None)
+
+
+def test_block_entity_data_passes_through(registry):
+    block = 'oak_stairs[half=top]{CustomName:"x"}'
+    assert registry.parse(block) == (block, None)
+    with pytest.raises(InvalidBlock):
+        registry.parse("oak_stairs[colour=red]{}")
+
+
+@pytest.mark.parametrize("block", [
+    "",
+    "Stone",
+    "minecraft:stone:slab",
+    "oak_stairs[half=top",
+    "oak_stairs[half]",
+    "chest[facing=North]",
+    "chest[facing=north,facing=south]",
+])
+def test_malformed_blocks_are_rejected(registry, block):
+    with pytest.raises(InvalidBlock):
+        registry.parse(block)
+
+
+@pytest.mark.parametrize("block, message", [
+    ("oak_stairs[colour=red]", "has no property colour"),
+    ("oak_stairs[half=middle]", "Invalid value middle for half"),
+    ("oak_stairs[half=top,half=bottom]", "given twice"),
+])
+def test_invalid_properties_of_known_blocks_are_rejected(registry, block, message):
+    with pytest.raises(InvalidBlock, match=message):
+        registry.parse(block)
+
+
+@pytest.mark.parametrize("block", [
+    "minecraft:chest", "torch", "furnace", "crafting_table", "tnt", "cherry_planks", "minecraft:stone",
+])
+def test_block_input_accepts_every_well_formed_block(block):
+    validate = BlockInput().compile()
+    assert validate(block) == get_registry().canonical(block)
+
+
+def test_block_input_rejects_invalid_states():
+    validate = BlockInput().compile()
+    with pytest.raises(InputError):
+        validate("oak_stairs[half=middle]")
+    with pytest.raises(InputError):
+        validate(1)
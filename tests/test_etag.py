@@ -0,0 +1,125 @@
+import asyncio
+import json
+
+import pytest
+
+from hotloading import hotload_manager
+from schematicGenerator.generators.CircleGenerator import CircleGenerator
+from server import routes
+from server.catalog import Catalog, CatalogSnapshot
+from server.result_cache import result_cache, volume_cache
+from server.routes import etag_matches
+
+
+class Stream:
+    def __init__(self, sent):
+        self.sent = sent
+
+    async def send(self, data=b"", end_stream=None):
+        self.sent["body"] += data
+
+    async def eof(self):
+        pass
+
+
+class Request:
+    def __init__(self, body=None, args=None, headers=None):
+        self.json = body
+        self.args = args or {}
+        self.headers = headers or {}
+        self.remote_addr = self.ip = "10.0.0.1"
+        self.transport = None
+        self.sent = None
+
+    async def respond(self, content_type=None, headers=None):
+        self.sent = {"content_type": content_type, "headers": headers, "body": b""}
+        return Stream(self.sent)
+
+
+@pytest.mark.parametrize("if_none_match, expected", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+    ('"xyz"', False),
+])
+def test_etag_matches(if_none_match, expected):
+    headers = {} if if_none_match is None else {"If-None-Match": if_none_match}
+    assert etag_matches(Request(headers=headers), '"abc"') is expected
+
+
+@pytest.fixture
+def generations(monkeypatch):
+    """The arguments of the generations that ran, CircleGenerator is the only generator."""
+    runs = []
+
+    async def run_generation(generator_class, args, *rest, encoding=None, **kwargs):
+        runs.append(args)
+        return b"schematic bytes"
+
+    monkeypatch.setattr(routes, "run_generation", run_generation)
+    monkeypatch.setattr(hotload_manager, "generators_dict", {"CircleGenerator": CircleGenerator})
+    result_cache.clear()
+    volume_cache.clear()
+    return runs
+
+
+def generate(body, args=None, headers=None):
+    request = Request(body, args, headers)
+    result = asyncio.run(routes.generate(request, "circle-generator"))
+    return result, request.sent
+
+
+def test_generate_answers_304_for_its_etag(generations):
+    result, sent = generate({"radius": 3})
+    assert result is None and sent["body"] == b"schematic bytes"
+    etag = sent["headers"]["ETag"]
+
+    result, sent = generate({"radius": 3}, headers={"If-None-Match": etag})
+    assert result.status == 304 and sent is None
+    assert result.headers["ETag"] == etag
+    assert len(generations) == 1
+
+
+def test_etag_follows_the_arguments_and_the_variant(generations):
+    _, sent = generate({"radius": 3})
+    etag = sent["headers"]["ETag"]
+    # the same generation with the default spelled out
+    _, sent = generate({"radius": 3, "filled": True}, headers={"If-None-Match": etag})
+    assert sent is None
+    _, sent = generate({"radius": 4}, headers={"If-None-Match": etag})
+    assert sent is not None and sent["headers"]["ETag"] != etag
+    _, sent = generate({"radius": 3}, {"compression": "1"}, {"If-None-Match": etag})
+    assert sent is not None and sent["headers"]["ETag"] != etag
+
+
+def test_invalid_arguments_are_checked_before_the_etag(generations):
+    result, sent = generate({"radius": 500}, headers={"If-None-Match": "*"})
+    assert result.status == 400 and sent is None
+
+
+@pytest.fixture
+def snapshot(monkeypatch):
+    catalog = Catalog()
+    catalog.snapshot = CatalogSnapshot(3, {"CircleGenerator": {"inputs": {}}})
+    monkeypatch.setattr(routes, "catalog", catalog)
+    return catalog.snapshot
+
+
+def list_generators(args=None, headers=None):
+    return asyncio.run(routes.list_generators(Request(args=args, headers=headers)))
+
+
+def test_catalog_etag(snapshot):
+    result = list_generators()
+    assert result.status == 200 and result.headers["ETag"] == snapshot.etag
+    assert json.loads(result.body) == [{"CircleGenerator": {"inputs": {}}}]
+    assert list_generators(headers={"If-None-Match": snapshot.etag}).status == 304
+    assert list_generators(headers={"If-None-Match": '"stale"'}).status == 200
+
+
+def test_catalog_since_its_version(snapshot):
+    assert list_generators({"since": "3"}).status == 304
+    assert list_generators({"since": "three"}).status == 400
@@ -0,0 +1,129 @@
+import asyncio
+import gzip
+from types import SimpleNamespace
+
+import pytest
+
+from schematicGenerator.encoders import DEFAULT_FORMAT, ENCODERS
+from schematicGenerator.serialization import DEFAULT_VERSION
+from schematicGenerator.generators.CircleGenerator import CircleGenerator
+from server import routes
+from server.result_cache import cache_key, result_cache, volume_cache
+from server.routes import FormatNotAcceptable, accepted_encoder, accepts_gzip, requested_format
+
+
+def make_request(args=None, headers=None):
+    return SimpleNamespace(args=args or {}, headers=headers or {})
+
+
+@pytest.mark.parametrize("accept, expected", [
+    (None, DEFAULT_FORMAT),
+    ("", DEFAULT_FORMAT),
+    ("*/*", DEFAULT_FORMAT),
+    ("application/x-litematic", "litematic"),
+    ("application/x-litematic;q=0.5, application/x-mcedit-schematic", "schematic"),
+    ("*/*;q=1, application/x-block-rle", "rle"),
+    ("application/x-litematic;q=0, */*;q=0.1", DEFAULT_FORMAT),
+    ("text/html, application/x-sponge-schematic-v3;q=0.2", "schem-v3"),
+])
+def test_accepted_encoder(accept, expected):
+    assert accepted_encoder(accept).name == expected
+
+
+@pytest.mark.parametrize("accept", ["text/html", "application/x-litematic;q=0", "image/*"])
+def test_accepted_encoder_rejects_unavailable_formats(accept):
+    with pytest.raises(FormatNotAcceptable):
+        accepted_encoder(accept)
+
+
+def test_format_argument_overrides_accept():
+    request = make_request({"format": "litematic"}, {"Accept": "application/x-block-rle"})
+    assert requested_format(request) == (ENCODERS["litematic"], DEFAULT_VERSION)
+
+
+def test_requested_version():
+    encoder, version = requested_format(make_request({"version": "1.20.4"}))
+    assert encoder.name == DEFAULT_FORMAT
+    assert version.name == "JE_1_20_4"
+
+
+@pytest.mark.parametrize("args", [{"format": "png"}, {"version": "0.1.2.3"}])
+def test_unknown_format_or_version(args):
+    with pytest.raises(ValueError):
+        requested_format(make_request(args))
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, False),
+    ("", False),
+    ("gzip", True),
+    ("GZIP", True),
+    ("deflate, gzip;q=0.5", True),
+    ("x-gzip", True),
+    ("*", True),
+    ("br;q=1, *;q=0.1", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("gzip;q=0, *", False),
+    ("*;q=0", False),
+    ("x-gzip-nope", False),
+    ("deflate, br", False),
+])
+def test_accepts_gzip(accept_encoding, expected):
+    headers = {} if accept_encoding is None else {"Accept-Encoding": accept_encoding}
+    assert accepts_gzip(make_request(headers=headers)) is expected
+
+
+class FailingStream:
+    async def send(self, data=b"", end_stream=None):
+        raise ConnectionResetError("client went away")
+
+    async def eof(self):
+        pass
+
+
+class StreamingRequest:
+    def __init__(self):
+        self.transport = SimpleNamespace(closed=False)
+        self.transport.close = lambda: setattr(self.transport, "closed", True)
+        self.responded = False
+
+    async def respond(self, **kwargs):
+        self.responded = True
+        return FailingStream()
+
+
+def test_failed_send_aborts_the_stream():
+    request = StreamingRequest()
+    assert asyncio.run(routes.send_schematic(request, "CircleGenerator", b"data", {})) is None
+    assert request.responded and request.transport.closed
+
+
+def test_failed_spooled_send_aborts_the_stream(tmp_path):
+    path = tmp_path / "spooled.schem"
+    path.write_bytes(b"data")
+    request = StreamingRequest()
+    assert asyncio.run(routes.send_spooled(request, "SphereGenerator", str(path), {})) is None
+    assert request.transport.closed
+    assert not path.exists()
+
+
+def test_content_encoded_results_are_cached_per_level(monkeypatch):
+    result_cache.clear()
+    volume_cache.clear()
+
+    async def run_generation(generator_class, args, encoding=None):
+        return b"run length volume " * 100, b"volume"
+
+    monkeypatch.setattr(routes, "run_generation", run_generation)
+    args = CircleGenerator.validate_inputs(radius=3)
+    key = cache_key(CircleGenerator, args)
+    rle = ENCODERS["rle"]
+
+    async def generate(level):
+        return await routes.generate_cached(CircleGenerator, args, key, rle, level=level, content_encoded=True)
+
+    fast, small = asyncio.run(generate(1)), asyncio.run(generate(9))
+    assert gzip.decompress(fast) == gzip.decompress(small) == b"run length volume " * 100
+    # the XFL byte of the gzip header records the fastest or the best compression
+    assert fast[8] == 4 and small[8] == 2
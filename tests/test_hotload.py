@@ -0,0 +1,126 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+from hotloading import hotload_manager
+from hotloading.hotload_manager import GeneratorLoadError
+from server import settings, worker_pool
+
+GENERATOR = '''
+import os
+from schematicGenerator.inputs import IntInput
+from schematicGenerator.base_generator import BaseGenerator, GeneratorMetaData
+
+if os.environ.get("BREAK_{name}"):
+    raise RuntimeError("{name} is broken")
+
+
+class {name}(BaseGenerator):
+    meta_data = GeneratorMetaData(description="{name} for the tests", categories=["tests"])
+
+    @classmethod
+    def generate(cls, size: int = IntInput(min_value=1, max_value=4, description="Size")):
+        return None
+'''
+
+
+@pytest.fixture
+def tree(tmp_path, monkeypatch):
+    """A generators directory of two modules, with the hotload state of a fresh process."""
+    generators = tmp_path / "schematicGenerator" / "generators"
+    generators.mkdir(parents=True)
+    for name in ("TinyGenerator", "SmallGenerator"):
+        (generators / f"{name}.py").write_text(GENERATOR.format(name=name))
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, "GENERATOR_INDEX", str(tmp_path / "generator_index.json"))
+    monkeypatch.setattr(hotload_manager, "change_listeners", [])
+    monkeypatch.setattr(hotload_manager, "index_dirty", False)
+    restart(monkeypatch)
+    return generators
+
+
+def restart(monkeypatch):
+    """Forget what was loaded, like a new process would."""
+    for name, value in [
+        ("generators_dict", {}), ("generator_modules", {}), ("module_hashes", {}),
+        ("module_sources", {}), ("generator_index", {}), ("known_generator_files", set()),
+    ]:
+        monkeypatch.setattr(hotload_manager, name, value)
+    for name in ("TinyGenerator", "SmallGenerator"):
+        monkeypatch.delitem(sys.modules, "schematicGenerator.generators." + name, raising=False)
+
+
+def test_lazy_start_imports_nothing(tree, monkeypatch):
+    hotload_manager.initialize_generators(notify=False)
+    eager_catalog = hotload_manager.generator_catalog()
+    assert set(eager_catalog) == {"TinyGenerator", "SmallGenerator"}
+    assert os.path.exists(settings.GENERATOR_INDEX)
+
+    restart(monkeypatch)
+    hotload_manager.initialize_generators(notify=False, lazy=True)
+    assert hotload_manager.generators_dict == {}
+    assert hotload_manager.generator_catalog() == eager_catalog
+
+    generator_class = hotload_manager.get_generator("TinyGenerator")
+    assert generator_class.__name__ == "TinyGenerator"
+    assert set(hotload_manager.generators_dict) == {"TinyGenerator"}
+    assert hotload_manager.generator_catalog() == eager_catalog
+    assert hotload_manager.get_generator("NopeGenerator") is None
+
+
+def test_changed_modules_are_imported_at_start(tree, monkeypatch):
+    hotload_manager.initialize_generators(notify=False)
+    restart(monkeypatch)
+    (tree / "SmallGenerator.py").write_text(GENERATOR.format(name="SmallGenerator") + "\n# changed\n")
+    hotload_manager.initialize_generators(notify=False, lazy=True)
+    assert set(hotload_manager.generators_dict) == {"SmallGenerator"}
+    assert set(hotload_manager.generator_modules) == {"TinyGenerator", "SmallGenerator"}
+
+
+def test_stale_index_is_ignored(tree, monkeypatch):
+    hotload_manager.initialize_generators(notify=False)
+    restart(monkeypatch)
+    monkeypatch.setattr(hotload_manager, "framework_hash", lambda: "another framework")
+    assert hotload_manager.read_index() == {}
+    hotload_manager.initialize_generators(notify=False, lazy=True)
+    assert set(hotload_manager.generators_dict) == {"TinyGenerator", "SmallGenerator"}
+
+
+def test_failed_lazy_import_raises(tree, monkeypatch):
+    hotload_manager.initialize_generators(notify=False)
+    restart(monkeypatch)
+    hotload_manager.initialize_generators(notify=False, lazy=True)
+    monkeypatch.setenv("BREAK_TinyGenerator", "1")
+    with pytest.raises(GeneratorLoadError, match="TinyGenerator is broken"):
+        hotload_manager.get_generator("TinyGenerator")
+    with pytest.raises(GeneratorLoadError):
+        asyncio.run(hotload_manager.resolve_generator("TinyGenerator"))
+    # the other generators are still served, the broken one loads once it is fixed
+    assert asyncio.run(hotload_manager.resolve_generator("SmallGenerator")).__name__ == "SmallGenerator"
+    monkeypatch.delenv("BREAK_TinyGenerator")
+    assert hotload_manager.get_generator("TinyGenerator").__name__ == "TinyGenerator"
+
+
+def test_pool_processes_run_the_version_the_server_loaded(tree, monkeypatch):
+    hotload_manager.initialize_generators(notify=False)
+    module_name = hotload_manager.generator_modules["TinyGenerator"]
+    source_hash = hotload_manager.module_hashes[module_name]
+    source = hotload_manager.module_sources[module_name]
+
+    # a broken save the server kept the previous version over, then a new pool process
+    with open(tree / "TinyGenerator.py", "a") as f:
+        f.write("\ndef broken(:\n")
+    restart(monkeypatch)
+    hotload_manager.initialize_generators(notify=False, lazy=True)
+    assert "TinyGenerator" not in hotload_manager.generator_modules
+
+    worker_pool._sync_module(module_name, source_hash, source)
+    assert hotload_manager.module_hashes[module_name] == source_hash
+    assert hotload_manager.get_generator("TinyGenerator").generate(size=2) is None
+
+    # a source that isn't the version the task was resolved against is never run
+    with pytest.raises(RuntimeError, match="changed while the generation was submitted"):
+        worker_pool._sync_module(module_name, "another hash", source + b"\n# changed\n")
+    assert hotload_manager.module_hashes[module_name] == source_hash
@@ -0,0 +1,105 @@
+import pytest
+
+from schematicGenerator.base_generator import build_input_plan, validate_arguments
+from schematicGenerator.inputs import (
+    ArrayInput, BaseInput, BoolInput, DictInput, InputError, IntInput, SetInput, StringInput, format_path,
+)
+
+POINT = DictInput({"x": IntInput(), "z": IntInput(), "y": IntInput(default=0)})
+
+
+def error_of(input_obj, value):
+    with pytest.raises(InputError) as e:
+        input_obj.validate(value)
+    return e.value
+
+
+def test_format_path():
+    assert format_path(()) == ""
+    assert format_path(("points", 12, "x")) == "points[12].x"
+    assert format_path((0, "a", 1)) == "[0].a[1]"
+
+
+def test_nested_errors_carry_their_path():
+    shapes = DictInput({"points": ArrayInput(POINT), "closed": BoolInput(default=False)})
+    value = {"points": [{"x": 1, "z": 2}, {"x": 1, "z": "2"}]}
+    error = error_of(shapes, value)
+    assert error.path == ("points", 1, "z")
+    assert str(error).startswith("points[1].z: Expected an integer")
+
+
+def test_valid_nested_values_get_their_defaults():
+    points = ArrayInput(POINT)
+    assert points.validate([{"x": 1, "z": 2}]) == [{"x": 1, "z": 2, "y": 0}]
+    assert error_of(POINT, {"x": 1}).reason == "Missing required key: z"
+
+
+def test_array_lengths_and_default_padding():
+    padded = ArrayInput(IntInput(), min_length=3, max_length=4, default=[7, 8, 9])
+    values = [1]
+    assert padded.validate(values) == [1, 8, 9]
+    assert values == [1]
+    assert error_of(padded, [1, 2, 3, 4, 5]).reason == "List is too long. Maximum length is 4"
+    strict = ArrayInput(IntInput(), min_length=2)
+    assert error_of(strict, [1]).reason == "List is too short. Minimum length is 2"
+    assert error_of(strict, "1, 2").reason == "Expected a list, got str"
+
+
+def test_array_of_arrays_errors():
+    grid = ArrayInput(ArrayInput(IntInput(max_value=9)))
+    assert grid.validate([[1, 2], [3]]) == [[1, 2], [3]]
+    assert error_of(grid, [[1, 2], [3, 10]]).path == (1, 1)
+
+
+def test_array_failure_that_doesnt_happen_again():
+    class Flaky(BaseInput):
+        def __init__(self):
+            super().__init__()
+            self.calls = 0
+
+        def validate(self, value):
+            self.calls += 1
+            if self.calls == 2:
+                raise ValueError("transient")
+            return value
+
+    error = error_of(ArrayInput(Flaky()), [1, 2, 3])
+    assert error.reason == "transient"
+    assert error.path == ()
+
+
+def test_inputs_overriding_validate_work_inside_containers():
+    class Even(BaseInput):
+        def validate(self, value):
+            if value % 2:
+                raise InputError("Expected an even number")
+            return value
+
+    assert ArrayInput(Even()).validate([2, 4]) == [2, 4]
+    assert error_of(DictInput({"n": Even()}), {"n": 3}).path == ("n",)
+
+
+def test_allowed_values():
+    assert StringInput(allowed_values=["a", "b"]).validate("a") == "a"
+    assert "not allowed" in error_of(StringInput(allowed_values=["a", "b"]), "c").reason
+    assert error_of(StringInput(max_length=2), "abc").reason.startswith("String is too long")
+    unhashable = SetInput(allowed_values=[[1], [2]])
+    assert unhashable.validate([1]) == [1]
+    assert "not allowed" in error_of(unhashable, [3]).reason
+    assert "not allowed" in error_of(SetInput(allowed_values=["a"]), ["a"]).reason
+
+
+def test_generate_arguments_errors():
+    def generate(cls, radius: int = IntInput(min_value=1, max_value=128), filled: bool = BoolInput(default=True)):
+        pass
+
+    plan = build_input_plan(generate)
+    assert validate_arguments(plan, {"radius": 3}) == {"radius": 3, "filled": True}
+    with pytest.raises(InputError) as e:
+        validate_arguments(plan, {"radius": 500})
+    assert str(e.value) == "radius: Value should be <= 128"
+    with pytest.raises(TypeError, match="Missing required argument: radius"):
+        validate_arguments(plan, {})
+    with pytest.raises(InputError) as e:
+        validate_arguments(plan, {"radius": 3, "radiuss": 4})
+    assert str(e.value) == "radiuss: Unknown input"
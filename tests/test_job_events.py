@@ -0,0 +1,76 @@
+import asyncio
+import json
+
+from server import jobs, websocket_routes
+from server.websocket_routes import Hub, follow_job
+
+
+def make_job(job_id="abc", status=jobs.QUEUED):
+    return {
+        "id": job_id, "generator": "CircleGenerator", "args": {"radius": 3, "block": "minecraft:stone"},
+        "status": status, "progress": 0.0, "message": None, "error": None,
+        "created": 0.0, "started": None, "finished": None,
+    }
+
+
+def test_job_events_only_reach_their_followers():
+    hub = Hub()
+    follower, other = hub.subscribe(), hub.subscribe()
+    follower.jobs.add("abc")
+    hub.publish_job("abc", "job message")
+    hub.publish_job("def", "someone else's job")
+    hub.publish("generators changed")
+    assert list(follower.messages) == ["job message", "generators changed"]
+    assert list(other.messages) == ["generators changed"]
+
+
+def test_following_a_job_sends_its_current_state(monkeypatch):
+    monkeypatch.setattr(websocket_routes, "job_state", lambda job_id: "state" if job_id == "abc" else None)
+    subscription = Hub().subscribe()
+    follow_job(subscription, "abc")
+    follow_job(subscription, "unknown")
+    assert subscription.jobs == {"abc", "unknown"}
+    assert list(subscription.messages) == ["state"]
+
+
+def test_job_events_leave_args_out():
+    event = json.loads(jobs.job_event(make_job(status=jobs.DONE)))
+    assert event["type"] == "job" and event["id"] == "abc"
+    assert "args" not in event
+    assert event["result"] == "/jobs/abc/result"
+
+
+def test_publish_job_goes_to_the_job_subscribers(monkeypatch):
+    sent = []
+    monkeypatch.setattr(jobs, "send_job", lambda job_id, message: sent.append((job_id, json.loads(message))))
+    jobs.publish_job(make_job())
+    jobs.publish_job(None)
+    assert [(job_id, event["status"]) for job_id, event in sent] == [("abc", jobs.QUEUED)]
+
+
+def test_clients_follow_and_unfollow_jobs(monkeypatch):
+    monkeypatch.setattr(websocket_routes, "job_state", None)
+
+    class Socket:
+        def __init__(self, messages):
+            self.messages = list(messages)
+
+        async def recv(self):
+            if not self.messages:
+                raise ConnectionError("closed")
+            return self.messages.pop(0)
+
+    subscription = Hub().subscribe()
+    ws = Socket([
+        json.dumps({"subscribe": "abc"}),
+        json.dumps({"subscribe": "def"}),
+        "not json",
+        json.dumps(["abc"]),
+        json.dumps({"subscribe": 3}),
+        json.dumps({"unsubscribe": "def"}),
+    ])
+    try:
+        asyncio.run(websocket_routes.receive_subscriptions(ws, subscription))
+    except ConnectionError:
+        pass
+    assert subscription.jobs == {"abc"}
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from server import settings, worker_pool
+from server.process_pool import ProcessDied, ProcessPool, QueueTimeout
+from server.worker_pool import GenerationTimeout, PoolSaturated, WorkerCrashed
+from tests import pool_tasks
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def importable_tasks(monkeypatch):
+    # the pool processes unpickle the tasks by importing tests.pool_tasks
+    monkeypatch.setenv("PYTHONPATH", os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+
+
+def with_pool(size, test, **kwargs):
+    async def run():
+        pool = ProcessPool(size, **kwargs)
+        await pool.start()
+        try:
+            return await test(pool)
+        finally:
+            await pool.close()
+
+    return asyncio.run(run())
+
+
+def test_results_errors_and_messages():
+    async def test(pool):
+        assert await pool.run(pool_tasks.add, (2, 3), kill_after=10) == 5
+        with pytest.raises(KeyError, match="nope"):
+            await pool.run(pool_tasks.fail, ("nope",), kill_after=10)
+        messages = []
+        assert await pool.run(pool_tasks.report, (3,), kill_after=10, on_message=messages.append) == 3
+        assert messages == [0, 1, 2]
+
+    with_pool(1, test)
+
+
+def test_only_the_stuck_task_is_killed():
+    async def test(pool):
+        started = time.monotonic()
+        stuck = asyncio.ensure_future(pool.run(pool_tasks.sleep, (30,), kill_after=1))
+        innocent = [asyncio.ensure_future(pool.run(pool_tasks.sleep, (0.5,), kill_after=10)) for _ in range(3)]
+        assert await asyncio.gather(*innocent) == [0.5] * 3
+        with pytest.raises(ProcessDied) as e:
+            await stuck
+        assert 1 <= e.value.elapsed < 5
+        assert time.monotonic() - started < 10
+        # the killed process was replaced
+        assert await asyncio.gather(*(pool.run(pool_tasks.add, (i, 1), kill_after=10) for i in range(4))) == [1, 2, 3, 4]
+
+    with_pool(2, test)
+
+
+def test_a_crash_fails_only_its_task():
+    async def test(pool):
+        crashing = asyncio.ensure_future(pool.run(pool_tasks.crash, (), kill_after=10))
+        running = asyncio.ensure_future(pool.run(pool_tasks.sleep, (0.5,), kill_after=10))
+        with pytest.raises(ProcessDied) as e:
+            await crashing
+        assert e.value.elapsed < 10
+        assert await running == 0.5
+        assert await pool.run(pool_tasks.add, (1, 1), kill_after=10) == 2
+
+    with_pool(2, test)
+
+
+def test_time_limit_starts_when_the_task_is_picked_up():
+    async def test(pool):
+        first = asyncio.ensure_future(pool.run(pool_tasks.sleep, (1,), kill_after=10))
+        await asyncio.sleep(0.1)
+        # waits about 1 second for the process, then runs 0.8 of its 1.5 seconds
+        assert await pool.run(pool_tasks.sleep, (0.8,), kill_after=1.5) == 0.8
+        await first
+
+    with_pool(1, test)
+
+
+def test_queue_timeout():
+    async def test(pool):
+        busy = asyncio.ensure_future(pool.run(pool_tasks.sleep, (1,), kill_after=10))
+        await asyncio.sleep(0.1)
+        with pytest.raises(QueueTimeout):
+            await pool.run(pool_tasks.add, (1, 1), kill_after=10, queue_timeout=0.2)
+        assert await busy == 1
+
+    with_pool(1, test)
+
+
+def test_cancelled_tasks_keep_their_process_until_done():
+    async def test(pool):
+        done = []
+        task = asyncio.ensure_future(pool.run(pool_tasks.sleep, (0.5,), kill_after=10, on_done=lambda: done.append(1)))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        await asyncio.sleep(0)
+        assert done == []
+        first_pid = await pool.run(pool_tasks.pid, (), kill_after=10)
+        assert done == [1]
+        # the process wasn't killed for the cancellation
+        assert await pool.run(pool_tasks.pid, (), kill_after=10) == first_pid
+
+    with_pool(1, test)
+
+
+def test_processes_are_recycled_after_max_tasks():
+    async def test(pool):
+        pids = [await pool.run(pool_tasks.pid, (), kill_after=10) for _ in range(4)]
+        assert pids[0] == pids[1] and pids[2] == pids[3] and pids[1] != pids[2]
+
+    with_pool(1, test, max_tasks_per_child=2)
+
+
+def test_a_task_whose_process_died_idle_runs_elsewhere():
+    async def test(pool):
+        idle = pool._idle._queue[0]
+        idle.kill()
+        await idle.process.wait()
+        assert await pool.run(pool_tasks.add, (1, 2), kill_after=10) == 3
+
+    with_pool(1, test)
+
+
+class Outcomes:
+    def __init__(self):
+        self.counts = []
+
+    def inc(self, labels):
+        self.counts.append(labels[1])
+
+
+@pytest.fixture
+def server_pool(monkeypatch):
+    monkeypatch.setattr(worker_pool, "KILL_GRACE", 0.25)
+    monkeypatch.setattr(worker_pool, "pending", 0)
+    monkeypatch.setattr(settings, "GENERATE_QUEUE_SIZE", 2)
+    monkeypatch.setattr(settings, "GENERATE_QUEUE_TIMEOUT", 0.3)
+
+    def run(test):
+        async def with_server_pool(pool):
+            worker_pool.pool = pool
+            try:
+                return await test()
+            finally:
+                worker_pool.pool = None
+
+        return with_pool(1, with_server_pool)
+
+    return run
+
+
+def test_submit_outcomes(server_pool):
+    outcomes = Outcomes()
+
+    async def test():
+        assert await worker_pool._submit("Test", (pool_tasks.add, 1, 2), 5, outcomes) == 3
+        with pytest.raises(GenerationTimeout):
+            await worker_pool._submit("Test", (pool_tasks.sleep, 30), 0.5, outcomes)
+        with pytest.raises(WorkerCrashed):
+            await worker_pool._submit("Test", (pool_tasks.crash,), 5, outcomes)
+        assert worker_pool.pending == 0
+
+    server_pool(test)
+    assert outcomes.counts == ["ok", "timeout", "crashed"]
+
+
+def test_submit_queue_limits(server_pool):
+    outcomes = Outcomes()
+
+    async def test():
+        busy = asyncio.ensure_future(worker_pool._submit("Test", (pool_tasks.sleep, 1), 5, outcomes))
+        await asyncio.sleep(0.1)
+        with pytest.raises(QueueTimeout):
+            await worker_pool._submit("Test", (pool_tasks.add, 1, 1), 5, outcomes)
+        waiting = asyncio.ensure_future(worker_pool._submit("Test", (pool_tasks.add, 1, 1), 5, outcomes))
+        await asyncio.sleep(0)
+        with pytest.raises(PoolSaturated):
+            await worker_pool._submit("Test", (pool_tasks.add, 1, 1), 5, outcomes)
+        busy.cancel()
+        await asyncio.sleep(0)
+        # the cancelled generation still holds its slot while its process runs it
+        assert worker_pool.pending == 2
+        with pytest.raises(QueueTimeout):
+            await waiting
+        await asyncio.sleep(1)
+        assert worker_pool.pending == 0
+
+    server_pool(test)
+    assert outcomes.counts.count("queue_timeout") == 2
+    assert "rejected" in outcomes.counts
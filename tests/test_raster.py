@@ -0,0 +1,114 @@
+"""The shape generators against the per cell loops they replaced, block for block."""
+import math
+
+import numpy as np
+import pytest
+
+from schematicGenerator.generators.CircleGenerator import CircleGenerator
+from schematicGenerator.generators.PolygonGenerator import PolygonGenerator
+from schematicGenerator.generators.SphereGenerator import SphereGenerator
+from schematicGenerator.generators.SquareGenerator import SquareGenerator
+from schematicGenerator.schematic import SlabStream
+
+BLOCK = "minecraft:white_concrete"
+RADII = list(range(1, 21)) + [31, 64]
+
+
+def placed(schem):
+    """Positions of the non air blocks of a generated schematic."""
+    if isinstance(schem, SlabStream):
+        blocks = np.concatenate(list(schem.palette_slabs()), axis=0)
+    else:
+        blocks = schem.blocks
+    y, z, x = np.nonzero(blocks)
+    ox, oy, oz = schem.origin
+    return set(zip((x + ox).tolist(), (y + oy).tolist(), (z + oz).tolist()))
+
+
+def loop_circle(radius, filled):
+    cells = set()
+    for x in range(-radius, radius + 1):
+        for z in range(-radius, radius + 1):
+            distance = math.sqrt(x**2 + z**2)
+            if filled:
+                if distance <= radius:
+                    cells.add((x + radius, 0, z + radius))
+            else:
+                if radius - 1 <= distance <= radius + 1:
+                    cells.add((x + radius, 0, z + radius))
+    return cells
+
+
+def loop_square(side_length, filled):
+    cells = set()
+    for x in range(-side_length, side_length + 1):
+        for z in range(-side_length, side_length + 1):
+            if filled:
+                cells.add((x + side_length, 0, z + side_length))
+            else:
+                if side_length - 1 <= x <= side_length + 1 and side_length - 1 <= z <= side_length + 1:
+                    cells.add((x + side_length, 0, z + side_length))
+    return cells
+
+
+def loop_polygon(sides, radius, filled):
+    cells = set()
+    angle_step = 2 * math.pi / sides
+    for x in range(-radius, radius + 1):
+        for z in range(-radius, radius + 1):
+            distance = math.sqrt(x**2 + z**2)
+            angle = math.atan2(z, x)
+            nearest_vertex = round(angle / angle_step)
+            angle_to_vertex = nearest_vertex * angle_step
+            distance_to_edge = distance * math.cos(angle - angle_to_vertex)
+            if filled:
+                if distance_to_edge <= radius:
+                    cells.add((x + radius, 0, z + radius))
+            else:
+                if radius - 1 <= distance_to_edge <= radius + 1:
+                    cells.add((x + radius, 0, z + radius))
+    return cells
+
+
+def loop_sphere(radius, filled):
+    cells = set()
+    for x in range(-radius, radius + 1):
+        for y in range(-radius, radius + 1):
+            for z in range(-radius, radius + 1):
+                distance = math.sqrt(x**2 + y**2 + z**2)
+                if filled:
+                    if distance <= radius:
+                        cells.add((x, y, z))
+                else:
+                    if radius - 1 <= distance <= radius + 1:
+                        cells.add((x, y, z))
+    return cells
+
+
+@pytest.mark.parametrize("filled", [True, False])
+@pytest.mark.parametrize("radius", RADII + [128])
+def test_circle(radius, filled):
+    schem = CircleGenerator.generate(radius=radius, filled=filled, block=BLOCK)
+    assert placed(schem) == loop_circle(radius, filled)
+
+
+@pytest.mark.parametrize("filled", [True, False])
+@pytest.mark.parametrize("side_length", RADII + [128])
+def test_square(side_length, filled):
+    schem = SquareGenerator.generate(side_length=side_length, filled=filled, block=BLOCK)
+    assert placed(schem) == loop_square(side_length, filled)
+
+
+@pytest.mark.parametrize("filled", [True, False])
+@pytest.mark.parametrize("radius", RADII)
+@pytest.mark.parametrize("sides", range(3, 13))
+def test_polygon(sides, radius, filled):
+    schem = PolygonGenerator.generate(sides=sides, radius=radius, filled=filled, block=BLOCK)
+    assert placed(schem) == loop_polygon(sides, radius, filled)
+
+
+@pytest.mark.parametrize("filled", [True, False])
+@pytest.mark.parametrize("radius", range(1, 13))
+def test_sphere(radius, filled):
+    schem = SphereGenerator.generate(radius=radius, filled=filled, block=BLOCK)
+    assert placed(schem) == loop_sphere(radius, filled)
@@ -0,0 +1,106 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from schematicGenerator.generators.CircleGenerator import CircleGenerator
+from server import rate_limit, routes, settings
+from server.rate_limit import BucketStore, RateLimited
+from server.result_cache import cache_key, result_cache, volume_cache
+
+
+@pytest.fixture(autouse=True)
+def limits(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_BLOCKS", 100)
+    monkeypatch.setattr(settings, "RATE_LIMIT_BURST", 1000)
+    monkeypatch.setattr(settings, "RATE_LIMIT_MAX_WAIT", 2.0)
+    monkeypatch.setattr(settings, "RATE_LIMIT_API_KEYS", {"secret"})
+    monkeypatch.setattr(rate_limit, "store", BucketStore({}, threading.Lock()))
+    result_cache.clear()
+    volume_cache.clear()
+
+
+def make_request(address="10.0.0.1", headers=None):
+    return SimpleNamespace(headers=headers or {}, remote_addr=address, ip=address)
+
+
+def test_bucket_starts_full_and_refills():
+    store = BucketStore({}, threading.Lock())
+    assert store.take("a", 1000, now=0.0) == 0.0
+    # empty now, 100 blocks come back every second
+    assert store.take("a", 100, now=0.0) == pytest.approx(1.0)
+    assert store.take("a", 100, now=3.0) == 0.0
+
+
+def test_rejected_requests_take_nothing():
+    store = BucketStore({}, threading.Lock())
+    store.take("a", 1000, now=0.0)
+    assert store.take("a", 500, now=0.0) == pytest.approx(5.0)
+    assert store.take("a", 100, now=1.0) == 0.0
+
+
+def test_prune_forgets_full_buckets():
+    store = BucketStore({}, threading.Lock())
+    store.take("a", 1000, now=0.0)
+    store.take("b", 10, now=0.0)
+    store.prune(now=1.0)
+    assert set(store.buckets) == {"a"}
+    store.prune(now=10.0)
+    assert not store.buckets
+
+
+def test_client_key():
+    assert rate_limit.client_key(make_request()) == "address:10.0.0.1"
+    assert rate_limit.client_key(make_request(headers={"X-Api-Key": "secret"})) == "key:secret"
+    assert rate_limit.client_key(make_request(headers={"X-Api-Key": "guess"})) == "address:10.0.0.1"
+
+
+def test_admit_waits_then_rejects():
+    request = make_request()
+    asyncio.run(rate_limit.admit(request, "CircleGenerator", 1000))
+    with pytest.raises(RateLimited) as e:
+        asyncio.run(rate_limit.admit(request, "CircleGenerator", 1000))
+    assert e.value.retry_after == 10
+    # other clients have their own bucket
+    asyncio.run(rate_limit.admit(make_request("10.0.0.2"), "CircleGenerator", 1000))
+
+
+def test_admit_is_off_without_a_rate(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_BLOCKS", 0)
+    for _ in range(5):
+        asyncio.run(rate_limit.admit(make_request(), "CircleGenerator", 10 ** 9))
+
+
+def test_generation_cost_has_a_floor(monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_MIN_COST", 50)
+    args = CircleGenerator.validate_inputs(radius=1)
+    assert rate_limit.generation_cost(CircleGenerator, args) >= 50
+
+
+def test_only_generations_that_run_are_charged(monkeypatch):
+    generations = []
+
+    async def run_generation(generator_class, args, encoding=None):
+        generations.append(args)
+        return b"schematic"
+
+    monkeypatch.setattr(routes, "run_generation", run_generation)
+    request = make_request()
+    args = CircleGenerator.validate_inputs(radius=30)
+    key = cache_key(CircleGenerator, args)
+    cost = rate_limit.generation_cost(CircleGenerator, args)
+
+    async def admit():
+        await rate_limit.admit(request, "CircleGenerator", cost)
+
+    async def generate_twice():
+        first = await routes.generate_cached(CircleGenerator, args, key, admit=admit)
+        second = await routes.generate_cached(CircleGenerator, args, key, admit=admit)
+        return first, second
+
+    assert asyncio.run(generate_twice()) == (b"schematic", b"schematic")
+    assert len(generations) == 1
+    tokens, _ = rate_limit.store.buckets[rate_limit.client_key(request)]
+    assert tokens == pytest.approx(settings.RATE_LIMIT_BURST - min(cost, settings.RATE_LIMIT_BURST), abs=1)
+    assert routes.is_cached(key, routes.ENCODERS["schem"])
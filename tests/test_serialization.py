@@ -0,0 +1,47 @@
+import gzip
+import io
+
+import mcschematic
+import nbtlib
+import numpy as np
+
+from schematicGenerator.schematic import GENERATED_BY, ArraySchematic
+from schematicGenerator.serialization import DEFAULT_VERSION, block_count, schematic_to_nbt, serialize_schematic
+
+
+def saved(schem, tmp_path):
+    schem.save(str(tmp_path), "saved", DEFAULT_VERSION)
+    return nbtlib.load(tmp_path / "saved.schem")
+
+
+def make_schematic(blocks):
+    schem = mcschematic.MCSchematic()
+    for position, block in blocks:
+        schem.setBlock(position, block)
+    return schem
+
+
+def test_same_nbt_as_mcschematic_save(tmp_path):
+    schem = make_schematic([
+        ((-2, 0, 3), "minecraft:stone"),
+        ((1, 4, 0), "minecraft:oak_stairs[facing=east]"),
+        ((0, 1, 1), 'minecraft:chest[facing=north]{Items:[{Slot:0b,id:"minecraft:apple",Count:1b}]}'),
+        ((0, 2, 1), "minecraft:barrel{}"),
+    ])
+    assert schematic_to_nbt(schem) == saved(schem, tmp_path)
+    assert block_count(schem) == 4
+
+
+def test_same_nbt_as_mcschematic_save_with_multibyte_palette_ids(tmp_path):
+    # more than 128 blocks in the palette, ids take two varint bytes
+    schem = make_schematic([((i % 20, i // 20, 0), f"minecraft:wool_{i}") for i in range(300)])
+    assert schematic_to_nbt(schem) == saved(schem, tmp_path)
+
+
+def test_array_schematics_write_the_mcschematic_metadata():
+    volume = np.zeros((2, 2, 2), dtype=bool)
+    volume[0, 0, 0] = volume[1, 1, 1] = True
+    schem = ArraySchematic.from_volume(volume, ["minecraft:stone"], (3, 4, 5))
+    metadata = nbtlib.File.parse(io.BytesIO(gzip.decompress(serialize_schematic(schem))))["Metadata"]
+    assert metadata["MCSchematicMetadata"]["Generated"] == GENERATED_BY
+    assert (metadata["WEOffsetX"], metadata["WEOffsetY"], metadata["WEOffsetZ"]) == (3, 4, 5)